@@ -1,83 +1,234 @@
+import hashlib
 import json
 import os
+import sys
 import argparse
 
-def write_files_from_json(json_data_str, base_path=".", dry_run=False):
+from nocode_context import CHUNK_SIZE
+from nocode_jsonstream import StreamError, iter_array_items, read_chunks
+from nocode_metrics import add_metrics_arguments, count_stats, iter_span, start_metrics, timed
+from nocode_transaction import atomic_write, fsync_paths
+from nocode_validate import iter_checks
+
+
+def encode_content(content):
+    """
+    The bytes a text-mode write of 'content' would produce on this platform.
+    Content that already uses CRLF line endings is written as-is.
+    """
+    if os.linesep != "\n" and "\r\n" not in content:
+        content = content.replace("\n", os.linesep)
+    return content.encode("utf-8")
+
+
+@timed("compare")
+def file_matches(path, data):
+    """
+    Returns True if the file at 'path' already holds exactly 'data'.
+    Sizes are compared first; the SHA-256 of the file is only computed
+    (streamed in chunks) when they are equal.
+    """
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except OSError:
+        return False
+    return digest.digest() == hashlib.sha256(data).digest()
+
+
+def new_write_stats():
+    """Returns a fresh counter dict for write_files."""
+    return {"processed": 0, "skipped": 0, "changed": 0, "unchanged": 0, "new": 0, "bytes_written": 0, "invalid": 0, "errors": 0}
+
+
+def _is_file_entry(file_info):
+    return (isinstance(file_info, dict) and isinstance(file_info.get('filePath'), str)
+            and isinstance(file_info.get('content'), str))
+
+
+def write_files(entries, base_path=".", dry_run=False, fsync=False, stats=None, validate=True):
     """
-    Parses a JSON string containing file data and writes the files to disk.
+    Writes {'filePath': ..., 'content': ...} entries to disk as they arrive.
+
+    Files whose content is identical to what is on disk are not rewritten,
+    so their mtimes stay put and file watchers (nodemon, Vite) do not rebuild.
+    Real writes go through a temp file and os.replace, so a file is never
+    left half-written. A malformed entry or unsafe path is reported and skipped.
+
+    Unless 'validate' is False, every .py, .json, .js and .jsx file must pass
+    the syntax check of nocode_validate before it is written; a file that
+    does not parse is reported and skipped. The checks run alongside the
+    parse of the input, on worker processes once there is enough text.
 
     Args:
-        json_data_str (str): The JSON string copied from the LLM output.
-                             It should be a list of {'filePath': '...', 'content': '...'} objects.
+        entries (iterable): The entries to write; may be a lazy iterator.
+        base_path (str): The root directory of the project where files should be written.
+        dry_run (bool): If True, prints what would be done without writing files.
+        fsync (bool): If True, flushes all written files and their directories to
+                      disk in one batch at the end.
+        stats (dict, optional): Counters from new_write_stats(), updated in place
+                                so a caller still sees them if 'entries' raises.
+        validate (bool): If False, writes files without the syntax check.
+
+    Returns:
+        dict: The updated stats.
+    """
+    stats = stats if stats is not None else new_write_stats()
+    absolute_base = os.path.abspath(base_path)
+    written = []
+
+    def check_item(file_info):
+        if not _is_file_entry(file_info):
+            return None
+        target_path = os.path.abspath(os.path.join(absolute_base, file_info['filePath']))
+        # The previous version (read only if the new one fails) must be inside the base path.
+        original_path = target_path if target_path.startswith(absolute_base) else None
+        return file_info['filePath'], file_info['content'], None, original_path
+
+    # Time spent producing the entries is the (streaming) parse of the input.
+    entries = iter_span("parse_json", entries)
+    checked = iter_checks(entries, to_item=check_item) if validate else ((entry, None) for entry in entries)
+    for number, (file_info, syntax_error) in enumerate(checked, 1):
+        # Basic validation of each entry as it arrives
+        if not _is_file_entry(file_info):
+            print(f"Error: Entry #{number} does not have the expected structure ('filePath', 'content'). Skipping.")
+            stats["skipped"] += 1
+            continue
+
+        relative_path = file_info['filePath']
+        content = file_info['content']
+
+        # IMPORTANT: Sanitize the relative path to prevent directory traversal issues
+        # os.path.normpath cleans up path separators (e.g., /// -> /)
+        # os.path.abspath ensures we have a full path rooted somewhere
+        # We then check if the path starts with the intended base path
+        target_path = os.path.abspath(os.path.join(absolute_base, relative_path))
+
+        if not target_path.startswith(absolute_base):
+             print(f"Error: Potential directory traversal attempt detected for path: {relative_path}. Skipping.")
+             stats["skipped"] += 1
+             continue
+
+        if syntax_error:
+            print(f"Error: {relative_path} does not parse ({syntax_error}). Skipping.")
+            stats["invalid"] += 1
+            stats["skipped"] += 1
+            continue
+
+        # Get the directory part of the target path
+        target_dir = os.path.dirname(target_path)
+        stats["processed"] += 1
+
+        data = encode_content(content)
+        exists = os.path.isfile(target_path)
+        if exists and file_matches(target_path, data):
+            stats["unchanged"] += 1
+            print(f"Unchanged, skipping: {target_path}")
+            continue
+        status = "changed" if exists else "new"
+        stats[status] += 1
+
+        if dry_run:
+            print(f"DRY RUN: Would ensure directory exists: {target_dir}")
+            print(f"DRY RUN: Would write {len(data)} bytes to: {target_path} ({status})")
+        else:
+            try:
+                # Create directories if they don't exist (like mkdir -p)
+                if not os.path.exists(target_dir):
+                    print(f"Creating directory: {target_dir}")
+                    os.makedirs(target_dir, exist_ok=True)
+
+                # Write the file content (temp file + os.replace, keeping the mode of an existing file)
+                print(f"Writing file: {target_path} ({status})")
+                mode = os.stat(target_path).st_mode if exists else None
+                atomic_write(target_path, data, mode)
+                stats["bytes_written"] += len(data)
+                written.append(target_path)
+
+            except OSError as e:
+                print(f"Error writing file {target_path}: {e}")
+                stats["errors"] += 1
+            except Exception as e:
+                 print(f"An unexpected error occurred while processing {target_path}: {e}")
+                 stats["errors"] += 1
+
+    if fsync and written:
+        print(f"Syncing {len(written)} file(s) to disk...")
+        fsync_paths(written)
+    return stats
+
+
+def print_write_summary(stats, dry_run=False):
+    """Prints the counters collected by write_files."""
+    print(f"--- Processing Complete: {stats['processed']} file(s) processed, {stats['skipped']} skipped ---")
+    print(f"Changed: {stats['changed']}, unchanged: {stats['unchanged']}, new: {stats['new']}, "
+          f"bytes written: {stats['bytes_written']}")
+    if stats["invalid"]:
+        print(f"Rejected by the syntax check: {stats['invalid']} file(s) (see errors above).")
+    if stats["errors"]:
+        print(f"Failed to write: {stats['errors']} file(s) (see errors above).")
+    if dry_run:
+        print("--- DRY RUN MODE: No files were written. ---")
+
+
+def write_files_from_json(json_data, base_path=".", dry_run=False, fsync=False, validate=True):
+    """
+    Parses the JSON file list from the LLM output and writes the files to disk.
+
+    The input is parsed incrementally: each file is written as soon as its
+    object is complete, so memory stays bounded by the largest single file
+    and the first files land on disk while the rest is still being read. If
+    the JSON breaks off midway, the files before the break have already been
+    written. See write_files for how each file is written.
+
+    Args:
+        json_data (str or iterable): The JSON copied from the LLM output, as one
+                             string or as an iterable of text chunks (see
+                             nocode_jsonstream.read_chunks). It should be a list
+                             of {'filePath': '...', 'content': '...'} objects,
+                             optionally wrapped in a ```json code block.
         base_path (str): The root directory of the project where files should be written.
                          Defaults to the current directory (".").
         dry_run (bool): If True, prints what would be done without writing files.
                         Defaults to False.
+        fsync (bool): If True, flushes all written files and their directories to
+                      disk in one batch at the end. Defaults to False.
+        validate (bool): If False, skips the syntax check of .py, .json, .js and
+                         .jsx files. Defaults to True.
+
+    Returns:
+        bool: True if the whole input was parsed and every file passed the
+              syntax check and was written (or was already up to date).
     """
+    chunks = [json_data] if isinstance(json_data, str) else json_data
+    stats = new_write_stats()
+
+    if dry_run:
+        print("--- DRY RUN MODE: No files will be written. ---")
+
     try:
-        # Load the JSON data from the string
-        files_data = json.loads(json_data_str)
-
-        # Basic validation of the loaded data structure
-        if not isinstance(files_data, list):
-            print("Error: JSON data is not a list.")
-            return
-        if not all(isinstance(item, dict) and 'filePath' in item and 'content' in item for item in files_data):
-            print("Error: JSON list does not contain the expected dictionary structure ('filePath', 'content').")
-            return
-
-        print(f"Processing {len(files_data)} file(s)...")
-        if dry_run:
-            print("--- DRY RUN MODE: No files will be written. ---")
-
-        for file_info in files_data:
-            relative_path = file_info['filePath']
-            content = file_info['content']
-
-            # IMPORTANT: Sanitize the relative path to prevent directory traversal issues
-            # os.path.normpath cleans up path separators (e.g., /// -> /)
-            # os.path.abspath ensures we have a full path rooted somewhere
-            # We then check if the path starts with the intended base path
-            absolute_base = os.path.abspath(base_path)
-            target_path = os.path.abspath(os.path.join(absolute_base, relative_path))
-            
-            if not target_path.startswith(absolute_base):
-                 print(f"Error: Potential directory traversal attempt detected for path: {relative_path}. Skipping.")
-                 continue
-
-            # Get the directory part of the target path
-            target_dir = os.path.dirname(target_path)
-
-            if dry_run:
-                print(f"DRY RUN: Would ensure directory exists: {target_dir}")
-                print(f"DRY RUN: Would write {len(content)} bytes to: {target_path}")
-            else:
-                try:
-                    # Create directories if they don't exist (like mkdir -p)
-                    if not os.path.exists(target_dir):
-                        print(f"Creating directory: {target_dir}")
-                        os.makedirs(target_dir, exist_ok=True)
-                    
-                    # Write the file content
-                    print(f"Writing file: {target_path}")
-                    with open(target_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-
-                except OSError as e:
-                    print(f"Error writing file {target_path}: {e}")
-                except Exception as e:
-                     print(f"An unexpected error occurred while processing {target_path}: {e}")
-
-
-        print("--- Processing Complete ---")
-        if dry_run:
-            print("--- DRY RUN MODE: No files were written. ---")
+        write_files(iter_array_items(chunks), base_path, dry_run, fsync, stats, validate)
+        print_write_summary(stats, dry_run)
+        return stats["invalid"] == 0 and stats["errors"] == 0
 
+    except StreamError as e:
+        print(f"Error: {e}.")
+        if stats["processed"]:
+            print(f"Note: {stats['processed']} file(s) before the error were already processed.")
     except json.JSONDecodeError as e:
         print(f"Error: Invalid JSON received. Please check the LLM output.")
         print(f"Details: {e}")
+        if stats["processed"]:
+            print(f"Note: {stats['processed']} file(s) before the error were already processed.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+    finally:
+        count_stats("write", stats)
+    return False
 
 # --- How to Use ---
 if __name__ == "__main__":
@@ -85,15 +236,19 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file", help="Path to a file containing the JSON output from the LLM.")
     parser.add_argument("-b", "--basepath", default=".", help="Project base path where files should be written (default: current directory).")
     parser.add_argument("--dry-run", action="store_true", help="Show what would happen without actually writing files.")
+    parser.add_argument("--fsync", action="store_true", help="Flush all written files to disk in one batch at the end.")
+    parser.add_argument("--no-validate", action="store_true", help="Write .py/.json/.js/.jsx files even if they do not parse.")
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    start_metrics(args, "nocode_apply_llm_changes")
 
-    json_input = None
     if args.file:
         try:
             with open(args.file, 'r', encoding='utf-8') as f:
-                json_input = f.read()
-            print(f"Reading JSON from file: {args.file}")
+                print(f"Reading JSON from file: {args.file}")
+                succeeded = write_files_from_json(read_chunks(f), args.basepath, args.dry_run, args.fsync,
+                                                  not args.no_validate)
         except FileNotFoundError:
             print(f"Error: Input file not found: {args.file}")
             exit(1)
@@ -104,19 +259,11 @@ if __name__ == "__main__":
         print("No input file provided. Please paste the JSON output below.")
         print("End input with EOF (Ctrl+D on Linux/macOS, Ctrl+Z then Enter on Windows).")
         try:
-            json_input = "".join(line for line in __import__('sys').stdin) # Read all stdin
+            # Files are written while stdin is still being read.
+            succeeded = write_files_from_json(read_chunks(sys.stdin), args.basepath, args.dry_run, args.fsync,
+                                              not args.no_validate)
         except Exception as e:
             print(f"Error reading input from stdin: {e}")
             exit(1)
-
-
-    if json_input:
-        # Remove the surrounding Markdown code block if present
-        if json_input.strip().startswith("```json"):
-           json_input = json_input.strip()[7:] # Remove ```json
-        if json_input.strip().endswith("```"):
-            json_input = json_input.strip()[:-3] # Remove ```
-
-        write_files_from_json(json_input.strip(), args.basepath, args.dry_run)
-    else:
-        print("No JSON input received.")
\ No newline at end of file
+    if not succeeded:
+        exit(1)
@@ -1,54 +1,134 @@
 import os
 import argparse
-import patch  # from python-patch library
-import shutil # For backups
+from concurrent.futures import ThreadPoolExecutor
 
-def apply_diff(diff_text, base_path=".", dry_run=False, backup=False):
+from nocode_context import DEFAULT_WORKERS, ordered_map
+from nocode_metrics import add_metrics_arguments, count_stats, start_metrics, timed
+from nocode_transaction import FileTransaction, TransactionError, atomic_write
+from nocode_unidiff import ParseError, apply_file_patch, parse_unified_diff
+from nocode_validate import DEFAULT_VALIDATION_WORKERS, validate_files
+
+@timed("read")
+def read_target(target_path):
+    """Returns the text of a file to patch, or None if it does not exist. Line endings are kept as-is."""
+    if not os.path.exists(target_path):
+        return None
+    with open(target_path, 'r', encoding='utf-8', newline='') as f:
+        return f.read()
+
+def _patch_file(job):
+    """
+    Reads one target and applies its hunks in memory (runs on a worker thread).
+
+    Returns:
+        tuple: (original_text, new_text, hunk_results, error); error is the
+               exception raised while reading or patching, or None.
+    """
+    file_patch, target_path = job
+    try:
+        original_text = read_target(target_path)
+        new_text, hunk_results = apply_file_patch(original_text, file_patch)
+    except Exception as e:
+        return None, None, None, e
+    return original_text, new_text, hunk_results, None
+
+def apply_diff(diff_text, base_path=".", dry_run=False, backup=False, transaction=False,
+               validate=True, workers=DEFAULT_WORKERS):
     """
     Parses a unified diff string and applies it to files relative to a base path.
 
+    The diff is parsed once. Each file is read into memory once, all of its hunks
+    are applied to that buffer, and the result is written back once, only if
+    every hunk for the file applied. Results are reported per hunk. Files are
+    written through a temp file and os.replace, so none is ever half-written.
+
+    Files are read and patched on a pool of 'workers' threads; results are
+    reported in diff order. Before anything is written, every changed .py,
+    .json, .js and .jsx file goes through a syntax check (see nocode_validate):
+    a file that no longer parses is left unchanged and counts as failed.
+
+    In transaction mode every file is patched in memory first; only if all of
+    them succeed are they committed together, and a failure while committing
+    rolls every file back from its in-memory snapshot.
+
     Args:
         diff_text (str): The unified diff text copied from the LLM output.
         base_path (str): The root directory of the project where patches should be applied.
                          Defaults to the current directory (".").
-        dry_run (bool): If True, prints what would be done without applying the patch.
-        backup (bool): If True, creates a .bak file for each modified file before patching.
+        dry_run (bool): If True, applies the hunks in memory and reports the results
+                        without writing anything.
+        backup (bool): If True, writes a .bak file (from the in-memory original) for each
+                       modified file before patching.
+        transaction (bool): If True, applies all files or none of them.
+        validate (bool): If False, skips the syntax check of the patched files.
+        workers (int): Threads used to read and patch files (1 = serial).
+
+    Returns:
+        bool: False if the diff could not be parsed, any file failed (a hunk, the
+              syntax check, a write, or the transaction), or nothing was applied.
     """
     try:
-        # The patch library expects bytes
-        diff_bytes = diff_text.encode('utf-8')
-        patch_set = patch.fromstring(diff_bytes)
-
-        if not patch_set:
-            print("Warning: No patches were found in the provided diff input.")
-            return True # Nothing to do, technically successful
+        try:
+            file_patches = parse_unified_diff(diff_text)
+        except ParseError as e:
+            # Unparseable LLM output: nothing can have been applied as intended.
+            print(f"Error: No patches were found in the provided diff input ({e}).")
+            return False
 
-        print(f"Parsed {len(patch_set.items)} patch item(s). Processing...")
+        print(f"Parsed {len(file_patches)} patch item(s). Processing...")
         if dry_run:
             print("--- DRY RUN MODE: No files will be modified. ---")
         if backup and not dry_run:
             print("--- Backup enabled: '.bak' files will be created for modified files. ---")
+        if transaction:
+            print("--- Transaction mode: all files are validated first and committed together. ---")
 
         applied_count = 0
         failed_count = 0
         skipped_count = 0
+        hunks_applied = 0
+        hunks_failed = 0
+        tx = FileTransaction()
 
         # Get absolute base path ONCE for safety checks
         absolute_base = os.path.abspath(base_path)
 
-        for patch_item in patch_set.items:
-            # Determine the target file path from the patch header (prefer target)
-            relative_path = patch_item.target # target is usually b/path/to/file
-            if relative_path.startswith('b/'):
-                relative_path = relative_path[2:]
+        # Construct and sanitize the full target paths; None marks a rejected item.
+        targets = []
+        for file_patch in file_patches:
+            target_path = None
+            if file_patch.path:
+                target_path = os.path.abspath(os.path.join(absolute_base, file_patch.path))
+            targets.append(target_path)
+        accepted = [index for index, target_path in enumerate(targets)
+                    if target_path and target_path.startswith(absolute_base)]
+        jobs = [(file_patches[index], targets[index]) for index in accepted]
+
+        # --- Apply in memory, on the worker pool ---
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 and len(jobs) > 1 else None
+        try:
+            patched = list(ordered_map(executor, _patch_file, jobs, max(workers, 1) * 4))
+        finally:
+            if executor:
+                executor.shutdown()
+        results = dict(zip(accepted, patched))
+
+        # --- Syntax gate over the files that change ---
+        syntax_errors = {}
+        if validate:
+            changed = [(file_patch.path, new_text, original_text, None)
+                       for (file_patch, _), (original_text, new_text, hunk_results, error) in zip(jobs, patched)
+                       if error is None and new_text is not None and all(r.applied for r in hunk_results)]
+            syntax_errors = validate_files(changed, max(1, min(workers, DEFAULT_VALIDATION_WORKERS)))
+
+        for index, (file_patch, target_path) in enumerate(zip(file_patches, targets)):
+            relative_path = file_patch.path
 
             if not relative_path:
-                 print(f"Warning: Could not determine relative path for a patch item. Header: --- {patch_item.source}, +++ {patch_item.target}. Skipping.")
+                 print(f"Warning: Could not determine relative path for a patch item. Header: --- {file_patch.source}, +++ {file_patch.target}. Skipping.")
                  skipped_count += 1
                  continue
 
-            # Construct and sanitize the full target path
-            target_path = os.path.abspath(os.path.join(absolute_base, relative_path))
             target_dir = os.path.dirname(target_path)
 
             # --- Security Check ---
@@ -61,19 +141,43 @@ def apply_diff(diff_text, base_path=".", dry_run=False, backup=False):
             print(f"Processing patch for: {relative_path}")
             print(f"Full path: {target_path}")
 
+            original_text, new_text, hunk_results, error = results[index]
+            if error is not None:
+                print(f"Error: Could not read or patch {relative_path}: {error}")
+                failed_count += 1
+                continue
+
+            for hunk_result in hunk_results:
+                print(hunk_result.describe())
+            hunks_applied += sum(1 for r in hunk_results if r.applied)
+            hunks_failed += sum(1 for r in hunk_results if not r.applied)
+            if not all(r.applied for r in hunk_results):
+                print("Error: Patch application failed. Check diff context and file content. File left unchanged.")
+                failed_count += 1
+                continue
+
+            if relative_path in syntax_errors:
+                print(f"Error: The patched file no longer parses ({syntax_errors[relative_path]}). File left unchanged.")
+                failed_count += 1
+                continue
+
             if dry_run:
                 if not os.path.exists(target_dir):
                     print(f"DRY RUN: Would ensure directory exists: {target_dir}")
-                if patch_item.is_new_file():
-                    print("DRY RUN: Patch indicates a new file.")
-                elif not os.path.exists(target_path):
-                     print(f"DRY RUN: Warning - Original file does not exist: {target_path}. Patch might fail.")
-                print(f"DRY RUN: Would attempt to apply patch to {target_path}")
-                # Can't fully simulate apply success/failure easily in dry run
-                applied_count += 1 # Assume success for dry run count
-                continue # Skip actual application in dry run
-
-            # --- Actual Application ---
+                if new_text is None:
+                    print(f"DRY RUN: Would delete {target_path}")
+                else:
+                    print(f"DRY RUN: Would write {len(new_text)} characters to {target_path}")
+                applied_count += 1
+                continue # Skip actual writing in dry run
+
+            if transaction:
+                # Written in one go after every file has been validated.
+                tx.stage(target_path, original_text, new_text)
+                print("Validated; staged for commit.")
+                continue
+
+            # --- Write the result once ---
             # Ensure target directory exists
             if not os.path.exists(target_dir):
                 print(f"Creating directory: {target_dir}")
@@ -84,53 +188,50 @@ def apply_diff(diff_text, base_path=".", dry_run=False, backup=False):
                     failed_count += 1
                     continue
 
-            # Handle backup
-            backup_made = False
-            if backup and os.path.exists(target_path) and not patch_item.is_new_file():
+            # Handle backup (from the snapshot already in memory, no second read)
+            if backup and original_text is not None:
                 backup_path = target_path + ".bak"
                 try:
                     print(f"Creating backup: {backup_path}")
-                    shutil.copy2(target_path, backup_path) # copy2 preserves metadata
-                    backup_made = True
+                    atomic_write(backup_path, original_text)
                 except Exception as e:
                     print(f"Warning: Failed to create backup for {target_path}: {e}")
 
-
-            # Apply the patch for this specific file
-            # We re-parse just this item to apply individually (allows continuing on errors)
             try:
-                single_patch_set = patch.fromstring(str(patch_item).encode('utf-8'))
-                if single_patch_set.apply(root=base_path):
-                    print("Patch applied successfully.")
-                    applied_count += 1
+                if new_text is None:
+                    os.remove(target_path)
+                    print("File deleted.")
                 else:
-                    # Apply failed, maybe context mismatch?
-                    print("Error: Patch application failed. Check diff context and file content.")
-                    failed_count += 1
-                    # Attempt to restore backup if one was made for this file
-                    if backup_made:
-                        try:
-                           print(f"Attempting to restore from backup: {backup_path}")
-                           shutil.move(backup_path, target_path) # move is safer than copy+delete
-                        except Exception as e:
-                           print(f"Error: Failed to restore backup {backup_path}. Manual check required: {e}")
-
+                    mode = os.stat(target_path).st_mode if original_text is not None else None
+                    atomic_write(target_path, new_text, mode)
+                    print("Patch applied successfully.")
+                applied_count += 1
             except Exception as e:
-                 print(f"Error: An exception occurred during patch application for {relative_path}: {e}")
+                 print(f"Error: An exception occurred while writing {relative_path}: {e}")
                  failed_count += 1
-                 if backup_made:
-                      try:
-                           print(f"Attempting to restore from backup due to exception: {backup_path}")
-                           shutil.move(backup_path, target_path)
-                      except Exception as be:
-                           print(f"Error: Failed to restore backup {backup_path} after exception. Manual check required: {be}")
 
 
+        if transaction and not dry_run:
+            if failed_count > 0:
+                print("Transaction aborted: some patches failed validation. No files were modified.")
+            elif len(tx):
+                try:
+                    tx.commit()
+                    applied_count += len(tx)
+                    print(f"Transaction committed: {len(tx)} file(s) updated.")
+                except TransactionError as e:
+                    print(f"Error: Transaction failed: {e}")
+                    failed_count += len(tx)
+
+        count_stats("patch", {"files_applied": applied_count, "files_failed": failed_count, "files_skipped": skipped_count,
+                              "hunks_applied": hunks_applied, "hunks_failed": hunks_failed})
         print("=" * 30)
         print("--- Patching Summary ---")
         print(f"Successfully applied: {applied_count}")
         print(f"Failed:             {failed_count}")
         print(f"Skipped:            {skipped_count}")
+        print(f"Hunks applied:      {hunks_applied}")
+        print(f"Hunks failed:       {hunks_failed}")
         print("=" * 30)
         if failed_count > 0:
             print("Warning: Some patches failed to apply. Please review the output and your files.")
@@ -145,11 +246,6 @@ def apply_diff(diff_text, base_path=".", dry_run=False, backup=False):
             print("No patches were successfully applied.")
             return False # Indicate nothing really happened or only failures
 
-
-    except patch.ParseError as e:
-        print(f"Error: Failed to parse the diff input. Is it a valid unified diff?")
-        print(f"Details: {e}")
-        return False
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return False
@@ -159,10 +255,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Apply unified diff patches from LLM output.")
     parser.add_argument("-f", "--file", help="Path to a file containing the unified diff output from the LLM.")
     parser.add_argument("-b", "--basepath", default=".", help="Project base path where patches should be applied (default: current directory).")
-    parser.add_argument("--dry-run", action="store_true", help="Show what would happen without actually applying patches.")
+    parser.add_argument("--dry-run", action="store_true", help="Apply the patches in memory and report per-hunk results without writing files.")
     parser.add_argument("--backup", action="store_true", help="Create '.bak' backups of files before patching.")
+    parser.add_argument("--transaction", action="store_true", help="Apply all files or none: validate every hunk first, roll everything back on any failure.")
+    parser.add_argument("--no-validate", action="store_true", help="Do not check that patched .py/.json/.js/.jsx files still parse before writing them.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Threads used to read and patch files (default: {DEFAULT_WORKERS}; 1 = serial).")
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    start_metrics(args, "nocode_apply_llm_diff")
 
     diff_input_text = None
     if args.file:
@@ -194,6 +295,8 @@ if __name__ == "__main__":
         if diff_input_text.strip().endswith("```"):
             diff_input_text = diff_input_text.strip()[:-3] # Remove ```
 
-        apply_diff(diff_input_text.strip(), args.basepath, args.dry_run, args.backup)
+        if not apply_diff(diff_input_text.strip(), args.basepath, args.dry_run, args.backup, args.transaction,
+                          validate=not args.no_validate, workers=args.workers):
+            exit(1)
     else:
         print("No diff input received.")
\ No newline at end of file
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Applies SEARCH/REPLACE edit blocks from an LLM answer (see
+'nocode_full_prompt.py --output-format edits').
+
+Each block names a file and gives the exact lines to find and the lines to
+replace them with. All blocks of a file are located in one pass through the
+line index of nocode_unidiff (exact match first, then whitespace-insensitive),
+and applied in order; a block whose text only exists after an earlier block
+has been applied is retried against the updated file. A block with an empty
+SEARCH section carries the full content of the file (new files, rewrites).
+
+A file with a block that cannot be matched is left untouched and a follow-up
+prompt is printed asking the model for the full content of those files in
+the JSON format, which this script (or nocode_apply_llm_changes.py) applies.
+"""
+import argparse
+import os
+import re
+import sys
+
+from nocode_apply_llm_changes import new_write_stats, print_write_summary, write_files, write_files_from_json
+from nocode_metrics import add_metrics_arguments, count_stats, start_metrics, timed
+from nocode_unidiff import Hunk, apply_hunks, join_lines, split_lines
+from nocode_validate import validate_files
+
+_SEARCH = re.compile(r"^\s*<{5,9} ?SEARCH\s*$")
+_DIVIDER = re.compile(r"^\s*={5,9}\s*$")
+_REPLACE = re.compile(r"^\s*>{5,9} ?REPLACE\s*$")
+_FENCE = re.compile(r"^\s*```")
+
+FOLLOW_UP_PROMPT = """Some of your SEARCH/REPLACE blocks did not match the current files (or left a file that no longer parses), so these files were left unchanged:
+{files}
+
+Please return the **full content** of these files (with your changes applied) instead of edit blocks.
+"""
+
+
+class EditParseError(Exception):
+    """Raised when an edit block is incomplete or has no file path."""
+
+
+class EditBlock:
+    """One SEARCH/REPLACE block; 'line' is where it starts in the answer (1-based)."""
+
+    def __init__(self, path, search, replace, line):
+        self.path = path
+        self.search = search
+        self.replace = replace
+        self.line = line
+
+    @property
+    def is_full_file(self):
+        return not any(line.strip() for line in self.search)
+
+
+def _path_from(line):
+    """
+    Returns the file path named on a line, or None if the line is prose. A
+    path is one word with a '/' or '.' in it, so 'Changes:' is not a path
+    (a file without an extension at the root can be named './Makefile').
+    """
+    # Decorations on either side of a trailing colon: '**path**:', '`path`:', '`path:`'.
+    path = line.strip().strip("`*").rstrip(":").strip().strip("`*")
+    if path.startswith("#"):
+        path = path.lstrip("#").strip()
+    if not path or any(c.isspace() for c in path) or not ("/" in path or "." in path):
+        return None
+    return path
+
+
+@timed("parse_edits")
+def parse_edit_blocks(text):
+    """
+    Parses all SEARCH/REPLACE blocks of an answer, in order.
+
+    The file path is the last non-empty line before '<<<<<<< SEARCH' that
+    looks like a path (Markdown fences and decorations are skipped); a block
+    without one reuses the previous block's path.
+
+    Raises:
+        EditParseError: If a block is incomplete or no path is known for it.
+    """
+    lines = text.splitlines()
+    blocks = []
+    path = None
+    candidate = None
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if _SEARCH.match(line):
+            path = candidate or path
+            if path is None:
+                raise EditParseError(f"line {i + 1}: SEARCH block without a file path")
+            j = i + 1
+            while j < n and not _DIVIDER.match(lines[j]):
+                j += 1
+            if j == n:
+                raise EditParseError(f"line {i + 1}: block for {path} has no '=======' divider")
+            k = j + 1
+            while k < n and not _REPLACE.match(lines[k]):
+                k += 1
+            if k == n:
+                raise EditParseError(f"line {i + 1}: block for {path} has no '>>>>>>> REPLACE' marker")
+            blocks.append(EditBlock(path, lines[i + 1:j], lines[j + 1:k], i + 1))
+            candidate = None
+            i = k + 1
+            continue
+        if line.strip() and not _FENCE.match(line):
+            candidate = _path_from(line)
+        i += 1
+    return blocks
+
+
+def _as_hunk(block):
+    hunk = Hunk(1, len(block.search), 1, len(block.replace))
+    hunk.lines = [("-", line) for line in block.search] + [("+", line) for line in block.replace]
+    return hunk
+
+
+@timed("apply_blocks")
+def apply_blocks(original_text, blocks):
+    """
+    Applies the blocks of one file to its text (None if the file does not exist).
+
+    Returns:
+        tuple: (new text, [(block, error message)] for the blocks that failed).
+    """
+    failures = []
+    if original_text is None:
+        lines, newline, ends_with_newline = None, "\n", True
+    else:
+        lines, newline, ends_with_newline = split_lines(original_text)
+
+    pending = []
+
+    def flush():
+        # Locate the pending blocks together; retry the misses one by one on the updated lines.
+        nonlocal lines
+        if not pending:
+            return
+        if lines is None:
+            failures.extend((block, "file does not exist") for block in pending)
+            pending.clear()
+            return
+        lines, results = apply_hunks(lines, [_as_hunk(block) for block in pending])
+        for block, result in zip(pending, results):
+            if result.applied:
+                continue
+            lines, (retry,) = apply_hunks(lines, [_as_hunk(block)])
+            if not retry.applied:
+                failures.append((block, "SEARCH text not found"))
+        pending.clear()
+
+    for block in blocks:
+        if block.is_full_file:
+            flush()
+            lines, ends_with_newline = list(block.replace), True
+        else:
+            pending.append(block)
+    flush()
+
+    if lines is None:
+        return None, failures
+    return join_lines(lines, newline, ends_with_newline), failures
+
+
+def apply_edits(text, base_path=".", dry_run=False, fsync=False, validate=True):
+    """
+    Applies an LLM answer made of SEARCH/REPLACE blocks to the files under base_path.
+
+    An answer in the JSON full-file format is handed to write_files_from_json,
+    so the reply to a follow-up prompt can be applied with the same command.
+    Unless 'validate' is False, an edited file that no longer parses (see
+    nocode_validate) is left unchanged and listed in the follow-up prompt.
+
+    Returns:
+        bool: True if every block applied and every file was written (for a
+              JSON file list, see write_files_from_json).
+    """
+    stripped = text.strip()
+    if stripped.startswith("[") or stripped.lower().startswith("```json"):
+        print("Input is a JSON file list; writing full file contents.")
+        return write_files_from_json(stripped, base_path, dry_run, fsync, validate)
+
+    try:
+        blocks = parse_edit_blocks(text)
+    except EditParseError as e:
+        print(f"Error: Could not parse the edit blocks: {e}")
+        return False
+    if not blocks:
+        print("Warning: No SEARCH/REPLACE blocks were found in the input.")
+        return True
+
+    by_path = {}
+    for block in blocks:
+        by_path.setdefault(block.path, []).append(block)
+    print(f"Found {len(blocks)} edit block(s) for {len(by_path)} file(s).")
+    if dry_run:
+        print("--- DRY RUN MODE: No files will be written. ---")
+
+    absolute_base = os.path.abspath(base_path)
+    entries = []
+    originals = {}
+    failed_paths = []
+    for path, file_blocks in by_path.items():
+        target_path = os.path.abspath(os.path.join(absolute_base, path))
+        original_text = None
+        if target_path.startswith(absolute_base) and os.path.isfile(target_path):
+            try:
+                with open(target_path, "r", encoding="utf-8", newline="") as f:
+                    original_text = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Error: Could not read {path}: {e}")
+                failed_paths.append(path)
+                continue
+
+        new_text, failures = apply_blocks(original_text, file_blocks)
+        if failures:
+            for block, message in failures:
+                print(f"Block at line {block.line} for {path} FAILED: {message}.")
+            print(f"Leaving {path} unchanged.")
+            failed_paths.append(path)
+            continue
+        print(f"{path}: {len(file_blocks)} block(s) applied.")
+        # write_files checks the path again and skips files whose content did not change.
+        entries.append({"filePath": path, "content": new_text})
+        originals[path] = original_text
+
+    if validate:
+        # Checked here rather than in write_files: the originals are already in memory.
+        syntax_errors = validate_files([(entry["filePath"], entry["content"], originals[entry["filePath"]], None)
+                                        for entry in entries])
+        for path, error in syntax_errors.items():
+            print(f"Error: {path} no longer parses after the edits ({error}). Leaving {path} unchanged.")
+            failed_paths.append(path)
+        entries = [entry for entry in entries if entry["filePath"] not in syntax_errors]
+
+    stats = write_files(entries, base_path, dry_run, fsync, new_write_stats(), validate=False)
+    count_stats("write", stats)
+    count_stats("edits", {"files_failed": len(failed_paths)})
+    print_write_summary(stats, dry_run)
+
+    if failed_paths:
+        # Imported here: the prompt builder is only needed when something failed.
+        from nocode_full_prompt import JSON_OUTPUT_INSTRUCTIONS
+        print("=" * 30)
+        print("--- Follow-up prompt (paste into the LLM chat) ---")
+        print(FOLLOW_UP_PROMPT.format(files="\n".join(f"* {path}" for path in failed_paths)))
+        print(JSON_OUTPUT_INSTRUCTIONS.strip())
+        print("=" * 30)
+        return False
+    return stats["errors"] == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply SEARCH/REPLACE edit blocks from an LLM answer.")
+    parser.add_argument("-f", "--file", help="Path to a file containing the LLM answer.")
+    parser.add_argument("-b", "--basepath", default=".", help="Project base path where files should be written (default: current directory).")
+    parser.add_argument("--dry-run", action="store_true", help="Show what would happen without actually writing files.")
+    parser.add_argument("--fsync", action="store_true", help="Flush all written files to disk in one batch at the end.")
+    parser.add_argument("--no-validate", action="store_true", help="Write .py/.json/.js/.jsx files even if they no longer parse.")
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    start_metrics(args, "nocode_apply_llm_edits")
+
+    if args.file:
+        try:
+            with open(args.file, "r", encoding="utf-8") as f:
+                answer = f.read()
+            print(f"Reading edit blocks from file: {args.file}")
+        except FileNotFoundError:
+            print(f"Error: Input file not found: {args.file}")
+            exit(1)
+        except Exception as e:
+            print(f"Error reading input file: {e}")
+            exit(1)
+    else:
+        print("No input file provided. Please paste the LLM answer below.")
+        print("End input with EOF (Ctrl+D on Linux/macOS, Ctrl+Z then Enter on Windows).")
+        answer = sys.stdin.read()
+
+    if answer.strip():
+        if not apply_edits(answer, args.basepath, args.dry_run, args.fsync, not args.no_validate):
+            exit(1)
+    else:
+        print("No input received.")
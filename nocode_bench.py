@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the nocode toolchain on a synthetic repository.
+
+A generator writes a reproducible tree (seeded): N code files (.js, .py,
+.css, .html) with a configurable size distribution, nested up to --depth
+directories deep, plus large lockfiles and binary noise (random bytes, some
+of them behind code extensions so the binary check has to catch them). It
+also writes a unified diff and a JSON change set that make the same changes
+to a fraction of the files.
+
+Each stage then runs --repeat times, every run in a fresh interpreter so its
+peak RSS is its own:
+
+    scan           gather_code_files over the tree
+    concat         build_context_file from scratch (--full)
+    concat_reuse   build_context_file again, reusing every section
+    apply_diff     nocode_apply_llm_diff.apply_diff on a copy of the tree
+    write_json     nocode_apply_llm_changes.write_files_from_json on a copy
+
+and reports the best wall time, files/s, MB/s (of the bytes the stage reads:
+code files for scan and concat, touched files for apply_diff, the JSON for
+write_json) and peak RSS. Results are written as JSON (--output) and compared
+against a stored baseline (--baseline, written with --update-baseline); the
+exit status is 1 if a stage got slower or bigger than --threshold allows.
+
+nocode_bench_diff.py compares the diff engine against python-patch; this
+suite tracks the whole toolchain over time.
+
+Usage:
+    python nocode_bench.py --files 2000 --update-baseline
+    python nocode_bench.py --files 2000            # compare against it
+    python nocode_bench.py --tree-dir /tmp/synth   # keep the generated tree
+"""
+import argparse
+import contextlib
+import difflib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows: peak RSS is not reported
+    resource = None
+
+from nocode_context import DEFAULT_WORKERS, build_context_file, gather_code_files
+
+RESULTS_VERSION = 1
+STAGES = ("scan", "concat", "concat_reuse", "apply_diff", "write_json")
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+CODE_EXTENSIONS = (".py", ".html", ".css", ".js")
+EXCLUDE_DIRS = {"instance", "venv", ".venv", "migrations", "__pycache__", ".git", ".vscode"}
+# Share of each language among the generated code files.
+LANGUAGE_WEIGHTS = ((".js", 40), (".py", 30), (".css", 15), (".html", 15))
+COMMENT_LINES = {".js": "// {}\n", ".py": "# {}\n", ".css": "/* {} */\n", ".html": "<!-- {} -->\n"}
+# Minimum wall-time difference counted as a regression, whatever the threshold.
+NOISE_FLOOR = 0.01
+
+
+# --- Generator ---
+
+def _code_block(extension, index, n, rng):
+    """One block of syntactically valid code for a file type."""
+    r = rng.randrange(10 ** 6)
+    if extension == ".py":
+        return (f"def func_{index}_{n}(value):\n"
+                f"    \"\"\"Returns value scaled by {n}.\"\"\"\n"
+                f"    total = value * {n} + {r}\n"
+                f"    return total\n\n\n")
+    if extension == ".js":
+        return (f"export function func_{index}_{n}(value) {{\n"
+                f"  const total = value * {n} + {r};\n"
+                f"  return total;\n"
+                f"}}\n\n")
+    if extension == ".css":
+        return f".block-{index}-{n} {{\n  margin: {n % 64}px;\n  color: #{r % 0xffffff:06x};\n}}\n\n"
+    return f"<div class=\"row-{index}-{n}\"><span>{r}</span></div>\n"
+
+
+def _code_text(extension, index, size, rng):
+    """Code of about 'size' bytes."""
+    blocks = []
+    length = n = 0
+    while length < size:
+        block = _code_block(extension, index, n, rng)
+        blocks.append(block)
+        length += len(block)
+        n += 1
+    return "".join(blocks)
+
+
+def _file_size(rng, distribution, mean):
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return rng.randint(1, 2 * mean)
+    # Lognormal with the requested mean; a few files are many times larger.
+    sigma = 1.0
+    return max(1, min(int(rng.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma)), 50 * mean))
+
+
+def _lockfile_text(size, rng):
+    """A package-lock.json-like JSON document of about 'size' bytes."""
+    packages = []
+    length = 0
+    n = 0
+    while length < size:
+        entry = (f'    "node_modules/pkg-{n}": {{\n'
+                 f'      "version": "{rng.randrange(20)}.{rng.randrange(20)}.{rng.randrange(20)}",\n'
+                 f'      "integrity": "sha512-{rng.getrandbits(256):064x}"\n'
+                 f'    }}')
+        packages.append(entry)
+        length += len(entry) + 2
+        n += 1
+    return '{\n  "name": "synthetic",\n  "lockfileVersion": 3,\n  "packages": {\n' + ",\n".join(packages) + "\n  }\n}\n"
+
+
+def _join(*parts):
+    return "/".join(part for part in parts if part)
+
+
+def _change(extension, text, hunks, rng, index):
+    """Changes 'hunks' places of a file: each one inserts a comment line and alters the next line."""
+    lines = text.splitlines(keepends=True)
+    for position in sorted(rng.sample(range(len(lines)), min(hunks, len(lines))), reverse=True):
+        if lines[position].strip():
+            lines[position] = lines[position].replace("value", "amount")
+        lines.insert(position, COMMENT_LINES[extension].format(f"changed by benchmark {index}.{position}"))
+    return "".join(lines)
+
+
+def generate_repository(root, files=1000, mean_bytes=4096, distribution="lognormal", depth=6, fanout=4,
+                        lockfiles=2, lockfile_bytes=2 << 20, binaries=20, change_fraction=0.2, hunks=4, seed=0):
+    """
+    Writes a synthetic repository under 'root' and the changes to apply to it.
+
+    Args:
+        root (str): Directory of the tree (created).
+        files (int): Number of code files.
+        mean_bytes (int): Mean code file size.
+        distribution (str): 'fixed', 'uniform' (0 to twice the mean) or 'lognormal'.
+        depth (int): Maximum directory nesting; each file gets a depth between 1 and this.
+        fanout (int): Directory names per level, so files share directories.
+        lockfiles (int): Number of package-lock.json files.
+        lockfile_bytes (int): Size of each lockfile.
+        binaries (int): Number of binary files; half of them have code extensions.
+        change_fraction (float): Share of the code files changed by the diff and the JSON change set.
+        hunks (int): Changes per changed file.
+        seed (int): Random seed; the same arguments always give the same tree.
+
+    Returns:
+        tuple: (diff text, JSON change set text, {relative path: new content}).
+    """
+    rng = random.Random(seed)
+    extensions = [extension for extension, weight in LANGUAGE_WEIGHTS for _ in range(weight)]
+    diff_parts = []
+    changes = {}
+
+    def write(relative_path, data):
+        path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    for index in range(files):
+        parts = [f"dir{rng.randrange(fanout)}" for _ in range(rng.randint(1, max(1, depth)))]
+        extension = rng.choice(extensions)
+        relative_path = "/".join(parts + [f"file_{index}{extension}"])
+        text = _code_text(extension, index, _file_size(rng, distribution, mean_bytes), rng)
+        write(relative_path, text.encode("utf-8"))
+        if rng.random() < change_fraction:
+            changed = _change(extension, text, hunks, rng, index)
+            changes[relative_path] = changed
+            diff_parts.extend(difflib.unified_diff(text.splitlines(keepends=True), changed.splitlines(keepends=True),
+                                                   f"a/{relative_path}", f"b/{relative_path}"))
+
+    for index in range(lockfiles):
+        prefix = "/".join(f"dir{rng.randrange(fanout)}" for _ in range(index % max(1, depth)))
+        write(_join(prefix, f"pkg_{index}", "package-lock.json"),
+              _lockfile_text(lockfile_bytes, rng).encode("utf-8"))
+
+    for index in range(binaries):
+        extension = CODE_EXTENSIONS[index % len(CODE_EXTENSIONS)] if index % 2 else ".bin"
+        size = min(4 * mean_bytes, 1 << 16)
+        data = rng.getrandbits(8 * size).to_bytes(size, "little")
+        write(_join(f"dir{rng.randrange(fanout)}", "assets", f"blob_{index}{extension}"), b"\x00" + data)
+
+    change_set = json.dumps([{"filePath": path, "content": content} for path, content in sorted(changes.items())],
+                            indent=2)
+    return "".join(diff_parts), change_set, changes
+
+
+# --- Stages ---
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _check_changes(tree, changes):
+    """Raises RuntimeError unless every changed file has its expected content."""
+    for relative_path, content in changes.items():
+        with open(os.path.join(tree, relative_path), "r", encoding="utf-8", newline="") as f:
+            if f.read() != content:
+                raise RuntimeError(f"{relative_path} does not have the expected content")
+
+
+def run_stage(stage, tree, work_dir, workers):
+    """
+    Runs one stage once (in the calling process) and measures it.
+
+    Setup (copying the tree, the cold build before 'concat_reuse') and the
+    check of the result are not timed.
+
+    Returns:
+        dict: 'wall' (seconds), 'files', 'bytes', 'rss_before' and 'peak_rss' (bytes, or None).
+    """
+    scratch = tempfile.mkdtemp(prefix="nocode_bench_run_", dir=work_dir)
+    try:
+        with open(os.path.join(work_dir, "changes.json"), "r", encoding="utf-8") as f:
+            change_text = f.read()
+        changes = {entry["filePath"]: entry["content"] for entry in json.loads(change_text)}
+        output_file = os.path.join(scratch, "combined_codebase.txt")
+        target = tree
+        code_files = None
+        if stage in ("concat", "concat_reuse"):
+            code_files = gather_code_files(tree, CODE_EXTENSIONS, EXCLUDE_DIRS, workers=workers)
+            if stage == "concat_reuse":
+                build_context_file(output_file, code_files, tree, workers=workers)
+        elif stage in ("apply_diff", "write_json"):
+            target = os.path.join(scratch, "tree")
+            shutil.copytree(tree, target)
+        rss_before = _peak_rss()
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            if stage == "scan":
+                code_files = gather_code_files(tree, CODE_EXTENSIONS, EXCLUDE_DIRS, workers=workers)
+            elif stage in ("concat", "concat_reuse"):
+                stats = build_context_file(output_file, code_files, tree, full=stage == "concat", workers=workers)
+            elif stage == "apply_diff":
+                from nocode_apply_llm_diff import apply_diff
+                with open(os.path.join(work_dir, "changes.diff"), "r", encoding="utf-8") as f:
+                    ok = apply_diff(f.read(), target)
+            else:
+                from nocode_apply_llm_changes import write_files_from_json
+                write_files_from_json(change_text, target)
+            wall = time.perf_counter() - start
+
+        if stage in ("scan", "concat", "concat_reuse"):
+            files = len(code_files)
+            size = sum(os.path.getsize(f) for f in code_files)
+            if stage == "concat_reuse" and stats["reused"] != files:
+                raise RuntimeError(f"only {stats['reused']} of {files} sections were reused")
+        else:
+            if stage == "apply_diff" and changes and not ok:
+                raise RuntimeError("apply_diff reported failures")
+            _check_changes(target, changes)
+            files = len(changes)
+            size = len(change_text.encode("utf-8")) if stage == "write_json" else \
+                sum(len(content.encode("utf-8")) for content in changes.values())
+        return {"wall": wall, "files": files, "bytes": size, "rss_before": rss_before, "peak_rss": _peak_rss()}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def measure_stage(stage, tree, work_dir, workers, repeat):
+    """
+    Runs a stage 'repeat' times, each in a fresh interpreter.
+
+    Returns:
+        dict: Best and median wall time, files/s and MB/s at the best time, and peak RSS.
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            runs.append(pool.submit(run_stage, stage, tree, work_dir, workers).result())
+    best = min(run["wall"] for run in runs)
+    files, size = runs[0]["files"], runs[0]["bytes"]
+    peaks = [run["peak_rss"] for run in runs if run["peak_rss"] is not None]
+    growth = [run["peak_rss"] - run["rss_before"] for run in runs if run["peak_rss"] is not None]
+    return {
+        "wall_s": best,
+        "wall_median_s": statistics.median(run["wall"] for run in runs),
+        "files": files,
+        "bytes": size,
+        "files_per_s": files / best if best else None,
+        "mb_per_s": size / (1 << 20) / best if best else None,
+        "peak_rss_mb": max(peaks) / (1 << 20) if peaks else None,
+        "rss_growth_mb": max(growth) / (1 << 20) if growth else None,
+    }
+
+
+# --- Reporting ---
+
+def print_results(results):
+    print("=" * 30)
+    print("--- Benchmark Results ---")
+    print(f"  {'stage':<13}{'best ms':>10}{'median ms':>11}{'files':>8}{'files/s':>10}{'MB/s':>9}{'peak RSS MB':>13}{'RSS +MB':>9}")
+    for stage, r in results["stages"].items():
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "n/a"
+        growth = f"{r['rss_growth_mb']:.1f}" if r["rss_growth_mb"] is not None else "n/a"
+        print(f"  {stage:<13}{r['wall_s'] * 1000:>10.1f}{r['wall_median_s'] * 1000:>11.1f}{r['files']:>8}"
+              f"{r['files_per_s']:>10.0f}{r['mb_per_s']:>9.1f}{rss:>13}{growth:>9}")
+    print("=" * 30)
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compares results with a baseline and prints the differences.
+
+    A stage regresses if its best wall time grew by more than 'threshold'
+    (and by more than NOISE_FLOOR seconds), or its peak RSS by more than
+    'threshold'.
+
+    Returns:
+        list: The regressed stage names; None if the baseline is not comparable.
+    """
+    if baseline.get("version") != RESULTS_VERSION or baseline.get("generator") != results["generator"]:
+        print("Warning: The baseline was recorded with other generator settings; not comparing.")
+        return None
+    regressions = []
+    print("--- Compared to Baseline ---")
+    for stage, r in results["stages"].items():
+        old = baseline["stages"].get(stage)
+        if not old:
+            print(f"  {stage}: not in the baseline")
+            continue
+        wall_change = r["wall_s"] / old["wall_s"] - 1 if old["wall_s"] else 0.0
+        notes = []
+        if wall_change > threshold and r["wall_s"] - old["wall_s"] > NOISE_FLOOR:
+            notes.append("SLOWER")
+        line = f"  {stage}: {old['wall_s'] * 1000:.1f} -> {r['wall_s'] * 1000:.1f} ms ({wall_change:+.1%})"
+        if r["peak_rss_mb"] is not None and old.get("peak_rss_mb"):
+            rss_change = r["peak_rss_mb"] / old["peak_rss_mb"] - 1
+            line += f", peak RSS {old['peak_rss_mb']:.1f} -> {r['peak_rss_mb']:.1f} MB ({rss_change:+.1%})"
+            if rss_change > threshold:
+                notes.append("BIGGER")
+        if notes:
+            regressions.append(stage)
+            line += "  <-- " + ", ".join(notes)
+        print(line)
+    print(f"{len(regressions)} regression(s) above {threshold:.0%}." if regressions else "No regressions.")
+    return regressions
+
+
+def write_json_file(path, data):
+    """Writes JSON through a temp file and os.replace."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the nocode toolchain on a synthetic repository.")
+    parser.add_argument("--files", type=int, default=1000, help="Code files to generate (default: 1000).")
+    parser.add_argument("--mean-bytes", type=int, default=4096, help="Mean code file size (default: 4096).")
+    parser.add_argument("--size-dist", choices=SIZE_DISTRIBUTIONS, default="lognormal", help="Code file size distribution (default: lognormal).")
+    parser.add_argument("--depth", type=int, default=6, help="Maximum directory nesting (default: 6).")
+    parser.add_argument("--lockfiles", type=int, default=2, help="Large package-lock.json files to generate (default: 2).")
+    parser.add_argument("--lockfile-bytes", type=int, default=2 << 20, help="Size of each lockfile (default: 2 MiB).")
+    parser.add_argument("--binaries", type=int, default=20, help="Binary noise files to generate (default: 20).")
+    parser.add_argument("--change-fraction", type=float, default=0.2, help="Share of code files changed by the diff and JSON change set (default: 0.2).")
+    parser.add_argument("--hunks", type=int, default=4, help="Changes per changed file (default: 4).")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed (default: 0).")
+    parser.add_argument("--stage", action="append", choices=STAGES, default=None, help="Run only this stage (repeatable; default: all).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best time counts (default: 3).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Threads for scanning and reading (default: {DEFAULT_WORKERS}).")
+    parser.add_argument("--tree-dir", default=None, help="Generate the tree (and changes.diff / changes.json) here and keep it.")
+    parser.add_argument("--output", default=os.path.join("instance", "bench_results.json"), help="Results file (default: instance/bench_results.json).")
+    parser.add_argument("--baseline", default=os.path.join("instance", "bench_baseline.json"), help="Baseline to compare with (default: instance/bench_baseline.json).")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown or RSS growth per stage (default: 0.25).")
+    args = parser.parse_args()
+    if args.files < 1 or args.repeat < 1:
+        parser.error("--files and --repeat must be positive")
+    if not 0 <= args.change_fraction <= 1:
+        parser.error("--change-fraction must be between 0 and 1")
+
+    generator = {"files": args.files, "mean_bytes": args.mean_bytes, "distribution": args.size_dist,
+                 "depth": args.depth, "lockfiles": args.lockfiles, "lockfile_bytes": args.lockfile_bytes,
+                 "binaries": args.binaries, "change_fraction": args.change_fraction, "hunks": args.hunks,
+                 "seed": args.seed}
+    work_dir = args.tree_dir or tempfile.mkdtemp(prefix="nocode_bench_")
+    try:
+        tree = os.path.join(work_dir, "tree")
+        if os.path.exists(tree):
+            shutil.rmtree(tree)
+        start = time.perf_counter()
+        diff_text, change_set, changes = generate_repository(tree, **generator)
+        with open(os.path.join(work_dir, "changes.diff"), "w", encoding="utf-8") as f:
+            f.write(diff_text)
+        with open(os.path.join(work_dir, "changes.json"), "w", encoding="utf-8") as f:
+            f.write(change_set)
+        print(f"Generated {args.files} code files ({args.size_dist}, mean {args.mean_bytes} bytes, depth <= {args.depth}), "
+              f"{args.lockfiles} lockfile(s), {args.binaries} binary file(s) and {len(changes)} change(s) "
+              f"in {time.perf_counter() - start:.1f} s under {work_dir}.")
+
+        results = {
+            "version": RESULTS_VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "generator": generator,
+            "stages": {},
+        }
+        for stage in args.stage or STAGES:
+            print(f"Running {stage}...")
+            results["stages"][stage] = measure_stage(stage, tree, work_dir, args.workers, args.repeat)
+    finally:
+        if not args.tree_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    write_json_file(args.output, results)
+    print(f"Results written to: {os.path.abspath(args.output)}")
+
+    regressions = None
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+    if args.update_baseline:
+        write_json_file(args.baseline, results)
+        print(f"Baseline written to: {os.path.abspath(args.baseline)}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark for nocode_apply_llm_diff: the built-in single-pass engine
+(nocode_unidiff) against the previous python-patch path, which parsed the
+whole diff, then re-serialized and re-parsed every item before applying it.
+
+By default a synthetic tree and a matching multi-file diff are generated;
+--file/--basepath benchmark a real diff instead. Every run works on a fresh
+copy of the tree in a temporary directory, so the source tree is not touched.
+"""
+import argparse
+import difflib
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from nocode_unidiff import apply_file_patch, parse_unified_diff
+
+
+def generate_tree(root, files, lines, hunks, seed=0, stale=0):
+    """
+    Writes 'files' JS-like files of 'lines' lines under 'root' and returns a
+    unified diff that changes 'hunks' places in each of them. With 'stale',
+    that many extra lines are prepended to every file after the diff was
+    made, so every hunk header is off and has to be relocated.
+    """
+    rng = random.Random(seed)
+    diff_parts = []
+    for index in range(files):
+        relative_path = f"src/module_{index // 50}/file_{index}.js"
+        original = [f"const value_{index}_{n} = compute({n}, '{rng.random():.6f}');\n" for n in range(lines)]
+        changed = list(original)
+        for position in sorted(rng.sample(range(lines), min(hunks, lines)), reverse=True):
+            changed[position] = f"const value_{index}_{position} = recompute({position});\n"
+            changed.insert(position, f"// changed by benchmark at {position}\n")
+        path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines([f"// stale line {n}\n" for n in range(stale)] + original)
+        diff_parts.extend(difflib.unified_diff(original, changed, f"a/{relative_path}", f"b/{relative_path}"))
+    return "".join(diff_parts)
+
+
+def run_builtin(diff_text, root):
+    """The current path: parse once, patch in memory, write each file once."""
+    for file_patch in parse_unified_diff(diff_text):
+        target = os.path.join(root, file_patch.path)
+        original = None
+        if os.path.exists(target):
+            with open(target, "r", encoding="utf-8", newline="") as f:
+                original = f.read()
+        new_text, results = apply_file_patch(original, file_patch)
+        if not all(r.applied for r in results):
+            raise RuntimeError(f"built-in engine failed on {file_patch.path}")
+        if new_text is None:
+            os.remove(target)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w", encoding="utf-8", newline="") as f:
+            f.write(new_text)
+
+
+def _split_per_file(diff_text):
+    """Splits a diff into one chunk of text per file header."""
+    chunks = []
+    lines = diff_text.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            chunks.append([])
+        if chunks:
+            chunks[-1].append(line)
+    return ["".join(chunk) for chunk in chunks]
+
+
+def run_python_patch(diff_text, root):
+    """
+    The previous path: parse everything, then re-parse and apply each item on
+    its own. The old code re-serialized items with str(patch_item), which
+    python-patch does not support (it returns the object repr), so each item's
+    text is sliced out of the diff instead; the parsing work is the same.
+    """
+    import patch  # from python-patch library
+
+    patch_set = patch.fromstring(diff_text.encode("utf-8"))
+    for item_text, patch_item in zip(_split_per_file(diff_text), patch_set.items):
+        single_patch_set = patch.fromstring(item_text.encode("utf-8"))
+        if not single_patch_set or not single_patch_set.apply(root=root):
+            raise RuntimeError(f"python-patch failed on {patch_item.target}")
+
+
+def time_engine(engine, diff_text, tree, repeat):
+    """Runs an engine 'repeat' times on fresh copies of 'tree'; returns the best wall time in seconds."""
+    best = None
+    for _ in range(repeat):
+        work = tempfile.mkdtemp(prefix="nocode_bench_")
+        try:
+            copy = os.path.join(work, "tree")
+            shutil.copytree(tree, copy)
+            start = time.perf_counter()
+            engine(diff_text, copy)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the built-in diff engine against python-patch.")
+    parser.add_argument("-f", "--file", help="Benchmark this diff instead of a synthetic one.")
+    parser.add_argument("-b", "--basepath", default=".", help="Tree the --file diff applies to (default: current directory).")
+    parser.add_argument("--files", type=int, default=200, help="Synthetic files (default: 200).")
+    parser.add_argument("--lines", type=int, default=400, help="Lines per synthetic file (default: 400).")
+    parser.add_argument("--hunks", type=int, default=8, help="Changes per synthetic file (default: 8).")
+    parser.add_argument("--stale", type=int, default=0, help="Shift synthetic files by this many lines so every hunk must be relocated (default: 0).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per engine; the best time is reported (default: 3).")
+    args = parser.parse_args()
+
+    scratch = None
+    try:
+        if args.file:
+            with open(args.file, "r", encoding="utf-8") as f:
+                diff_text = f.read()
+            tree = args.basepath
+        else:
+            scratch = tempfile.mkdtemp(prefix="nocode_bench_tree_")
+            tree = os.path.join(scratch, "tree")
+            diff_text = generate_tree(tree, args.files, args.lines, args.hunks, stale=args.stale)
+            print(f"Generated {args.files} files x {args.lines} lines, {args.hunks} changes each, {args.stale} stale lines.")
+
+        print(f"Diff size: {len(diff_text)} characters.")
+        builtin = time_engine(run_builtin, diff_text, tree, args.repeat)
+        print(f"Built-in engine: {builtin * 1000:.1f} ms")
+        try:
+            legacy = time_engine(run_python_patch, diff_text, tree, args.repeat)
+        except ImportError:
+            print("python-patch is not installed; skipping the comparison (pip install patch).")
+        else:
+            print(f"python-patch:    {legacy * 1000:.1f} ms ({legacy / builtin:.1f}x the built-in time)")
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
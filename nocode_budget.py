@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Token budgeting for nocode_full_prompt.py.
+
+Estimates how many tokens each code file costs with a fast local heuristic (no
+tokenizer download, no network) and packs the files into a token budget in
+strict priority order: a file goes in full if it fits, is truncated to the
+space left if it does not, and is omitted only if too little space is left
+to show a useful part of it. Estimates are taken from the text the builder
+will actually emit (--compact and --outline renderings, truncation notes).
+"""
+import fnmatch
+import json
+import os
+import re
+
+from nocode_compact import LOCKFILE_NAMES, compact_text, is_lockfile, lockfile_note
+from nocode_context import CHUNK_SIZE, decode_source, ordered_map, relative_posix_path
+from nocode_outline import OUTLINE_NOTE, render_outline
+
+# Word-ish pieces: identifiers/words, numbers, single punctuation characters
+# and whitespace runs. Roughly how BPE tokenizers split source code.
+_TOKEN_PIECE = re.compile(r"[A-Za-z_]+|\d+|\n\s*|[^\S\n]+|[^\w\s]")
+
+# A truncated file must keep at least this many tokens to be worth including.
+MIN_TRUNCATED_TOKENS = 200
+
+SOURCE_EXTENSIONS = (".py", ".js", ".jsx", ".ts", ".tsx")
+MARKUP_EXTENSIONS = (".html", ".css")
+
+
+def estimate_tokens(text):
+    """
+    Estimates the token count of a piece of text.
+
+    Words cost one token per four characters (rounded up), numbers one per
+    three digits, every punctuation character one, and a newline together
+    with the indentation that follows it one. Spaces between words are free,
+    as BPE tokenizers fold them into the next word.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECE.findall(text):
+        first = piece[0]
+        if first.isalpha() or first == "_":
+            tokens += (len(piece) + 3) // 4
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first == "\n":
+            tokens += 1
+        elif not first.isspace():
+            tokens += 1
+    return tokens
+
+
+def estimate_file_tokens(path):
+    """Estimates the tokens of a file's content, reading it in chunks."""
+    tokens = 0
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            tokens += estimate_tokens(chunk)
+    return tokens
+
+
+def estimate_section_tokens(path, relative_path, compact=None, outline=False):
+    """
+    Estimates the tokens of the body build_context_file will emit for a file
+    (see nocode_context._load_section): its outline with 'outline', a lockfile
+    note or the compacted text with 'compact', otherwise the file itself.
+
+    Returns:
+        tuple: (tokens, raw_tokens, truncatable): the tokens of the rendered
+               body, of the file as is (a byte limit cuts the raw file), and
+               whether a byte limit applies to this rendering at all.
+    """
+    if not (compact or outline):
+        tokens = estimate_file_tokens(path)
+        return tokens, tokens, True
+    with open(path, "rb") as f:
+        raw = f.read()
+    text = decode_source(raw)
+    raw_tokens = estimate_tokens(text)
+    if outline:
+        outlined = render_outline(relative_path, text)
+        if outlined is not None:
+            # Size limits do not apply to outlines.
+            return estimate_tokens(f"{OUTLINE_NOTE}\n{outlined}"), raw_tokens, False
+    if compact == "skip" and is_lockfile(relative_path):
+        return estimate_tokens(lockfile_note(len(raw))), raw_tokens, False
+    compacted = compact_text(relative_path, text, compact) if compact else None
+    if compacted is not None:
+        return estimate_tokens(compacted), raw_tokens, True
+    return raw_tokens, raw_tokens, True
+
+
+def section_overhead_tokens(relative_path):
+    """Tokens spent on the Start/End markers around one file section."""
+    return estimate_tokens(f"--- Start of {relative_path} ---\n\n--- End of {relative_path} ---\n\n")
+
+
+def truncation_note_tokens(size):
+    """Tokens of the note closing a truncated section (an upper bound; see nocode_context._render_oversized)."""
+    return estimate_tokens(f"\n... [truncated: showing {size} of {size} bytes] ...")
+
+
+def load_token_cache(cache_path):
+    """Loads the {relative_path: [size, mtime_ns, tokens, raw_tokens, truncatable]} cache, or {} if unusable."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_token_cache(cache_path, cache):
+    """Writes the token cache atomically (temp file + os.replace)."""
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+
+def token_cache_name(compact=None, outline=False):
+    """The file name of the token cache for one rendering, e.g. 'token_cache.outline-skip.json'."""
+    variant = "-".join(part for part in ("outline" if outline else None, compact) if part)
+    return f"token_cache.{variant}.json" if variant else "token_cache.json"
+
+
+def count_file_tokens(code_files, root_dir, cache_path, executor=None, window=64, compact=None, outline=False):
+    """
+    Estimates the tokens of every file as it will be rendered, re-reading only
+    files whose size or mtime changed since the cached estimate. Keep one
+    cache per rendering (see token_cache_name).
+
+    Args:
+        code_files (list): Paths of the code files.
+        root_dir (str): Project root; cache keys are relative to it.
+        cache_path (str): Path of the JSON token cache.
+        executor (ThreadPoolExecutor, optional): Pool used to read files.
+        window (int): Maximum number of reads in flight.
+        compact (str, optional): The --compact lockfile policy the files are built with.
+        outline (bool): If True, estimates the outline of every file that has one.
+
+    Returns:
+        dict: {path: {'relative_path', 'size', 'tokens', 'raw_tokens', 'truncatable'}}
+              (see estimate_section_tokens). Unreadable files are left out.
+    """
+    cache = load_token_cache(cache_path)
+
+    def measure(path):
+        relative_path = relative_posix_path(path, root_dir)
+        try:
+            st = os.stat(path)
+            cached = cache.get(relative_path)
+            if cached and len(cached) == 5 and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+                estimate = tuple(cached[2:])
+            else:
+                estimate = estimate_section_tokens(path, relative_path, compact, outline)
+        except OSError:
+            return path, None
+        return path, (relative_path, st, estimate)
+
+    measured = {}
+    new_cache = {}
+    for path, info in ordered_map(executor, measure, sorted(code_files), window):
+        if info is None:
+            continue
+        relative_path, st, (tokens, raw_tokens, truncatable) = info
+        new_cache[relative_path] = [st.st_size, st.st_mtime_ns, tokens, raw_tokens, truncatable]
+        measured[path] = {"relative_path": relative_path, "size": st.st_size, "tokens": tokens,
+                          "raw_tokens": raw_tokens, "truncatable": truncatable}
+    save_token_cache(cache_path, new_cache)
+    return measured
+
+
+def default_priority(relative_path, boost_patterns=()):
+    """
+    Ranks a file for the budget: higher goes in first.
+
+    Source code beats markup, which beats config and docs; lockfiles come last.
+    Files matching any of 'boost_patterns' (fnmatch globs on the relative path)
+    outrank everything else.
+    """
+    name = relative_path.rsplit("/", 1)[-1]
+    if name in LOCKFILE_NAMES:
+        score = 0
+    elif name.endswith(SOURCE_EXTENSIONS):
+        score = 3
+    elif name.endswith(MARKUP_EXTENSIONS):
+        score = 2
+    else:
+        score = 1
+    if any(fnmatch.fnmatch(relative_path, pattern) for pattern in boost_patterns):
+        score += 10
+    return score
+
+
+def pack_files(measured, budget, priority):
+    """
+    Decides which files fit into a token budget.
+
+    Files are taken strictly in priority order (ties: fewer tokens first,
+    then path). A file that fits goes in full. A file that does not is
+    truncated to the remaining budget (markers and truncation note included)
+    as long as at least MIN_TRUNCATED_TOKENS of it can be shown, which uses up
+    the budget; otherwise it is omitted and the next file is considered. So a
+    lower-priority file never takes the space a higher-priority one needed.
+
+    Args:
+        measured (dict): Output of count_file_tokens ('raw_tokens' and
+                         'truncatable' default to 'tokens' and True).
+        budget (int): Tokens available for file sections.
+        priority (callable): relative_path -> sortable score, higher first.
+
+    Returns:
+        dict: {path: plan} where plan has 'relative_path', 'tokens', 'mode'
+              ('full', 'truncated' or 'omitted'), 'used_tokens' (including the
+              section markers) and, for truncated files, 'shown_tokens' and
+              'max_bytes'.
+    """
+    order = sorted(
+        measured,
+        key=lambda p: (-priority(measured[p]["relative_path"]), measured[p]["tokens"], measured[p]["relative_path"]),
+    )
+    remaining = budget
+    plans = {}
+
+    for path in order:
+        info = measured[path]
+        overhead = section_overhead_tokens(info["relative_path"])
+        cost = info["tokens"] + overhead
+        if cost <= remaining:
+            plans[path] = dict(info, mode="full", used_tokens=cost)
+            remaining -= cost
+            continue
+        raw_tokens = info.get("raw_tokens", info["tokens"])
+        shown = remaining - overhead - truncation_note_tokens(info["size"])
+        if info.get("truncatable", True) and shown >= MIN_TRUNCATED_TOKENS and raw_tokens > 0:
+            # A byte limit cuts the raw file, so convert the allowance with the file's own ratio.
+            max_bytes = min(int(info["size"] * shown / raw_tokens), info["size"] - 1)
+            plans[path] = dict(info, mode="truncated", used_tokens=remaining, shown_tokens=shown, max_bytes=max_bytes)
+            remaining = 0
+        else:
+            plans[path] = dict(info, mode="omitted", used_tokens=0)
+    return plans
+
+
+def print_budget_report(plans, budget, fixed_tokens):
+    """Prints which files were included in full, truncated or omitted."""
+    print("=" * 30)
+    print(f"--- Token Budget Report (budget: {budget}) ---")
+    print(f"Prompt template and instructions: ~{fixed_tokens} tokens")
+    for mode in ("full", "truncated", "omitted"):
+        selected = sorted((p for p in plans.values() if p["mode"] == mode), key=lambda p: p["relative_path"])
+        print(f"{mode.capitalize()} ({len(selected)}):")
+        for plan in selected:
+            if mode == "truncated":
+                print(f"  {plan['relative_path']} (~{plan['shown_tokens']} of ~{plan['tokens']} tokens)")
+            else:
+                print(f"  {plan['relative_path']} (~{plan['tokens']} tokens)")
+    used = fixed_tokens + sum(p["used_tokens"] for p in plans.values())
+    print(f"Estimated total: ~{used} of {budget} tokens")
+    print("=" * 30)
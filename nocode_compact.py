@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Compaction of file contents for the context builders ('--compact').
+
+Comments are stripped, blank lines dropped and indentation normalized to
+one space per nesting level, using real tokenizers so string, template and
+regex literals are never touched:
+
+    .py          the 'tokenize' module; lines inside multi-line strings are
+                 kept verbatim and indentation follows the INDENT/DEDENT tokens
+    .js / .jsx   the tokenizer of nocode_outline (scan_js); lines inside
+                 multi-line templates are kept verbatim. A comment is only
+                 removed where it cannot be JSX text (not right after '>', and
+                 not after a word or ':' on the same line, as in 'http://...')
+    .css         comments outside strings; indentation by brace depth
+    .json        all whitespace outside strings (and JSONC comments) removed,
+                 by a streaming state machine that also serves large files
+
+Lockfiles (package-lock.json, yarn.lock, ...) are skipped, i.e. replaced by
+a one-line note, or minified when they are JSON. A file that does not
+tokenize is left as it is.
+"""
+import io
+import os
+import re
+import tokenize
+
+from nocode_outline import scan_js
+
+COMPACT_EXTENSIONS = (".py", ".js", ".jsx", ".css", ".json")
+LOCKFILE_NAMES = {"package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock", "composer.lock"}
+LOCKFILE_POLICIES = ("skip", "minify")
+
+_JSON_NORMAL = re.compile(r'["/\s]')
+_JSON_STRING = re.compile(r'["\\]')
+
+
+def is_lockfile(relative_path):
+    return os.path.basename(relative_path) in LOCKFILE_NAMES
+
+
+def lockfile_note(size):
+    return f"(lockfile omitted by --compact: {size} bytes)"
+
+
+def _assemble(lines, depths, verbatim, keep_trailing=()):
+    """
+    Joins compacted lines: blank lines are dropped and every other line is
+    re-indented to its depth, except the 'verbatim' ones (inside literals).
+    Lines in 'keep_trailing' open a multi-line literal, so only their
+    indentation is replaced.
+    """
+    out = []
+    for index, line in enumerate(lines):
+        if index in verbatim:
+            out.append(line)
+            continue
+        stripped = line.lstrip() if index in keep_trailing else line.strip()
+        if stripped:
+            out.append(" " * depths[index] + stripped)
+    return "\n".join(out)
+
+
+def _reflow(text, depth_changes, literals):
+    """
+    Re-indents bracketed text by nesting depth.
+
+    Args:
+        depth_changes (list): (offset, +1 or -1) of every opening and closing bracket, in order.
+        literals (list): (start, end) of the literals spanning several lines, in order.
+    """
+    lines = text.split("\n")
+    depths = []
+    verbatim = set()
+    keep_trailing = set()
+    offset = depth = change = literal = 0
+    for index, line in enumerate(lines):
+        end = offset + len(line)
+        # The depth at the first character; a closing bracket there already counts.
+        first = end - len(line.lstrip())
+        while change < len(depth_changes) and (depth_changes[change][0] < first or
+                                               (depth_changes[change][0] == first and depth_changes[change][1] < 0)):
+            depth = max(0, depth + depth_changes[change][1])
+            change += 1
+        depths.append(depth)
+        while literal < len(literals) and literals[literal][1] <= offset:
+            literal += 1
+        continues = False
+        for start, stop in literals[literal:]:
+            if start >= end:
+                break
+            if start < offset:
+                verbatim.add(index)
+            continues = continues or stop > end
+        if continues and index not in verbatim:
+            keep_trailing.add(index)
+        elif index in verbatim and not continues:
+            # The literal ends on this line: what follows it is code.
+            lines[index] = line.rstrip()
+        offset = end + 1
+    return _assemble(lines, depths, verbatim, keep_trailing)
+
+
+# --- Python ---
+
+def compact_python(text):
+    """Returns the compacted Python source, or None if it does not tokenize."""
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(text).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return None
+    lines = text.split("\n")
+    cuts = {}
+    verbatim = set()
+    keep_trailing = set()
+    depths = [0] * len(lines)
+    statement_rows = set()
+    depth = 0
+    at_statement_start = True
+    for token in tokens:
+        kind, (start_row, start_col), (end_row, _) = token.type, token.start, token.end
+        if kind == tokenize.INDENT:
+            depth += 1
+        elif kind == tokenize.DEDENT:
+            depth -= 1
+        elif kind == tokenize.COMMENT:
+            cuts[start_row - 1] = start_col
+        elif kind == tokenize.NEWLINE:
+            at_statement_start = True
+        elif kind not in (tokenize.NL, tokenize.ENDMARKER):
+            if at_statement_start:
+                depths[start_row - 1] = depth
+                statement_rows.add(start_row - 1)
+                at_statement_start = False
+            if end_row > start_row:
+                # Multi-line string: its inner lines are content, and so is the end of its first line.
+                verbatim.update(range(start_row, end_row))
+                keep_trailing.update(range(start_row - 1, end_row - 1))
+    # Continuation lines (inside brackets or after a backslash) go one level deeper than their statement.
+    current = 0
+    for index in range(len(lines)):
+        if index in statement_rows:
+            current = depths[index]
+        else:
+            depths[index] = current + 1
+    for index, column in cuts.items():
+        lines[index] = lines[index][:column]
+    for index in verbatim - keep_trailing:
+        # The last line of a multi-line string: what follows the string is code.
+        lines[index] = lines[index].rstrip()
+    return _assemble(lines, depths, verbatim, keep_trailing)
+
+
+# --- JavaScript ---
+
+def _comment_is_code(text, spans, index):
+    """True if the comment at spans[index] is a real comment rather than JSX text."""
+    previous = None
+    for k in range(index - 1, -1, -1):
+        if spans[k][0] != "comment":
+            previous = spans[k]
+            break
+    if previous is None:
+        return True
+    kind, start, end, line = previous
+    value = text[start:end]
+    if kind == "punct" and value == ">":
+        return False
+    same_line = "\n" not in text[end:spans[index][1]]
+    return not (same_line and (kind == "ident" or value == ":"))
+
+
+def compact_js(text):
+    """Returns the compacted JS/JSX source."""
+    spans = list(scan_js(text))
+    pieces = []
+    length = position = 0
+    depth_changes = []
+    literals = []
+    for index, (kind, start, end, _) in enumerate(spans):
+        if kind == "comment" and not _comment_is_code(text, spans, index):
+            continue
+        value = text[start:end]
+        if kind == "comment":
+            # A removed comment leaves a separator, so neighbouring tokens (and ASI) are unaffected.
+            value = "\n" if "\n" in value else " "
+        elif kind == "punct" and value in ("(", "[", "{"):
+            depth_changes.append((length + start - position, 1))
+        elif kind == "punct" and value in (")", "]", "}"):
+            depth_changes.append((length + start - position, -1))
+        elif "\n" in value:
+            literals.append((length + start - position, length + start - position + len(value)))
+        pieces.append(text[position:start])
+        pieces.append(value)
+        length += start - position + len(value)
+        position = end
+    pieces.append(text[position:])
+    return _reflow("".join(pieces), depth_changes, literals)
+
+
+# --- CSS ---
+
+_CSS_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|/\*.*?(?:\*/|\Z)|[{}]', re.DOTALL)
+
+
+def compact_css(text):
+    """Returns the compacted stylesheet."""
+    pieces = []
+    length = position = 0
+    depth_changes = []
+    literals = []
+    for match in _CSS_TOKEN.finditer(text):
+        start, end = match.span()
+        value = match.group()
+        if value.startswith("/*"):
+            value = " "
+        elif value in "{}":
+            depth_changes.append((length + start - position, 1 if value == "{" else -1))
+        elif "\n" in value:
+            literals.append((length + start - position, length + start - position + len(value)))
+        pieces.append(text[position:start])
+        pieces.append(value)
+        length += start - position + len(value)
+        position = end
+    pieces.append(text[position:])
+    return _reflow("".join(pieces), depth_changes, literals)
+
+
+# --- JSON ---
+
+class JsonMinifier:
+    """
+    Removes whitespace (and // or /* */ comments, as in JSONC files) outside
+    strings, one chunk at a time: feed() returns the output for each chunk
+    and finish() whatever was held back at the end.
+    """
+
+    def __init__(self):
+        self.state = "normal"
+
+    def feed(self, text):
+        out = []
+        i, n = 0, len(text)
+        while i < n:
+            state = self.state
+            if state == "normal":
+                match = _JSON_NORMAL.search(text, i)
+                if not match:
+                    out.append(text[i:])
+                    break
+                out.append(text[i:match.start()])
+                i = match.end()
+                char = match.group()
+                if char == '"':
+                    out.append(char)
+                    self.state = "string"
+                elif char == "/":
+                    self.state = "slash"
+            elif state == "string":
+                match = _JSON_STRING.search(text, i)
+                if not match:
+                    out.append(text[i:])
+                    break
+                out.append(text[i:match.end()])
+                i = match.end()
+                self.state = "escape" if match.group() == "\\" else "normal"
+            elif state == "escape":
+                out.append(text[i])
+                i += 1
+                self.state = "string"
+            elif state == "slash":
+                if text[i] == "/":
+                    self.state = "line_comment"
+                    i += 1
+                elif text[i] == "*":
+                    self.state = "block_comment"
+                    i += 1
+                else:
+                    out.append("/")
+                    self.state = "normal"
+            elif state == "line_comment":
+                j = text.find("\n", i)
+                if j < 0:
+                    break
+                i = j + 1
+                self.state = "normal"
+            elif state == "block_comment":
+                j = text.find("*", i)
+                if j < 0:
+                    break
+                i = j + 1
+                self.state = "block_star"
+            elif state == "block_star":
+                if text[i] == "/":
+                    self.state = "normal"
+                elif text[i] != "*":
+                    self.state = "block_comment"
+                i += 1
+        return "".join(out)
+
+    def finish(self):
+        return "/" if self.state == "slash" else ""
+
+
+def minify_json(text):
+    minifier = JsonMinifier()
+    return minifier.feed(text) + minifier.finish()
+
+
+def compact_text(relative_path, text, lockfiles="skip"):
+    """
+    Compacts a file's decoded text according to its type.
+
+    Returns:
+        str: The compacted text, or None if the file type is not compacted
+             (or it could not be tokenized) and it should be kept verbatim.
+    """
+    if is_lockfile(relative_path):
+        if lockfiles == "minify" and relative_path.endswith(".json"):
+            return minify_json(text)
+        if lockfiles == "skip":
+            return lockfile_note(len(text.encode("utf-8")))
+        return None
+    if relative_path.endswith(".py"):
+        return compact_python(text)
+    if relative_path.endswith((".js", ".jsx")):
+        return compact_js(text)
+    if relative_path.endswith(".css"):
+        return compact_css(text)
+    if relative_path.endswith(".json"):
+        return minify_json(text)
+    return None
+
+
+def print_compact_report(saved):
+    """Prints the bytes saved per compacted file, largest savings first."""
+    if not saved:
+        return
+    print("=" * 30)
+    print("--- Compaction ---")
+    for relative_path, (before, after) in sorted(saved.items(), key=lambda item: item[1][1] - item[1][0]):
+        share = 100.0 * (before - after) / before if before else 0.0
+        print(f"  {relative_path}: {before} -> {after} bytes (-{before - after}, {share:.1f}%)")
+    before = sum(b for b, _ in saved.values())
+    after = sum(a for _, a in saved.values())
+    share = 100.0 * (before - after) / before if before else 0.0
+    print(f"Total: {before} -> {after} bytes, {before - after} saved ({share:.1f}%) over {len(saved)} file(s).")
+    print("=" * 30)
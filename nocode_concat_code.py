@@ -1,40 +1,35 @@
 #!/usr/bin/env python3
 import os
+import argparse
 
-def gather_code_files(root, extensions, exclude_dirs=None):
-    """
-    Recursively search for code files with given extensions in the root directory,
-    while skipping directories listed in exclude_dirs and ignoring any file
-    that starts with 'nocode_'.
-
-    Args:
-        root (str): The root directory to start searching.
-        extensions (tuple): A tuple of file extensions to include (e.g., ('.py', '.html', '.css', '.js')).
-        exclude_dirs (set, optional): A set of directory names to exclude. Defaults to an empty set.
-
-    Returns:
-        list: A list of full paths to the matching files.
-    """
-    if exclude_dirs is None:
-        exclude_dirs = set()
-    collected = []
-    
-    # Walk through the directory tree
-    for dirpath, dirnames, filenames in os.walk(root, topdown=True):
-        # Exclude specified directories (by name)
-        dirnames[:] = [d for d in dirnames if d not in exclude_dirs]
-        
-        for filename in filenames:
-            # Skip any file that starts with "nocode_"
-            if filename.startswith("nocode_"):
-                continue
-            # Check if the file's extension is one we want to include
-            if filename.endswith(extensions):
-                full_path = os.path.join(dirpath, filename)
-                collected.append(full_path)
-    return collected
+from nocode_compact import LOCKFILE_POLICIES, print_compact_report
+from nocode_container import COMPRESSIONS, pack_context
+from nocode_context import (DEFAULT_WORKERS, OVERSIZE_POLICIES, build_context_file, format_scan_stats, gather_code_files,
+                            new_scan_stats, outline_targets)
+from nocode_dedup import DEDUP_MODES, format_dedup_stats
+from nocode_metrics import add_metrics_arguments, start_metrics
 
 def main():
+    parser = argparse.ArgumentParser(description="Combine the project's code files into a single text file.")
+    parser.add_argument("--full", action="store_true", help="Ignore the build manifest and rebuild every section from scratch.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Threads used to scan and read files (default: {DEFAULT_WORKERS}; 1 = serial).")
+    parser.add_argument("--no-gitignore", action="store_true", help="Do not honor .gitignore files (.nocodeignore files still apply).")
+    parser.add_argument("--max-file-bytes", type=int, default=None, help="Do not inline files larger than this many bytes in full; see --oversize.")
+    parser.add_argument("--oversize", choices=OVERSIZE_POLICIES, default="truncate", help="What to do with files above --max-file-bytes (default: truncate).")
+    parser.add_argument("--outline", action="store_true", help="Render files outside the focus set as outlines (signatures only, bodies elided).")
+    parser.add_argument("--focus", action="append", default=[], metavar="GLOB", help="Glob of files kept verbatim under --outline (repeatable).")
+    parser.add_argument("--compact", nargs="?", const="skip", choices=LOCKFILE_POLICIES, default=None,
+                        help="Strip comments, blank lines and indentation from .py/.js/.css/.json files; lockfiles are "
+                             "skipped, or minified with 'minify'.")
+    parser.add_argument("--dedup", nargs="?", const="files", choices=DEDUP_MODES, default=None,
+                        help="Emit identical files once and replace later copies by a reference; 'chunks' also replaces "
+                             "repeated blocks of lines inside files.")
+    parser.add_argument("--container", nargs="?", const="none", choices=("none",) + COMPRESSIONS, default=None,
+                        help="Also write an indexed random-access container (.nocx) next to the output, optionally compressed.")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args, "nocode_concat_code")
+
     # Set the project root directory.
     root_dir = "."
     # Define the output directory. Note: even though we're writing the combined output
@@ -48,30 +43,36 @@ def main():
     code_extensions = (".py", ".html", ".css", ".js")
     
     print(f"Searching for code files in '{os.path.abspath(root_dir)}' with extensions {code_extensions},")
-    print(f"excluding directories: {exclude_dirs} and any files starting with 'nocode_'.")
+    print(f"excluding directories: {exclude_dirs}, any files starting with 'nocode_', binary files")
+    print("and anything matched by .gitignore / .nocodeignore files.")
     
     # Gather matching code files from the entire project.
-    code_files = gather_code_files(root_dir, code_extensions, exclude_dirs)
+    scan_stats = new_scan_stats()
+    code_files = gather_code_files(root_dir, code_extensions, exclude_dirs, workers=args.workers,
+                                   use_gitignore=not args.no_gitignore, stats=scan_stats)
     print(f"Found {len(code_files)} code files.")
+    print(format_scan_stats(scan_stats))
     
     # Ensure the output directory exists.
     os.makedirs(output_dir, exist_ok=True)
     print(f"Writing combined codebase to '{os.path.abspath(output_file)}'")
     
-    # Write the content of each code file into the output file.
+    # Write the content of each code file into the output file, reusing the
+    # sections of unchanged files from the previous build.
     try:
-        with open(output_file, "w", encoding="utf-8") as outfile:
-            # Sort the files for consistent order.
-            for f in sorted(code_files):
-                relative_path = os.path.relpath(f, root_dir)
-                outfile.write(f"--- Start of {relative_path} ---\n")
-                try:
-                    with open(f, "r", encoding="utf-8", errors="ignore") as infile:
-                        outfile.write(infile.read())
-                except Exception as e:
-                    outfile.write(f"\n!!! Error reading file {relative_path}: {e} !!!\n")
-                outfile.write(f"\n--- End of {relative_path} ---\n\n")
+        outline_files = outline_targets(code_files, root_dir, args.focus) if args.outline else None
+        stats = build_context_file(output_file, code_files, root_dir, full=args.full, workers=args.workers,
+                                   max_file_bytes=args.max_file_bytes, oversize=args.oversize,
+                                   outline_files=outline_files, compact=args.compact, dedup=args.dedup)
+        print_compact_report(stats["compacted"])
+        print(f"Sections reused: {stats['reused']}, re-read: {stats['rendered']}, "
+              f"oversized: {stats['oversized']}, outlined: {stats['outlined']}, errors: {stats['errors']}.")
+        if args.dedup:
+            print(format_dedup_stats(stats))
         print("Successfully combined codebase into:", os.path.abspath(output_file))
+        if args.container:
+            container = pack_context(output_file, compression=None if args.container == "none" else args.container)
+            print("Indexed container written to:", os.path.abspath(container))
     except IOError as e:
         print(f"Error writing to output file {output_file}: {e}")
     except Exception as e:
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Indexed container format for the combined context files.
+
+'combined_codebase.txt' and 'llm_code_input.txt' are flat text; finding one
+file's section means scanning the whole thing. A container ('.nocx') holds
+the same segments (header, one section per file, markers, footer) stored
+contiguously in output order, plus an index giving every segment's kind,
+path, offset, stored length, raw size and SHA-256:
+
+    offset 0   MAGIC (8 bytes)
+    offset 8   index offset, index length (two little-endian uint64)
+    offset 24  segment data
+    ...        index (UTF-8 JSON)
+
+Readers mmap the file and slice single sections without reading anything
+else. Segments can optionally be compressed one by one (zlib or lzma), which
+keeps random access. Without compression the segment data is byte for byte
+the plain-text output, so rendering it is a single zero-copy slice of the
+mapping (or an os.sendfile when the target is a regular file).
+
+Containers are packed from a built context file and its manifest, whose
+layout lists the segments in order; see build_context_file.
+
+Usage:
+    python nocode_container.py pack instance/combined_codebase.txt [--compress zlib]
+    python nocode_container.py list instance/combined_codebase.nocx
+    python nocode_container.py cat instance/combined_codebase.nocx backend/server.js
+    python nocode_container.py render instance/combined_codebase.nocx -o out.txt
+"""
+import argparse
+import hashlib
+import json
+import lzma
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from nocode_context import CHUNK_SIZE, load_manifest, manifest_path_for
+
+MAGIC = b"NOCX\x00\x01\r\n"
+_HEADER = struct.Struct("<QQ")
+DATA_OFFSET = len(MAGIC) + _HEADER.size
+CONTAINER_VERSION = 1
+COMPRESSIONS = ("zlib", "lzma")
+
+
+class ContainerError(Exception):
+    """Raised for files that are not valid containers, or contexts that cannot be packed."""
+
+
+def container_path_for(output_file):
+    """The container written next to a context file: 'x.txt' -> 'x.nocx'."""
+    return os.path.splitext(output_file)[0] + ".nocx"
+
+
+def _compress(data, compression):
+    if compression == "zlib":
+        return zlib.compress(data, 6)
+    if compression == "lzma":
+        return lzma.compress(data)
+    return data
+
+
+def _decompress(data, compression):
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "lzma":
+        return lzma.decompress(data)
+    return data
+
+
+def _segments_from_manifest(manifest):
+    """Turns a manifest layout into (kind, path, offset, size) tuples in output order."""
+    layout = manifest.get("layout")
+    if not layout:
+        raise ContainerError("the manifest has no segment layout; rebuild the context file first")
+    segments = []
+    offset = 0
+    for key, size in layout:
+        if key is None:
+            kind, path = "error", None
+        elif key.startswith("file:"):
+            # 'file:<path>:<sha256>:<limit>:<outline>'; the path itself may contain ':'.
+            kind, path = "file", key[len("file:"):].rsplit(":", 3)[0]
+        else:
+            kind, path = "text", None
+        segments.append((kind, path, offset, size))
+        offset += size
+    return segments
+
+
+def pack_context(output_file, container_file=None, compression=None):
+    """
+    Packs a built context file into a container.
+
+    Args:
+        output_file (str): The plain-text context file (its manifest must be current).
+        container_file (str, optional): Destination; defaults to container_path_for(output_file).
+        compression (str, optional): None, 'zlib' or 'lzma', applied per segment.
+
+    Returns:
+        str: The container path.
+
+    Raises:
+        ContainerError: If the context file has no usable manifest.
+    """
+    container_file = container_file or container_path_for(output_file)
+    manifest = load_manifest(manifest_path_for(output_file), output_file)
+    if manifest is None:
+        raise ContainerError(f"no current manifest for {output_file}; rebuild it first")
+    segments = _segments_from_manifest(manifest)
+    if segments and segments[-1][2] + segments[-1][3] != os.path.getsize(output_file):
+        raise ContainerError(f"the manifest layout does not cover {output_file}")
+
+    entries = []
+    tmp_path = container_file + ".tmp"
+    with open(output_file, "rb") as src, open(tmp_path, "wb") as dst:
+        dst.write(MAGIC + _HEADER.pack(0, 0))
+        source = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(output_file) else b""
+        try:
+            view = memoryview(source)
+            for kind, path, offset, size in segments:
+                raw = view[offset:offset + size]
+                try:
+                    stored = _compress(raw, compression) if compression else raw
+                    entry = {"kind": kind, "offset": dst.tell(), "length": len(stored), "size": size,
+                             "sha256": hashlib.sha256(raw).hexdigest()}
+                    if path is not None:
+                        entry["path"] = path
+                    dst.write(stored)
+                    entries.append(entry)
+                finally:
+                    raw.release()
+            view.release()
+        finally:
+            if source:
+                source.close()
+
+        index = json.dumps({
+            "version": CONTAINER_VERSION,
+            "compression": compression,
+            "source": os.path.basename(output_file),
+            "data_offset": DATA_OFFSET,
+            "data_length": dst.tell() - DATA_OFFSET,
+            "segments": entries,
+        }, separators=(",", ":")).encode("utf-8")
+        index_offset = dst.tell()
+        dst.write(index)
+        dst.seek(len(MAGIC))
+        dst.write(_HEADER.pack(index_offset, len(index)))
+    os.replace(tmp_path, container_file)
+    return container_file
+
+
+class ContextContainer:
+    """
+    Read access to a container through mmap.
+
+    Usage:
+        with ContextContainer(path) as container:
+            text = container.text("backend/server.js")
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ContainerError(f"{path} is empty")
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ContainerError(f"{path} is not a context container")
+        index_offset, index_length = _HEADER.unpack_from(self._map, len(MAGIC))
+        self.index = json.loads(self._map[index_offset:index_offset + index_length])
+        if self.index.get("version") != CONTAINER_VERSION:
+            self.close()
+            raise ContainerError(f"{path} has an unsupported container version")
+        self.compression = self.index.get("compression")
+        self.segments = self.index["segments"]
+        self.files = {entry["path"]: entry for entry in self.segments if entry["kind"] == "file"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def raw(self, entry):
+        """A segment's bytes: a zero-copy memoryview without compression, decompressed bytes otherwise."""
+        stored = memoryview(self._map)[entry["offset"]:entry["offset"] + entry["length"]]
+        return _decompress(stored, self.compression) if self.compression else stored
+
+    def section(self, relative_path):
+        """The bytes of one file's section (see raw). Raises KeyError for unknown paths."""
+        return self.raw(self.files[relative_path])
+
+    def text(self, relative_path):
+        return bytes(self.section(relative_path)).decode("utf-8")
+
+    def verify(self):
+        """Returns the segments whose content does not match their SHA-256."""
+        return [entry for entry in self.segments if hashlib.sha256(self.raw(entry)).hexdigest() != entry["sha256"]]
+
+    def render(self, out):
+        """
+        Writes the plain-text rendering to a binary file object. Without
+        compression this is one slice of the mapping, sent with os.sendfile
+        when possible; compressed segments are inflated one at a time.
+        """
+        if self.compression:
+            for entry in self.segments:
+                out.write(self.raw(entry))
+            return
+        start, length = self.index["data_offset"], self.index["data_length"]
+        try:
+            out.flush()
+            out_fd = out.fileno()
+            sent = 0
+            while sent < length:
+                count = os.sendfile(out_fd, self._file.fileno(), start + sent, min(length - sent, 1 << 30))
+                if count == 0:
+                    break
+                sent += count
+            if sent == length:
+                return
+            start, length = start + sent, length - sent
+        except (AttributeError, OSError, ValueError):
+            pass  # no sendfile on this platform or for this target: fall back to slicing the mapping
+        view = memoryview(self._map)
+        for offset in range(start, start + length, CHUNK_SIZE * 16):
+            out.write(view[offset:min(offset + CHUNK_SIZE * 16, start + length)])
+        view.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack, inspect and render indexed context containers (.nocx).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="Pack a built context file into a container.")
+    pack.add_argument("context_file")
+    pack.add_argument("-o", "--output", help="Container path (default: next to the context file, .nocx).")
+    pack.add_argument("--compress", choices=COMPRESSIONS, default=None, help="Compress each segment (random access is kept).")
+    listing = commands.add_parser("list", help="List the segments of a container.")
+    listing.add_argument("container")
+    cat = commands.add_parser("cat", help="Print one file's section.")
+    cat.add_argument("container")
+    cat.add_argument("path")
+    render = commands.add_parser("render", help="Write the plain-text context.")
+    render.add_argument("container")
+    render.add_argument("-o", "--output", help="Output file (default: stdout).")
+    verify = commands.add_parser("verify", help="Check every segment against its SHA-256.")
+    verify.add_argument("container")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "pack":
+            path = pack_context(args.context_file, args.output, args.compress)
+            print(f"Packed {args.context_file} into {path} ({os.path.getsize(path)} bytes).")
+            return
+        with ContextContainer(args.container) as container:
+            if args.command == "list":
+                for entry in container.segments:
+                    name = entry.get("path", f"<{entry['kind']}>")
+                    print(f"{entry['offset']:>12} {entry['length']:>10} {entry['size']:>10}  {entry['sha256'][:12]}  {name}")
+                print(f"{len(container.files)} file section(s), compression: {container.compression or 'none'}.")
+            elif args.command == "cat":
+                sys.stdout.buffer.write(container.section(args.path))
+            elif args.command == "render":
+                if args.output:
+                    with open(args.output, "wb") as out:
+                        container.render(out)
+                else:
+                    container.render(sys.stdout.buffer)
+            elif args.command == "verify":
+                bad = container.verify()
+                for entry in bad:
+                    print(f"Hash mismatch: {entry.get('path', entry['kind'])} at offset {entry['offset']}")
+                print("Container OK." if not bad else f"{len(bad)} segment(s) corrupted.")
+                if bad:
+                    sys.exit(1)
+    except KeyError as e:
+        print(f"Error: No section for {e} in the container.")
+        sys.exit(1)
+    except (ContainerError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
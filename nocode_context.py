@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the nocode context builders (nocode_concat_code.py and
+nocode_full_prompt.py).
+
+The builders write every code file into a single text file inside 'instance/'.
+To keep repeated runs cheap, a manifest is stored next to the output file that
+records, for each file, its size, mtime, content hash and the byte range of its
+section in the previous output. On the next run unchanged files are not read
+again: their sections are copied straight from the previous output.
+
+Large files are streamed into the output in fixed-size chunks rather than read
+whole, and files above an optional byte limit are truncated or summarized
+instead of being inlined. Sections can optionally be compacted on the way
+(comments and blank lines stripped, see nocode_compact.py), and repeated
+content replaced by references to its first copy (see nocode_dedup.py).
+
+Directory listing, stat and file reads are I/O bound, so they run on a bounded
+thread pool. Results are always consumed in sorted path order, which keeps the
+output byte-identical to a serial run regardless of the worker count.
+"""
+import codecs
+import fnmatch
+import hashlib
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from nocode_compact import JsonMinifier, compact_text, is_lockfile, lockfile_note
+from nocode_dedup import DedupIndex, chunk_text, duplicate_note, render_chunks, section_variant
+from nocode_ignore import IGNORE_FILE_NAMES, is_binary_file, is_ignored, load_ignore_rules
+from nocode_metrics import count, count_stats, timed
+from nocode_outline import OUTLINE_NOTE, render_outline
+
+MANIFEST_VERSION = 1
+
+# Same default as ThreadPoolExecutor: plenty of threads for I/O-bound work.
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Files above this size are streamed into the output instead of read whole.
+STREAM_THRESHOLD = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+# Lines kept at the top of a file rendered with the 'summarize' policy.
+SUMMARY_HEAD_LINES = 20
+OVERSIZE_POLICIES = ("truncate", "summarize")
+
+
+def ordered_map(executor, fn, items, window):
+    """
+    Like executor.map, but keeps at most 'window' calls in flight so results
+    that are produced faster than they are consumed do not pile up in memory.
+    Results are yielded in the order of 'items'. With no executor, runs serially.
+    """
+    if executor is None:
+        for item in items:
+            yield fn(item)
+        return
+
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def new_scan_stats():
+    """Returns the counters filled in by gather_code_files."""
+    return {"ignored_files": 0, "ignored_bytes": 0, "ignored_dirs": 0, "binary_files": 0, "binary_bytes": 0}
+
+
+def _entry_size(entry):
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return 0
+
+
+def _scan_directory(dirpath, relative_dir, ignore_stack, extensions, exclude_dirs, use_gitignore):
+    """
+    Lists one directory with os.scandir.
+
+    Ignore files found in the directory are compiled once and appended to the
+    inherited ignore stack, which is then handed to every subdirectory.
+    Candidate files are sniffed for NUL bytes so binaries are never read whole.
+
+    Returns:
+        tuple: (matching file paths, [(subdirectory path, relative path, ignore stack)], stats).
+    """
+    files = []
+    subdirs = []
+    stats = new_scan_stats()
+    try:
+        with os.scandir(dirpath) as it:
+            entries = list(it)
+    except OSError:
+        # Unreadable directories are skipped, as os.walk does by default.
+        return files, subdirs, stats
+
+    names = {entry.name for entry in entries}
+    for ignore_name in IGNORE_FILE_NAMES:
+        if ignore_name in names and (use_gitignore or ignore_name != ".gitignore"):
+            rules = load_ignore_rules(os.path.join(dirpath, ignore_name), relative_dir)
+            if rules:
+                ignore_stack = ignore_stack + (rules,)
+
+    for entry in entries:
+        relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            # Like os.walk(followlinks=False): don't descend into symlinked dirs.
+            if entry.name in exclude_dirs or entry.is_symlink():
+                continue
+            if ignore_stack and is_ignored(ignore_stack, relative_path, True):
+                stats["ignored_dirs"] += 1
+                continue
+            subdirs.append((entry.path, relative_path, ignore_stack))
+            continue
+        # Skip any file that starts with "nocode_"
+        if entry.name.startswith("nocode_"):
+            continue
+        # Check if the file's extension is one we want to include
+        if not entry.name.endswith(extensions):
+            continue
+        if ignore_stack and is_ignored(ignore_stack, relative_path, False):
+            stats["ignored_files"] += 1
+            stats["ignored_bytes"] += _entry_size(entry)
+            continue
+        if is_binary_file(entry.path):
+            stats["binary_files"] += 1
+            stats["binary_bytes"] += _entry_size(entry)
+            continue
+        files.append(entry.path)
+    return files, subdirs, stats
+
+
+@timed("scan")
+def gather_code_files(root, extensions, exclude_dirs=None, workers=DEFAULT_WORKERS, use_gitignore=True, stats=None):
+    """
+    Recursively search for code files with given extensions in the root directory,
+    while skipping directories listed in exclude_dirs and ignoring any file
+    that starts with 'nocode_'.
+
+    Paths matched by a .gitignore or .nocodeignore at any level are skipped
+    (ignored directories are not entered at all), as are binary files.
+    Directories are listed with os.scandir one tree level at a time, with the
+    directories of a level spread over a thread pool.
+
+    Args:
+        root (str): The root directory to start searching.
+        extensions (tuple): A tuple of file extensions to include (e.g., ('.py', '.html', '.css', '.js')).
+        exclude_dirs (set, optional): A set of directory names to exclude. Defaults to an empty set.
+        workers (int): Number of threads used for listing directories. 1 disables the pool.
+        use_gitignore (bool): If False, .gitignore files are not honored (.nocodeignore still is).
+        stats (dict, optional): Filled with the skip counters from new_scan_stats().
+
+    Returns:
+        list: A sorted list of full paths to the matching files.
+    """
+    if exclude_dirs is None:
+        exclude_dirs = set()
+    if stats is None:
+        stats = new_scan_stats()
+    collected = []
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        level = [(root, "", ())]
+        while level:
+            next_level = []
+            scan = lambda d: _scan_directory(d[0], d[1], d[2], extensions, exclude_dirs, use_gitignore)
+            count("scan.dirs_listed", len(level))
+            for files, subdirs, dir_stats in ordered_map(executor, scan, level, window=max(workers, 1) * 4):
+                collected.extend(files)
+                next_level.extend(subdirs)
+                for key, value in dir_stats.items():
+                    stats[key] += value
+                count_stats("scan", dir_stats)
+            level = next_level
+    finally:
+        if executor:
+            executor.shutdown()
+    count("scan.files_found", len(collected))
+    return sorted(collected)
+
+
+def format_scan_stats(stats):
+    """Returns a one-line summary of what gather_code_files skipped."""
+    return (f"Skipped {stats['ignored_files']} ignored file(s) ({stats['ignored_bytes']} bytes), "
+            f"{stats['ignored_dirs']} ignored director(ies) and "
+            f"{stats['binary_files']} binary file(s) ({stats['binary_bytes']} bytes).")
+
+
+def manifest_path_for(output_file):
+    """Returns the path of the manifest that belongs to an output file."""
+    return output_file + ".manifest.json"
+
+
+def relative_posix_path(path, root):
+    """Returns 'path' relative to 'root', always using forward slashes."""
+    return os.path.relpath(path, root).replace("\\", "/")
+
+
+def load_manifest(manifest_path, output_file):
+    """
+    Loads the manifest for a previous build, if it is still usable.
+
+    The manifest is discarded when it is missing, unreadable, written by a
+    different manifest version, or when the output file it describes has been
+    modified or removed since (the cached section offsets would be wrong).
+
+    Args:
+        manifest_path (str): Path of the manifest JSON file.
+        output_file (str): Path of the output file the manifest describes.
+
+    Returns:
+        dict or None: The manifest, or None if a full rebuild is required.
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+
+    try:
+        st = os.stat(output_file)
+    except OSError:
+        return None
+    output_info = manifest.get("output", {})
+    if output_info.get("size") != st.st_size or output_info.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return manifest
+
+
+@timed("manifest")
+def save_manifest(manifest_path, manifest):
+    """Writes the manifest atomically (temp file + os.replace)."""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def decode_source(raw):
+    """
+    Decodes file bytes the same way the builders always have: UTF-8 with
+    undecodable bytes dropped and universal newlines (as text-mode open() does).
+    """
+    text = raw.decode("utf-8", errors="ignore")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class SourceDecoder:
+    """
+    Incremental version of decode_source for chunked reads. A '\r' at the end
+    of a chunk is held back until the next chunk shows whether it starts '\r\n'.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._pending_cr = False
+
+    def decode(self, data, final=False):
+        text = self._decoder.decode(data, final)
+        if self._pending_cr:
+            text = "\r" + text
+            self._pending_cr = False
+        if not final and text.endswith("\r"):
+            text = text[:-1]
+            self._pending_cr = True
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def render_section(relative_path, text):
+    """Returns the '--- Start of X --- ... --- End of X ---' block for one file."""
+    return f"--- Start of {relative_path} ---\n{text}\n--- End of {relative_path} ---\n\n"
+
+
+def _section_body(relative_path, section):
+    """The text of a rendered section without its start and end lines (see render_section)."""
+    head = len(f"--- Start of {relative_path} ---\n".encode("utf-8"))
+    tail = len(f"\n--- End of {relative_path} ---\n\n".encode("utf-8"))
+    return section[head:len(section) - tail].decode("utf-8")
+
+
+def _file_sha256(path):
+    """SHA-256 of a file, read in CHUNK_SIZE pieces."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def render_error_section(relative_path, error):
+    """Returns the section written in place of a file that could not be read."""
+    return render_section(relative_path, f"\n!!! Error reading file {relative_path}: {error} !!!\n")
+
+
+def _render_oversized(path, relative_path, size, max_file_bytes, oversize):
+    """
+    Renders the section of a file larger than max_file_bytes without reading
+    more of it than the policy needs.
+
+    'truncate' keeps the first max_file_bytes (cut back to the last full line).
+    'summarize' keeps only the first SUMMARY_HEAD_LINES lines plus the size and
+    line count, which takes one chunked pass over the file.
+
+    Returns:
+        tuple: (section bytes, sha256 hex digest or None if the file was not read fully).
+    """
+    with open(path, "rb") as infile:
+        if oversize == "truncate":
+            raw = infile.read(max_file_bytes)
+            cut = raw.rfind(b"\n")
+            if cut > 0:
+                raw = raw[:cut + 1]
+            note = f"\n... [truncated: showing {len(raw)} of {size} bytes] ..."
+            return render_section(relative_path, decode_source(raw) + note).encode("utf-8"), None
+
+        hasher = hashlib.sha256()
+        head = []
+        head_bytes = 0
+        line_count = 0
+        while True:
+            chunk = infile.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            if line_count < SUMMARY_HEAD_LINES and head_bytes < max_file_bytes:
+                head.append(chunk)
+                head_bytes += len(chunk)
+            line_count += chunk.count(b"\n")
+
+    # The head is capped at max_file_bytes too, for minified single-line files.
+    head_raw = b"".join(head)[:max_file_bytes]
+    head_text = decode_source(head_raw).split("\n")[:SUMMARY_HEAD_LINES]
+    note = (f"\n... [summarized: {size} bytes, {line_count} lines; "
+            f"only the first {len(head_text)} lines are shown] ...")
+    section = render_section(relative_path, "\n".join(head_text) + note)
+    return section.encode("utf-8"), hasher.hexdigest()
+
+
+def outline_targets(code_files, root_dir, focus_patterns):
+    """
+    Returns the relative paths to render as outlines: every file that matches
+    none of the focus globs (focus files stay verbatim).
+    """
+    targets = set()
+    for f in code_files:
+        relative_path = relative_posix_path(f, root_dir)
+        if not any(fnmatch.fnmatch(relative_path, pattern) for pattern in focus_patterns):
+            targets.add(relative_path)
+    return targets
+
+
+@timed("read")
+def _load_section(path, relative_path, cached, max_file_bytes=None, oversize="truncate", limit=None, outline=False,
+                  compact=None, dedup=None):
+    """
+    Does the per-file I/O for build_context_file: stat, and if the manifest
+    entry does not match, read, hash and render the section.
+
+    Files above STREAM_THRESHOLD are not read here; they are flagged so the
+    writer can stream them straight into the output in CHUNK_SIZE pieces.
+    'limit' is a per-file byte cap (e.g. from the token budget) that truncates
+    the file regardless of the global max_file_bytes policy. With 'outline'
+    the file is rendered as an outline (see nocode_outline.py) when its type
+    supports it; size limits do not apply to outlines. With 'compact' (the
+    lockfile policy, 'skip' or 'minify') files that are inlined in full are
+    compacted; large JSON files are minified while they are streamed. With
+    'dedup', files to be streamed are hashed up front, so a duplicate is
+    known before anything is written.
+
+    Returns:
+        dict: 'stat' and 'sha256', plus 'section' (bytes) when the file changed,
+              'stream' when the writer must copy it, or 'error' when the file
+              could not be read. 'compacted' holds (bytes before, bytes after).
+    """
+    try:
+        st = os.stat(path)
+        if cached and (cached.get("limit") != limit or cached.get("outline", False) != outline):
+            # The cached section was cut to a different length or rendered differently.
+            cached = None
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return {"stat": st, "sha256": cached["sha256"], "section": None}
+        if outline:
+            with open(path, "rb") as infile:
+                raw = infile.read()
+            count("bytes_read", len(raw))
+            digest = hashlib.sha256(raw).hexdigest()
+            if cached and cached["sha256"] == digest:
+                return {"stat": st, "sha256": digest, "section": None}
+            outlined = render_outline(relative_path, decode_source(raw))
+            if outlined is not None:
+                section = render_section(relative_path, f"{OUTLINE_NOTE}\n{outlined}").encode("utf-8")
+                return {"stat": st, "sha256": digest, "section": section, "outlined": True}
+        if compact == "skip" and is_lockfile(relative_path):
+            note = lockfile_note(st.st_size)
+            section = render_section(relative_path, note).encode("utf-8")
+            return {"stat": st, "sha256": None, "section": section, "compacted": (st.st_size, len(note))}
+        if limit is not None and st.st_size > limit:
+            section, digest = _render_oversized(path, relative_path, st.st_size, limit, "truncate")
+            return {"stat": st, "sha256": digest, "section": section, "oversized": True}
+        if max_file_bytes is not None and st.st_size > max_file_bytes:
+            section, digest = _render_oversized(path, relative_path, st.st_size, max_file_bytes, oversize)
+            return {"stat": st, "sha256": digest, "section": section, "oversized": True}
+        if st.st_size > STREAM_THRESHOLD and not (compact and relative_path.endswith((".py", ".js", ".jsx", ".css"))):
+            # Compacting code needs the whole file; JSON is minified while it is streamed.
+            if dedup:
+                return {"stat": st, "stream": True, "sha256": _file_sha256(path)}
+            return {"stat": st, "stream": True}
+        with open(path, "rb") as infile:
+            raw = infile.read()
+        count("bytes_read", len(raw))
+        digest = hashlib.sha256(raw).hexdigest()
+        if cached and cached["sha256"] == digest:
+            return {"stat": st, "sha256": digest, "section": None}
+        text = decode_source(raw)
+        compacted = compact_text(relative_path, text, compact) if compact else None
+        if compacted is not None:
+            section = render_section(relative_path, compacted).encode("utf-8")
+            return {"stat": st, "sha256": digest, "section": section, "compacted": (len(raw), len(compacted.encode("utf-8")))}
+        section = render_section(relative_path, text).encode("utf-8")
+        return {"stat": st, "sha256": digest, "section": section}
+    except Exception as e:
+        return {"error": e}
+
+
+@timed("stream")
+def _stream_section(outfile, path, relative_path, minify=False):
+    """
+    Copies one large file into the output as a section, CHUNK_SIZE bytes at a
+    time, hashing it on the way (and minifying it with 'minify', for JSON).
+    Memory use does not depend on the file size.
+
+    Returns:
+        str: sha256 hex digest of the file content.
+    """
+    hasher = hashlib.sha256()
+    decoder = SourceDecoder()
+    minifier = JsonMinifier() if minify else None
+    with open(path, "rb") as infile:
+        outfile.write(f"--- Start of {relative_path} ---\n".encode("utf-8"))
+        while True:
+            chunk = infile.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            count("bytes_read", len(chunk))
+            hasher.update(chunk)
+            text = decoder.decode(chunk)
+            outfile.write((minifier.feed(text) if minifier else text).encode("utf-8"))
+        text = decoder.decode(b"", final=True)
+        outfile.write((minifier.feed(text) + minifier.finish() if minifier else text).encode("utf-8"))
+        outfile.write(f"\n--- End of {relative_path} ---\n\n".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def load_file_section(path, relative_path, cached=None, max_file_bytes=None, oversize="truncate", limit=None, outline=False,
+                      compact=None):
+    """
+    Renders one file's section in memory exactly as build_context_file writes
+    it, large files included (used by watch mode to patch single sections).
+
+    Returns:
+        dict: 'stat' and 'sha256', plus 'section' (bytes, or None when the
+              cached manifest entry still matches), or 'error'.
+    """
+    result = _load_section(path, relative_path, cached, max_file_bytes, oversize, limit, outline, compact)
+    if result.get("stream"):
+        buffer = io.BytesIO()
+        minify = bool(compact) and relative_path.endswith(".json")
+        try:
+            digest = _stream_section(buffer, path, relative_path, minify)
+        except Exception as e:
+            return {"error": e}
+        if cached and cached["sha256"] == digest and cached.get("limit") == limit and not cached.get("outline", False):
+            return {"stat": result["stat"], "sha256": digest, "section": None}
+        section = buffer.getvalue()
+        result = {"stat": result["stat"], "sha256": digest, "section": section}
+        if minify:
+            result["compacted"] = (result["stat"].st_size, len(section) - len(render_section(relative_path, "").encode("utf-8")))
+    return result
+
+
+@timed("copy")
+def _copy_range(src, dst, offset, length):
+    """Copies 'length' bytes at 'offset' of src into dst, in CHUNK_SIZE pieces."""
+    src.seek(offset)
+    remaining = length
+    while remaining > 0:
+        chunk = src.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise IOError("previous output is shorter than its manifest says")
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+def _segment_key(data):
+    """Identity of a fixed piece of output text (header, footer, marker) in the manifest layout."""
+    return "text:" + hashlib.sha256(data).hexdigest()
+
+
+def common_prefix_bytes(old_layout, new_layout):
+    """Length of the leading output segments that are identical in two manifest layouts."""
+    total = 0
+    for old, new in zip(old_layout, new_layout):
+        if new[0] is None or old != new:
+            break
+        total += new[1]
+    return total
+
+
+@timed("build")
+def build_context_file(output_file, code_files, root_dir, header="", footer="", full=False,
+                       workers=DEFAULT_WORKERS, max_file_bytes=None, oversize="truncate", file_limits=None,
+                       outline_files=None, keep_order=False, breakpoints=None, reuse_from=None, compact=None,
+                       dedup=None):
+    """
+    Writes the combined context file, reusing sections of the previous build
+    for files that have not changed.
+
+    A file is considered unchanged when its size and mtime match the manifest
+    (the file is not even opened), or when its content hash matches (the file
+    was touched but not modified). Everything else is read and rendered again.
+    Reads run on a bounded thread pool; sections are written in sorted order
+    unless keep_order is set.
+    Large files and reused sections are copied in chunks, so peak memory stays
+    flat however big the inputs are.
+    The output is written to a temp file and moved into place with os.replace,
+    so an interrupted run never leaves a half-written context behind.
+
+    Args:
+        output_file (str): Path of the combined output file.
+        code_files (list): Paths of the code files to include.
+        root_dir (str): Project root; section names are relative to it.
+        header (str): Text written before the file sections.
+        footer (str): Text written after the file sections.
+        full (bool): If True, ignore any previous manifest and rebuild everything.
+        workers (int): Number of reader threads. 1 reads serially.
+        max_file_bytes (int, optional): Files larger than this are not inlined
+                                        in full; see 'oversize'.
+        oversize (str): 'truncate' or 'summarize', the policy for files above
+                        max_file_bytes.
+        file_limits (dict, optional): {relative_path: max_bytes} for files that
+                                      must be truncated individually.
+        outline_files (set, optional): Relative paths rendered as outlines
+                                       (signatures only) instead of verbatim.
+        keep_order (bool): If True, write the sections in the order of code_files.
+        breakpoints (dict, optional): {relative_path: marker text} written right
+                                      after that file's section.
+        reuse_from (str, optional): Another context file, built with the same size
+                                    policy, whose sections are copied instead of
+                                    this file's previous build (used by batch
+                                    builds that share one pass over the code).
+        compact (str, optional): Compact the sections (see nocode_compact.py);
+                                 the value is the lockfile policy, 'skip' or 'minify'.
+        dedup (str, optional): 'files' or 'chunks': replace repeated content by
+                               references to its first copy (see nocode_dedup.py).
+                               A reused section whose references would change is
+                               rendered again.
+
+    Returns:
+        dict: Counts of 'reused', 'rendered', 'oversized', 'outlined' and 'errors'
+              sections, plus 'output_bytes', 'prefix_bytes' (how much of the
+              output is identical to the start of the previous build) and
+              'breakpoint_offsets' (output offset right after each marker),
+              'compacted': {relative_path: (bytes before, bytes after)}, and the
+              'duplicates', 'dedup_chunks' and 'dedup_saved' (bytes) of dedup.
+    """
+    options = {"max_file_bytes": max_file_bytes, "oversize": oversize}
+    if compact:
+        options["compact"] = compact
+    if dedup:
+        options["dedup"] = dedup
+    manifest_path = manifest_path_for(output_file)
+    previous = load_manifest(manifest_path, output_file)
+    if previous and previous.get("options") != options:
+        # Cached sections were rendered under a different size policy.
+        previous = None
+    # The layout of the previous build: [segment key, length] per header, section, marker and footer.
+    previous_layout = previous.get("layout", []) if previous else []
+    source_file = output_file
+    if reuse_from:
+        source_file = reuse_from
+        previous = load_manifest(manifest_path_for(reuse_from), reuse_from)
+        if previous and previous.get("options") != options:
+            previous = None
+    if full:
+        previous = None
+    previous_files = previous["files"] if previous else {}
+
+    stats = {"reused": 0, "rendered": 0, "oversized": 0, "outlined": 0, "errors": 0,
+             "duplicates": 0, "dedup_chunks": 0, "dedup_saved": 0}
+    dedup_index = DedupIndex(dedup) if dedup else None
+    compacted = {}
+    new_files = {}
+    tmp_output = output_file + ".tmp"
+
+    # Sort the files for consistent order.
+    jobs = [(f, relative_posix_path(f, root_dir)) for f in (code_files if keep_order else sorted(code_files))]
+    file_limits = file_limits or {}
+    outline_files = outline_files or set()
+    breakpoints = breakpoints or {}
+    layout = []
+    breakpoint_offsets = []
+    load = lambda job: _load_section(job[0], job[1], previous_files.get(job[1]), max_file_bytes, oversize,
+                                     file_limits.get(job[1]), job[1] in outline_files, compact, dedup)
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    previous_output = open(source_file, "rb") if previous else None
+    try:
+        with open(tmp_output, "wb") as outfile:
+            data = header.encode("utf-8")
+            outfile.write(data)
+            layout.append([_segment_key(data), len(data)])
+
+            for (f, relative_path), result in zip(jobs, ordered_map(executor, load, jobs, window=workers * 4)):
+                offset = outfile.tell()
+                limit = file_limits.get(relative_path)
+                outline = relative_path in outline_files
+                # Identical content renders identically only for the same type and size policy.
+                rendering = (os.path.splitext(relative_path)[1], is_lockfile(relative_path), limit, outline)
+                duplicate_of = None
+                chunks = refs = registrations = None
+                dedup_saved = 0
+                try:
+                    if "error" in result:
+                        raise result["error"]
+                    if dedup_index is not None and result.get("sha256"):
+                        duplicate_of = dedup_index.duplicate_of((result["sha256"],) + rendering)
+                        if duplicate_of is None and "section" in result and result["section"] is None:
+                            # A cached section can only be copied if its references come out the same.
+                            cached = previous_files[relative_path]
+                            if dedup == "chunks":
+                                chunks = cached.get("chunks", [])
+                                refs, registrations = dedup_index.plan(relative_path, chunks)
+                            if cached.get("duplicate_of") or (dedup == "chunks" and (refs if any(refs) else None) != cached.get("refs")):
+                                result = _load_section(f, relative_path, None, max_file_bytes, oversize, limit, outline, compact, dedup)
+                                chunks = refs = registrations = None
+                                if "error" in result:
+                                    raise result["error"]
+                    digest = result.get("sha256")
+                    saved = result.get("compacted")
+                    if duplicate_of is not None:
+                        outfile.write(render_section(relative_path, duplicate_note(duplicate_of)).encode("utf-8"))
+                        dedup_saved = max(0, new_files[duplicate_of]["length"] - (outfile.tell() - offset))
+                        saved = None
+                        stats["duplicates"] += 1
+                    elif result.get("stream"):
+                        minify = bool(compact) and relative_path.endswith(".json")
+                        digest = _stream_section(outfile, f, relative_path, minify)
+                        if minify:
+                            overhead = len(render_section(relative_path, "").encode("utf-8"))
+                            saved = (result["stat"].st_size, outfile.tell() - offset - overhead)
+                        stats["rendered"] += 1
+                    elif result["section"] is None:
+                        cached = previous_files[relative_path]
+                        _copy_range(previous_output, outfile, cached["offset"], cached["length"])
+                        saved = cached.get("saved")
+                        dedup_saved = cached.get("dedup_saved", 0)
+                        stats["reused"] += 1
+                    else:
+                        section = result["section"]
+                        if dedup == "chunks":
+                            body = _section_body(relative_path, section)
+                            chunks = chunk_text(body)
+                            refs, registrations = dedup_index.plan(relative_path, chunks)
+                            if any(refs):
+                                deduped = render_section(relative_path, render_chunks(body, chunks, refs)).encode("utf-8")
+                                dedup_saved = len(section) - len(deduped)
+                                section = deduped
+                        outfile.write(section)
+                        if result.get("outlined"):
+                            stats["outlined"] += 1
+                        elif result.get("oversized"):
+                            stats["oversized"] += 1
+                        else:
+                            stats["rendered"] += 1
+                except Exception as e:
+                    # Error sections are never cached, so the file is retried next run.
+                    outfile.seek(offset)
+                    outfile.truncate()
+                    outfile.write(render_error_section(relative_path, e).encode("utf-8"))
+                    stats["errors"] += 1
+                    layout.append([None, outfile.tell() - offset])
+                    continue
+
+                st = result["stat"]
+                entry = new_files[relative_path] = {
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "sha256": digest,
+                    "offset": offset,
+                    "length": outfile.tell() - offset,
+                    "limit": limit,
+                    "outline": outline,
+                }
+                if saved:
+                    entry["saved"] = list(saved)
+                    compacted[relative_path] = tuple(saved)
+                key_digest = digest
+                if dedup_index is not None:
+                    refs = refs if refs and any(refs) else None
+                    if duplicate_of is not None:
+                        entry["duplicate_of"] = duplicate_of
+                    else:
+                        if digest:
+                            dedup_index.add_file((digest,) + rendering, relative_path)
+                        if dedup == "chunks":
+                            entry["chunks"] = chunks or []
+                            dedup_index.add_chunks(registrations or {})
+                    if refs:
+                        entry["refs"] = refs
+                        stats["dedup_chunks"] += sum(1 for ref in refs if ref)
+                    if dedup_saved:
+                        entry["dedup_saved"] = dedup_saved
+                        stats["dedup_saved"] += dedup_saved
+                    variant = section_variant(duplicate_of, refs)
+                    if variant:
+                        # The bytes also depend on the referenced files.
+                        key_digest = f"{digest}+{variant}"
+                layout.append([f"file:{relative_path}:{key_digest}:{limit}:{outline}", outfile.tell() - offset])
+
+                if relative_path in breakpoints:
+                    data = breakpoints[relative_path].encode("utf-8")
+                    outfile.write(data)
+                    layout.append([_segment_key(data), len(data)])
+                    breakpoint_offsets.append(outfile.tell())
+
+            data = footer.encode("utf-8")
+            outfile.write(data)
+            layout.append([_segment_key(data), len(data)])
+    finally:
+        if previous_output:
+            previous_output.close()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    os.replace(tmp_output, output_file)
+    st = os.stat(output_file)
+    save_manifest(manifest_path, {
+        "version": MANIFEST_VERSION,
+        "options": options,
+        "output": {"size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        "files": new_files,
+        "layout": layout,
+    })
+    stats["output_bytes"] = st.st_size
+    stats["prefix_bytes"] = common_prefix_bytes(previous_layout, layout)
+    stats["breakpoint_offsets"] = breakpoint_offsets
+    stats["compacted"] = compacted
+    count_stats("build", stats)
+    return stats
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Content-addressed deduplication of the context sections ('--dedup').
+
+'files': a file whose content (SHA-256) and rendering are identical to a
+file emitted earlier in the same output keeps its section, path included,
+but the body is replaced by a one-line reference to the first copy.
+
+'chunks': in addition, the remaining sections are cut into content-defined
+chunks of lines. A boundary falls after a line where a rolling hash over
+the last ROLLING_WINDOW (stripped) lines hits the boundary mask, so chunk
+boundaries follow the content and survive lines being inserted above
+them. A chunk of at least MIN_CHUNK_BYTES already emitted earlier (in
+another file or higher up in the same one) is replaced by a note naming
+the lines it repeats; consecutive repeated chunks share one note.
+
+A chunk reference names the file and a line range within that file's
+section as written, counted from the first line after its '--- Start of'
+marker (omitted chunks in it already collapsed to their notes), not lines
+of the output file. So a reference can be followed in the prompt and stays
+the same when sections before it grow or shrink. The chunk list and the
+references of every section are kept in the build manifest, so an unchanged
+section is only reused when its references would come out the same (see
+build_context_file).
+"""
+import hashlib
+import json
+import zlib
+
+DEDUP_MODES = ("files", "chunks")
+
+ROLLING_WINDOW = 3
+# About one line in BOUNDARY_MODULUS ends a chunk, after at least MIN_CHUNK_LINES lines.
+BOUNDARY_MODULUS = 8
+MIN_CHUNK_LINES = 4
+MAX_CHUNK_LINES = 64
+MIN_CHUNK_BYTES = 200
+
+
+def duplicate_note(original):
+    return f"(identical to {original}; content omitted)"
+
+
+def chunk_note(original, first, last):
+    return f"[... lines {first}-{last} of {original} repeated here; omitted ...]"
+
+
+def section_variant(duplicate_of=None, refs=None):
+    """
+    A short tag for the layout key of a section whose bytes depend on other
+    files (a duplicate reference or chunk references), or None.
+    """
+    if duplicate_of is None and not refs:
+        return None
+    data = json.dumps([duplicate_of, refs], separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def chunk_text(text):
+    """
+    Cuts a section body into content-defined chunks of lines.
+
+    Returns:
+        list: [hash, line count, eligible] per chunk, in order; 'eligible' chunks
+              are large enough to be worth replacing by a reference.
+    """
+    lines = text.split("\n")
+    chunks = []
+    start = size = rolling = 0
+    window = []
+    for index, line in enumerate(lines):
+        line_hash = zlib.crc32(line.strip().encode("utf-8"))
+        window.append(line_hash)
+        rolling = (rolling + line_hash) & 0xFFFFFFFF
+        if len(window) > ROLLING_WINDOW:
+            rolling = (rolling - window.pop(0)) & 0xFFFFFFFF
+        size += len(line) + 1
+        count = index + 1 - start
+        if (count >= MIN_CHUNK_LINES and rolling % BOUNDARY_MODULUS == 0) or count >= MAX_CHUNK_LINES \
+                or index == len(lines) - 1:
+            block = "\n".join(lines[start:index + 1]).encode("utf-8")
+            chunks.append([hashlib.sha256(block).hexdigest()[:24], count, size >= MIN_CHUNK_BYTES])
+            start = index + 1
+            size = 0
+    return chunks
+
+
+def _extends(run, ref):
+    """True if chunk reference 'ref' continues the lines of the current run."""
+    return run is not None and run[0] == ref[0] and ref[1] == run[2] + 1
+
+
+def render_chunks(text, chunks, refs):
+    """Returns the section body with every referenced chunk run replaced by its note."""
+    lines = text.split("\n")
+    out = []
+    position = 0
+    run = None
+    for (_, count, _), ref in zip(chunks, refs):
+        if ref and _extends(run, ref):
+            run[2] = ref[2]
+        else:
+            if run:
+                out.append(chunk_note(*run))
+                run = None
+            if ref:
+                run = list(ref)
+            else:
+                out.extend(lines[position:position + count])
+        position += count
+    if run:
+        out.append(chunk_note(*run))
+    return "\n".join(out)
+
+
+class DedupIndex:
+    """
+    What the output written so far contains: the first file of each content
+    (and rendering), and with chunks, where each chunk was emitted.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.files = {}
+        self.chunks = {}
+
+    def duplicate_of(self, key):
+        """The path emitted first with this key ((sha256, limit, outline)), or None."""
+        return self.files.get(key)
+
+    def add_file(self, key, relative_path):
+        self.files.setdefault(key, relative_path)
+
+    def plan(self, relative_path, chunks):
+        """
+        Decides which chunks of a section are references.
+
+        Returns:
+            tuple: (refs, registrations): per chunk [path, first line, last line]
+                   or None, and the chunks this section would add to the index;
+                   pass the latter to add_chunks once the section is written.
+        """
+        refs = []
+        local = {}
+        line = 1
+        run = None
+        for chunk_hash, count, eligible in chunks:
+            found = (self.chunks.get(chunk_hash) or local.get(chunk_hash)) if eligible else None
+            ref = list(found) if found else None
+            if ref:
+                if not _extends(run, ref):
+                    line += 1
+                run = ref
+            else:
+                if eligible:
+                    local.setdefault(chunk_hash, (relative_path, line, line + count - 1))
+                line += count
+                run = None
+            refs.append(ref)
+        return refs, local
+
+    def add_chunks(self, registrations):
+        for chunk_hash, location in registrations.items():
+            self.chunks.setdefault(chunk_hash, location)
+
+
+def format_dedup_stats(stats):
+    return (f"Deduplicated: {stats['duplicates']} identical file(s), {stats['dedup_chunks']} repeated chunk(s), "
+            f"{stats['dedup_saved']} bytes saved.")
@@ -1,5 +1,24 @@
 #!/usr/bin/env python3
 import os
+import re
+import json
+import argparse
+
+from concurrent.futures import ThreadPoolExecutor
+
+from nocode_budget import (count_file_tokens, default_priority, estimate_tokens, pack_files, print_budget_report,
+                           token_cache_name)
+from nocode_compact import LOCKFILE_POLICIES, print_compact_report
+from nocode_container import COMPRESSIONS, pack_context
+from nocode_context import (DEFAULT_WORKERS, OVERSIZE_POLICIES, build_context_file, format_scan_stats, gather_code_files,
+                            load_manifest, manifest_path_for, new_scan_stats, outline_targets, relative_posix_path)
+from nocode_dedup import DEDUP_MODES, format_dedup_stats
+from nocode_history import ChangeHistory, print_history_report
+from nocode_imports import ImportGraph, print_closure_report
+from nocode_metrics import add_metrics_arguments, span, start_metrics, timed
+from nocode_rank import RelevanceIndex, print_relevance_report, select_relevant
+from nocode_shard import format_shard_manifest, pack_shards, print_shard_report
+from nocode_watch import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, LiveContext, watch_context
 
 # --- Constants for Output Structure ---
 
@@ -127,43 +146,633 @@ The JSON structure should be a list of objects, where each object represents a f
 * Make sure the final output is **only** the JSON structure within a json code block. Do not include any explanatory text outside the code block unless specifically requested *before* the JSON block.
 """
 
+EDIT_OUTPUT_INSTRUCTIONS = """
+After completing the task, present **only the changes** as SEARCH/REPLACE blocks instead of full files. Each block names the file on its own line, followed by the exact lines to find and the lines that replace them:
+
+path/to/file.py
+<<<<<<< SEARCH
+    existing lines, copied exactly from the file
+=======
+    the new lines that replace them
+>>>>>>> REPLACE
+
+**Important Instructions:**
+* Put the **relative path** from the project root on the line directly above `<<<<<<< SEARCH`.
+* The SEARCH section must match the current file **exactly**, including indentation. Include just enough surrounding lines to make it unique in the file.
+* Keep blocks small. Use several blocks for changes in different parts of a file, in the order they appear in the file.
+* To delete code, leave the REPLACE section empty.
+* To create a new file, or when most of a file changes, leave the SEARCH section empty: the REPLACE section is then the **full content** of the file.
+* Put all blocks in a single Markdown code block (```text ... ```). Do not include any explanatory text inside the code block.
+"""
+
+# Output instructions and the script that applies the answer, per --output-format.
+OUTPUT_FORMATS = {
+    "json": (JSON_OUTPUT_INSTRUCTIONS, "nocode_apply_llm_changes.py"),
+    "edits": (EDIT_OUTPUT_INSTRUCTIONS, "nocode_apply_llm_edits.py"),
+}
+
+CONTEXT_HEADING = "--- Context: Code Files Below ---\n\n"
+TASK_HEADING = "--- Task ---\n"
+LAYOUTS = ("sorted", "cache")
+
+
+def assemble_prompt(layout, output_instructions, notes="", task=PROMPT_TEMPLATE, preamble=""):
+    """
+    Returns the (header, footer) written around the code sections.
+
+    'sorted' puts the task first. 'cache' keeps everything that changes from
+    task to task at the end, so the longest possible prefix (preamble, files,
+    output instructions) is byte-identical between builds and can be served
+    from a provider's prompt cache. 'notes' are per-build remarks such as the
+    files omitted by the token budget. 'preamble' goes right before the code
+    in both layouts (the shard manifest of --shards).
+    """
+    instructions = "\n--- Task Output Instructions ---\n" + output_instructions
+    if layout == "cache":
+        return preamble + CONTEXT_HEADING, instructions + "\n" + notes + TASK_HEADING + task
+    return task + "\n\n" + preamble + CONTEXT_HEADING + notes, instructions
+
+
+def cache_breakpoints(history, ordered):
+    """Returns {relative_path: marker} placing a breakpoint after the last file of each stability tier."""
+    breakpoints = {}
+    for i, relative_path in enumerate(ordered):
+        tier = history.tier(relative_path)
+        if i + 1 == len(ordered) or history.tier(ordered[i + 1]) != tier:
+            # The marker text does not name the tier, so it stays identical when files move between tiers.
+            breakpoints[relative_path] = f"--- Cache Breakpoint {len(breakpoints) + 1} ---\n\n"
+    return breakpoints
+
+
+def print_prefix_report(output_file, stats):
+    """Prints how much of the output is identical to the start of the previous build."""
+    prefix, total = stats["prefix_bytes"], stats["output_bytes"]
+    with open(output_file, "rb") as f:
+        prefix_tokens = estimate_tokens(f.read(prefix).decode("utf-8", errors="ignore"))
+    share = 100.0 * prefix / total if total else 0.0
+    print(f"Prefix unchanged since the previous build: {prefix} of {total} bytes ({share:.1f}%, ~{prefix_tokens} tokens).")
+    offsets = stats["breakpoint_offsets"]
+    if offsets:
+        intact = sum(1 for offset in offsets if offset <= prefix)
+        print(f"Cache breakpoints still inside the unchanged prefix: {intact} of {len(offsets)}.")
+
 # --- Core Logic ---
 
-def gather_code_files(root, extensions, exclude_dirs=None):
+class SharedIndexes:
+    """
+    The project-wide caches under 'instance/' (change history, import graph,
+    relevance index, token counts). Each is loaded and updated over all
+    scanned files at most once per run, on first use, and then shared by
+    every prompt built in that run.
+    """
+
+    def __init__(self, code_files, root_dir, output_dir, executor, window):
+        self.code_files = code_files
+        self.root_dir = root_dir
+        self.output_dir = output_dir
+        self.executor = executor
+        self.window = window
+        self._history = None
+        self._graph = None
+        self._relevance = None
+        self._tokens = {}
+
+    def history(self):
+        if self._history is None:
+            # Record which files changed since the last build (over all scanned files, before any filtering).
+            history_path = os.path.join(self.output_dir, "change_history.json")
+            with span("history"):
+                self._history = ChangeHistory.load(history_path)
+                changed = self._history.update(self.code_files, self.root_dir, executor=self.executor, window=self.window)
+                self._history.save(history_path)
+            print(f"Change history updated ({changed} file(s) changed since the previous build).")
+        return self._history
+
+    def graph(self):
+        if self._graph is None:
+            graph_path = os.path.join(self.output_dir, "import_graph.json")
+            with span("imports"):
+                self._graph = ImportGraph.load(graph_path)
+                reparsed = self._graph.update(self.code_files, self.root_dir, executor=self.executor, window=self.window)
+                self._graph.save(graph_path)
+            print(f"Import graph updated ({reparsed} file(s) re-parsed).")
+        return self._graph
+
+    def relevance(self):
+        if self._relevance is None:
+            index_path = os.path.join(self.output_dir, "relevance_index.json")
+            with span("relevance"):
+                self._relevance = RelevanceIndex.load(index_path)
+                reindexed = self._relevance.update(self.code_files, self.root_dir, executor=self.executor, window=self.window)
+                self._relevance.save(index_path)
+            print(f"Relevance index updated ({reindexed} file(s) re-indexed).")
+        return self._relevance
+
+    def token_counts(self, compact=None, outline=False):
+        """Token estimates of every file as rendered with this --compact policy, as outlines or verbatim."""
+        key = (compact, outline)
+        if key not in self._tokens:
+            with span("tokens"):
+                cache_path = os.path.join(self.output_dir, token_cache_name(compact, outline))
+                self._tokens[key] = count_file_tokens(self.code_files, self.root_dir, cache_path, executor=self.executor,
+                                                      window=self.window, compact=compact, outline=outline)
+        return self._tokens[key]
+
+
+@timed("plan")
+def plan_prompt(options, task, shared):
     """
-    Recursively search for code files with given extensions in the root directory,
-    while skipping directories listed in exclude_dirs and ignoring any file
-    that starts with 'nocode_'.
+    Selects and orders the files for one prompt and assembles its header and
+    footer, printing the report of every selection step.
 
     Args:
-        root (str): The root directory to start searching.
-        extensions (tuple): A tuple of file extensions to include (e.g., ('.py', '.html', '.css', '.js')).
-        exclude_dirs (set, optional): A set of directory names to exclude. Defaults to an empty set.
+        options (argparse.Namespace): The prompt options (see main()).
+        task (str): The task text; it is scored for relevance and written into the prompt.
+        shared (SharedIndexes): The project caches.
 
     Returns:
-        list: A list of full paths to the matching files.
+        dict: 'code_files', 'header', 'footer', 'file_limits', 'outline_files',
+              'keep_order' and 'breakpoints' for build_context_file, plus 'applier'
+              and the budget 'notes'.
+
+    Raises:
+        ValueError: If --seed is given but none of the seeds is a code file.
     """
-    if exclude_dirs is None:
-        exclude_dirs = set()
-    collected = []
+    root_dir = shared.root_dir
+    code_files = list(shared.code_files)
+    scores = None
+
+    # Optionally keep only the seed files and their transitive imports.
+    if options.seed:
+        graph = shared.graph()
+        seeds = [relative_posix_path(os.path.join(root_dir, seed), root_dir) for seed in options.seed]
+        missing = [seed for seed in seeds if seed not in graph.files]
+        for seed in missing:
+            print(f"Warning: Seed file not found among the code files: {seed}")
+        if len(missing) == len(seeds):
+            # An empty closure would give a prompt without any code.
+            raise ValueError("none of the --seed files was found among the code files")
+        selected = graph.closure([seed for seed in seeds if seed not in missing], options.depth, options.reverse_depth)
+        print_closure_report(selected, len(code_files))
+        code_files = [f for f in code_files if relative_posix_path(f, root_dir) in selected]
+
+    # Optionally keep only the files most relevant to the task text.
+    if options.top_files is not None:
+        current = {relative_posix_path(f, root_dir) for f in code_files}
+        scores = {p: score for p, score in shared.relevance().score(task).items() if p in current}
+        keep = select_relevant(scores, options.top_files, options.floor)
+        print_relevance_report(scores, keep)
+        keep = set(keep)
+        code_files = [f for f in code_files if relative_posix_path(f, root_dir) in keep]
+
+    output_instructions, applier = OUTPUT_FORMATS[options.output_format]
+    header, footer = assemble_prompt(options.layout, output_instructions, task=task)
+    file_limits = None
+    notes = ""
+
+    # Optionally render everything outside the focus set (and the seeds) as outlines.
+    outline_files = None
+    if options.outline:
+        focus = options.focus + [relative_posix_path(os.path.join(root_dir, seed), root_dir) for seed in options.seed]
+        outline_files = outline_targets(code_files, root_dir, focus)
+
+    # Optionally pack the files into a token budget, highest priority first.
+    if options.token_budget is not None:
+        fixed_tokens = estimate_tokens(header) + estimate_tokens(footer)
+        # Measured as they will be rendered, so the budget matches the output.
+        verbatim_counts = shared.token_counts(options.compact)
+        outline_counts = shared.token_counts(options.compact, outline=True) if outline_files else {}
+        measured = {}
+        for f in code_files:
+            counts = outline_counts if relative_posix_path(f, root_dir) in (outline_files or ()) else verbatim_counts
+            if f in counts:
+                measured[f] = counts[f]
+        priority = lambda relative_path: default_priority(relative_path, options.priority)
+        if scores:
+            # Relevance lifts a file by up to four priority levels.
+            best = max(scores.values()) or 1.0
+            priority = lambda relative_path: (default_priority(relative_path, options.priority)
+                                              + 4.0 * scores.get(relative_path, 0.0) / best)
+        # The note listing the omitted files is part of the prompt too: re-pack until it fits.
+        reserved = 0
+        for _ in range(4):
+            plans = pack_files(measured, options.token_budget - fixed_tokens - reserved, priority)
+            omitted = sorted(plan["relative_path"] for plan in plans.values() if plan["mode"] == "omitted")
+            omitted_note = "--- Files omitted to fit the token budget: " + ", ".join(omitted) + " ---\n\n" if omitted else ""
+            if estimate_tokens(omitted_note) <= reserved:
+                break
+            reserved = estimate_tokens(omitted_note)
+        print_budget_report(plans, options.token_budget, fixed_tokens + estimate_tokens(omitted_note))
+
+        code_files = [p for p, plan in plans.items() if plan["mode"] != "omitted"]
+        file_limits = {plan["relative_path"]: plan["max_bytes"] for plan in plans.values() if plan["mode"] == "truncated"}
+        if omitted:
+            notes += omitted_note
+            header, footer = assemble_prompt(options.layout, output_instructions, notes, task=task)
+
+    # Optionally order the files most stable first, with a cache breakpoint after each stability tier.
+    breakpoints = None
+    if options.layout == "cache":
+        history = shared.history()
+        by_relative_path = {relative_posix_path(f, root_dir): f for f in code_files}
+        ordered = history.stable_order(by_relative_path)
+        print_history_report(history, ordered)
+        breakpoints = cache_breakpoints(history, ordered)
+        code_files = [by_relative_path[relative_path] for relative_path in ordered]
+
+    return {
+        "code_files": code_files,
+        "header": header,
+        "footer": footer,
+        "file_limits": file_limits,
+        "outline_files": outline_files,
+        "keep_order": options.layout == "cache",
+        "breakpoints": breakpoints,
+        "applier": applier,
+        "notes": notes,
+    }
+
+
+# Per-task keys a batch file may set, overriding the command-line option of the same name.
+BATCH_OPTIONS = {
+    "top_files": int, "floor": list, "seed": list, "depth": int, "reverse_depth": int, "token_budget": int,
+    "priority": list, "outline": bool, "focus": list, "output_format": str, "layout": str,
+}
+BATCH_CHOICES = {"output_format": tuple(OUTPUT_FORMATS), "layout": LAYOUTS}
 
-    # Walk through the directory tree
-    for dirpath, dirnames, filenames in os.walk(root, topdown=True):
-        # Exclude specified directories (by name)
-        # Modify dirnames in place to prevent descending into excluded folders
-        dirnames[:] = [d for d in dirnames if d not in exclude_dirs]
 
-        for filename in filenames:
-            # Skip any file that starts with "nocode_"
-            if filename.startswith("nocode_"):
+def load_batch_tasks(batch_path):
+    """
+    Reads a JSONL file of tasks, one object per line:
+    {"id": "...", "task": "task text", <optional BATCH_OPTIONS overrides>}.
+    Blank lines are skipped; invalid lines and options are reported and skipped.
+
+    Returns:
+        list: (task_id, task_text, {option: value}) tuples, in file order.
+    """
+    tasks = []
+    used_ids = set()
+    with open(batch_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
                 continue
-            # Check if the file's extension is one we want to include
-            if filename.endswith(extensions):
-                full_path = os.path.join(dirpath, filename)
-                collected.append(full_path)
-    return collected
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                print(f"Warning: Skipping line {line_number} of {batch_path}: invalid JSON ({e}).")
+                continue
+            if not isinstance(entry, dict) or not isinstance(entry.get("task"), str):
+                print(f"Warning: Skipping line {line_number} of {batch_path}: no 'task' text.")
+                continue
+            # Task ids become file names.
+            task_id = re.sub(r"[^\w.-]+", "_", str(entry.get("id") or "")).strip("._") or f"task-{line_number}"
+            while task_id in used_ids:
+                task_id += "_"
+            used_ids.add(task_id)
+
+            overrides = {}
+            for key, value in entry.items():
+                if key in ("id", "task"):
+                    continue
+                kind = BATCH_OPTIONS.get(key)
+                if kind is list and isinstance(value, str):
+                    value = [value]
+                valid = (kind is not None and isinstance(value, kind) and not (kind is int and isinstance(value, bool))
+                         and (key not in BATCH_CHOICES or value in BATCH_CHOICES[key]))
+                if not valid:
+                    print(f"Warning: Ignoring option '{key}' of task {task_id}: unknown option or invalid value.")
+                    continue
+                overrides[key] = value
+            tasks.append((task_id, "\n" + entry["task"].strip() + "\n", overrides))
+    return tasks
+
+
+def build_shared_sections(args, shared, out_dir):
+    """
+    Renders every scanned file's section once into 'shared_sections.txt' in
+    out_dir (reused between runs through its manifest) and returns its path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    sections_file = os.path.join(out_dir, "shared_sections.txt")
+    stats = build_context_file(sections_file, shared.code_files, shared.root_dir, full=args.full, workers=args.workers,
+                               max_file_bytes=args.max_file_bytes, oversize=args.oversize, compact=args.compact,
+                               dedup=args.dedup)
+    print_compact_report(stats["compacted"])
+    print(f"Shared sections: reused {stats['reused']}, re-read {stats['rendered']}, errors {stats['errors']}.")
+    return sections_file
+
+
+def write_prompts(args, shared, jobs, sections_file):
+    """
+    Writes planned prompts in parallel, copying their sections out of the
+    shared sections file.
+
+    Args:
+        jobs (list): (name, output_file, plan) tuples; see plan_prompt.
+
+    Returns:
+        list: (build stats, None) or (None, exception) per job, in order.
+    """
+    def build(job):
+        _, output_file, plan = job
+        try:
+            return build_context_file(
+                output_file, plan["code_files"], shared.root_dir, header=plan["header"], footer=plan["footer"],
+                workers=1, max_file_bytes=args.max_file_bytes, oversize=args.oversize,
+                file_limits=plan["file_limits"], outline_files=plan["outline_files"],
+                keep_order=plan["keep_order"], breakpoints=plan["breakpoints"], reuse_from=sections_file,
+                compact=args.compact, dedup=args.dedup,
+            ), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as pool:
+        return list(pool.map(build, jobs))
+
+
+def run_batch(args, shared, batch_dir):
+    """
+    Builds one prompt file per task of the --batch file.
+
+    The code is scanned once (by the caller) and read once: every file's
+    section is rendered into a shared sections file, itself reused between
+    runs through its manifest. The prompts are then planned one after the
+    other with the shared indexes, and written in parallel by copying byte
+    ranges out of the shared file. An index of the outputs is written to
+    'index.json' in batch_dir.
+
+    Returns:
+        bool: True if every task's prompt was written, False if any task was
+              skipped or failed.
+    """
+    tasks = load_batch_tasks(args.batch)
+    print(f"Loaded {len(tasks)} task(s) from '{args.batch}'.")
+
+    # 1. One pass over the code, shared by every prompt.
+    sections_file = build_shared_sections(args, shared, batch_dir)
+
+    # 2. Plan every prompt (selection, budget, order); reports are printed task by task.
+    jobs = []
+    skipped = {}
+    for task_id, task, overrides in tasks:
+        print("=" * 30)
+        print(f"=== Task {task_id} ===")
+        options = argparse.Namespace(**{**vars(args), **overrides})
+        try:
+            plan = plan_prompt(options, task, shared)
+        except ValueError as e:
+            print(f"Error: Task {task_id} skipped: {e}")
+            skipped[task_id] = e
+            continue
+        jobs.append((task_id, os.path.join(batch_dir, f"{task_id}.txt"), plan))
+    shared.executor.shutdown()
+
+    # 3. Write the prompts in parallel; each copies its sections from the shared file.
+    results = write_prompts(args, shared, jobs, sections_file)
+
+    index = []
+    print("=" * 30)
+    print("--- Batch Outputs ---")
+    built = {job[0]: (job, result) for job, result in zip(jobs, results)}
+    for task_id, _, _ in tasks:
+        if task_id in skipped:
+            index.append({"id": task_id, "error": str(skipped[task_id])})
+            print(f"  {task_id}: SKIPPED ({skipped[task_id]})")
+            continue
+        (_, output_file, plan), (stats, error) = built[task_id]
+        entry = {"id": task_id, "output": os.path.abspath(output_file), "files": len(plan["code_files"]),
+                 "applier": plan["applier"]}
+        if error is not None:
+            entry["error"] = str(error)
+            print(f"  {task_id}: FAILED ({error})")
+        else:
+            entry.update(bytes=stats["output_bytes"], reused=stats["reused"], errors=stats["errors"],
+                         rendered=stats["rendered"] + stats["oversized"] + stats["outlined"])
+            print(f"  {task_id}: {entry['files']} file(s), {stats['output_bytes']} bytes -> {output_file}")
+        index.append(entry)
+
+    index_path = os.path.join(batch_dir, "index.json")
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"batch": os.path.abspath(args.batch), "tasks": index}, f, indent=2)
+    os.replace(tmp_path, index_path)
+    print(f"Wrote the index of {len(index)} prompt(s) to '{os.path.abspath(index_path)}'.")
+    failed = [entry["id"] for entry in index if "error" in entry]
+    if failed:
+        print(f"Error: {len(failed)} of {len(index)} task(s) failed: {', '.join(failed)}")
+    print("=" * 30)
+    return not failed
+
+
+SHARD_FILE = re.compile(r"^shard-\d+-of-\d+\.(?:txt|txt\.manifest\.json|nocx)$")
+
+
+def section_token_counts(sections_file):
+    """
+    Estimates the tokens of every file's section in a shared sections file
+    (markers included), from the rendered sections rather than the sources.
+
+    Returns:
+        dict: {relative_path: tokens}.
+    """
+    manifest = load_manifest(manifest_path_for(sections_file), sections_file)
+    if manifest is None:
+        raise OSError(f"no current manifest for {sections_file}")
+    counts = {}
+    with open(sections_file, "rb") as f:
+        for relative_path, entry in sorted(manifest["files"].items(), key=lambda item: item[1]["offset"]):
+            f.seek(entry["offset"])
+            counts[relative_path] = estimate_tokens(f.read(entry["length"]).decode("utf-8", errors="ignore"))
+    return counts
+
+
+def run_shards(args, shared, shard_dir):
+    """
+    Splits the selected files across several prompt files (--shards /
+    --shard-tokens) for models with smaller context windows.
+
+    The code is scanned and read once: sections are rendered into a shared
+    sections file, measured there, packed into shards (see nocode_shard) and
+    copied into the shard prompts in parallel. Every shard starts with the
+    same manifest listing the files of all shards. Shard files left over from
+    an earlier run with more shards are removed.
+    """
+    # 1. One pass over the code, shared by every shard.
+    sections_file = build_shared_sections(args, shared, shard_dir)
+    plan = plan_prompt(args, PROMPT_TEMPLATE, shared)
+    by_relative_path = {relative_posix_path(f, shared.root_dir): f for f in plan["code_files"]}
+    all_counts = section_token_counts(sections_file)
+    sizes = {p: all_counts.get(p, 0) for p in by_relative_path}
+
+    # 2. Pack the files; the capacity leaves room for the task, instructions and manifest.
+    output_instructions = OUTPUT_FORMATS[args.output_format][0]
+    capacity = None
+    if args.shard_tokens is not None:
+        header, footer = assemble_prompt(args.layout, output_instructions, plan["notes"],
+                                         preamble=format_shard_manifest([(0, sorted(sizes))], 0))
+        fixed_tokens = estimate_tokens(header) + estimate_tokens(footer)
+        capacity = args.shard_tokens - fixed_tokens
+        if capacity <= 0:
+            raise ValueError(f"--shard-tokens {args.shard_tokens} leaves no room for code "
+                             f"(task, instructions and manifest take ~{fixed_tokens} tokens)")
+    shards = pack_shards(sizes, args.shards, capacity)
+    print_shard_report(shards, capacity)
+
+    jobs = []
+    for index, (_, paths) in enumerate(shards):
+        members = set(paths)
+        shard_plan = dict(plan)
+        shard_plan["code_files"] = [f for f in plan["code_files"] if relative_posix_path(f, shared.root_dir) in members]
+        shard_plan["header"], shard_plan["footer"] = assemble_prompt(
+            args.layout, output_instructions, plan["notes"], preamble=format_shard_manifest(shards, index))
+        if plan["breakpoints"] is not None:
+            # Tier boundaries differ per shard; code_files is already in stable order.
+            shard_plan["breakpoints"] = cache_breakpoints(
+                shared.history(), [relative_posix_path(f, shared.root_dir) for f in shard_plan["code_files"]])
+        name = f"shard-{index + 1:02d}-of-{len(shards):02d}"
+        jobs.append((name, os.path.join(shard_dir, name + ".txt"), shard_plan))
+    shared.executor.shutdown()
+
+    # 3. Write the shards in parallel from the shared sections.
+    results = write_prompts(args, shared, jobs, sections_file)
+    current = {os.path.basename(output_file) for _, output_file, _ in jobs}
+    for name in os.listdir(shard_dir):
+        if SHARD_FILE.match(name) and name.split(".", 1)[0] + ".txt" not in current:
+            os.remove(os.path.join(shard_dir, name))
+
+    print("=" * 30)
+    print("--- Shard Outputs ---")
+    for (name, output_file, shard_plan), (stats, error) in zip(jobs, results):
+        if error is not None:
+            print(f"  {name}: FAILED ({error})")
+            continue
+        print(f"  {name}: {len(shard_plan['code_files'])} file(s), {stats['output_bytes']} bytes -> {output_file}")
+        if args.container:
+            pack_context(output_file, compression=None if args.container == "none" else args.container)
+    print(f"Apply each answer with {plan['applier']}.")
+    print("=" * 30)
+
+
+def write_prompt_file(args, plan, root_dir, output_file, full=False):
+    """Writes the single prompt of a plan, reusing unchanged sections, and prints the build report."""
+    stats = build_context_file(
+        output_file,
+        plan["code_files"],
+        root_dir,
+        # 1. The initial prompt template
+        header=plan["header"],
+        # 3. The final instructions for the output format
+        footer=plan["footer"],
+        full=full,
+        workers=args.workers,
+        max_file_bytes=args.max_file_bytes,
+        oversize=args.oversize,
+        file_limits=plan["file_limits"],
+        outline_files=plan["outline_files"],
+        keep_order=plan["keep_order"],
+        breakpoints=plan["breakpoints"],
+        compact=args.compact,
+        dedup=args.dedup,
+    )
+    print_compact_report(stats["compacted"])
+    print(f"Sections reused: {stats['reused']}, re-read: {stats['rendered']}, "
+          f"oversized: {stats['oversized']}, outlined: {stats['outlined']}, errors: {stats['errors']}.")
+    if args.dedup:
+        print(format_dedup_stats(stats))
+    print_prefix_report(output_file, stats)
+    return stats
+
+
+def run_watch(args, code_files, plan, root_dir, output_dir, output_file, extensions, exclude_dirs):
+    """
+    Keeps the prompt file current after the first build (--watch), see
+    nocode_watch: edits patch single sections of the in-memory output; files
+    appearing or disappearing trigger a rescan and an incremental rebuild
+    with a fresh plan.
+    """
+    def rebuild():
+        files = gather_code_files(root_dir, extensions, exclude_dirs, workers=args.workers,
+                                  use_gitignore=not args.no_gitignore)
+        executor = ThreadPoolExecutor(max_workers=max(args.workers, 1))
+        try:
+            shared = SharedIndexes(files, root_dir, output_dir, executor, max(args.workers, 1) * 4)
+            new_plan = plan_prompt(args, PROMPT_TEMPLATE, shared)
+        finally:
+            executor.shutdown()
+        write_prompt_file(args, new_plan, root_dir, output_file)
+        return files, new_plan
+
+    live = LiveContext(output_file, root_dir, args.max_file_bytes, args.oversize, args.compact)
+    try:
+        live.load(plan)
+        watch_context(live, rebuild, code_files, plan, root_dir, extensions, exclude_dirs,
+                      debounce=args.debounce, poll_interval=args.poll, socket_path=args.serve,
+                      use_gitignore=not args.no_gitignore)
+    except OSError as e:
+        print(f"Error: Watch mode failed: {e}")
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Build the LLM prompt: task template, code context and output instructions.")
+    parser.add_argument("--full", action="store_true", help="Ignore the build manifest and rebuild every section from scratch.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Threads used to scan and read files (default: {DEFAULT_WORKERS}; 1 = serial).")
+    parser.add_argument("--no-gitignore", action="store_true", help="Do not honor .gitignore files (.nocodeignore files still apply).")
+    parser.add_argument("--max-file-bytes", type=int, default=None, help="Do not inline files larger than this many bytes in full; see --oversize.")
+    parser.add_argument("--oversize", choices=OVERSIZE_POLICIES, default="truncate", help="What to do with files above --max-file-bytes (default: truncate).")
+    parser.add_argument("--token-budget", type=int, default=None, help="Fit the whole prompt into about this many tokens, dropping or truncating low-priority files.")
+    parser.add_argument("--priority", action="append", default=[], metavar="GLOB", help="Glob of files to include first under --token-budget (repeatable).")
+    parser.add_argument("--top-files", type=int, default=None, help="Keep only the N files most relevant to the task (BM25 over identifiers).")
+    parser.add_argument("--floor", action="append", default=[], metavar="GLOB", help="Glob of files always kept by --top-files, whatever their score (repeatable).")
+    parser.add_argument("--seed", action="append", default=[], metavar="PATH", help="Keep only this file and what it imports (repeatable).")
+    parser.add_argument("--depth", type=int, default=None, help="Maximum import depth followed from the seeds (default: unlimited).")
+    parser.add_argument("--reverse-depth", type=int, default=0, help="Also keep files importing the seeds, up to this depth (default: 0).")
+    parser.add_argument("--outline", action="store_true", help="Render files outside the focus set as outlines (signatures only, bodies elided).")
+    parser.add_argument("--focus", action="append", default=[], metavar="GLOB", help="Glob of files kept verbatim under --outline (repeatable).")
+    parser.add_argument("--compact", nargs="?", const="skip", choices=LOCKFILE_POLICIES, default=None,
+                        help="Strip comments, blank lines and indentation from .py/.js/.css/.json files; lockfiles are "
+                             "skipped, or minified with 'minify'.")
+    parser.add_argument("--dedup", nargs="?", const="files", choices=DEDUP_MODES, default=None,
+                        help="Emit identical files once and replace later copies by a reference; 'chunks' also replaces "
+                             "repeated blocks of lines inside files.")
+    parser.add_argument("--container", nargs="?", const="none", choices=("none",) + COMPRESSIONS, default=None,
+                        help="Also write an indexed random-access container (.nocx) next to the output, optionally compressed.")
+    parser.add_argument("--output-format", choices=sorted(OUTPUT_FORMATS), default="json",
+                        help="Ask for full files as JSON (default) or for SEARCH/REPLACE edit blocks, which need far fewer output tokens.")
+    parser.add_argument("--layout", choices=LAYOUTS, default="sorted",
+                        help="'sorted' (default): task first, files by path. 'cache': least recently changed files first, task last, "
+                             "with cache-breakpoint markers, so the prompt prefix stays stable between builds.")
+    parser.add_argument("--batch", metavar="JSONL", default=None,
+                        help="Build one prompt per line of this JSONL file ({\"id\", \"task\", per-task options}) with a single scan and read of the code.")
+    parser.add_argument("--batch-dir", default=None, help="Output directory for --batch (default: instance/batch).")
+    parser.add_argument("--shards", type=int, default=None, help="Split the code across N prompt files, balanced by size, keeping directories together.")
+    parser.add_argument("--shard-tokens", type=int, default=None,
+                        help="Split the code into as many prompt files as needed to keep each under about T tokens.")
+    parser.add_argument("--shard-dir", default=None, help="Output directory for --shards / --shard-tokens (default: instance/shards).")
+    parser.add_argument("--watch", action="store_true",
+                        help="After building, keep running and patch the output whenever code files change (inotify, or polling elsewhere).")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help=f"Seconds without further changes before --watch updates the output (default: {DEFAULT_DEBOUNCE}).")
+    parser.add_argument("--poll", nargs="?", type=float, const=DEFAULT_POLL_INTERVAL, default=None, metavar="SECONDS",
+                        help=f"Make --watch poll file stats instead of using inotify (default interval: {DEFAULT_POLL_INTERVAL}s).")
+    parser.add_argument("--serve", nargs="?", const=os.path.join("instance", "llm_code_input.sock"), default=None, metavar="SOCKET",
+                        help="With --watch, serve the current prompt on a Unix socket (default: instance/llm_code_input.sock).")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.batch and (args.shards or args.shard_tokens):
+        parser.error("--batch cannot be combined with --shards or --shard-tokens")
+    if args.watch and (args.batch or args.shards or args.shard_tokens):
+        parser.error("--watch builds the single prompt file; it cannot be combined with --batch or sharding")
+    if args.watch and args.dedup:
+        parser.error("--watch patches sections one at a time; it cannot be combined with --dedup")
+    if args.watch and args.container:
+        # The container would only be written once and then go stale as the prompt is patched.
+        parser.error("--watch patches the prompt file in place; it cannot be combined with --container")
+    if (args.poll is not None or args.serve) and not args.watch:
+        parser.error("--poll and --serve require --watch")
+    if (args.shards is not None and args.shards < 1) or (args.shard_tokens is not None and args.shard_tokens < 1):
+        parser.error("--shards and --shard-tokens must be positive")
+    start_metrics(args, "nocode_full_prompt")
+
     # Set the project root directory.
     root_dir = "."
     # Define the output directory. Note: even though we're writing the combined output
@@ -177,44 +786,72 @@ def main():
     code_extensions = (".py", ".html", ".css", ".js", ".jsx", ".ts", ".tsx", ".json", ".yaml", ".yml", ".md") # Added more common extensions
 
     print(f"Searching for code files in '{os.path.abspath(root_dir)}' with extensions {code_extensions},")
-    print(f"excluding directories: {exclude_dirs} and any files starting with 'nocode_'.")
+    print(f"excluding directories: {exclude_dirs}, any files starting with 'nocode_', binary files")
+    print("and anything matched by .gitignore / .nocodeignore files.")
 
     # Gather matching code files from the entire project.
-    code_files = gather_code_files(root_dir, code_extensions, exclude_dirs)
+    scan_stats = new_scan_stats()
+    code_files = gather_code_files(root_dir, code_extensions, exclude_dirs, workers=args.workers,
+                                   use_gitignore=not args.no_gitignore, stats=scan_stats)
     print(f"Found {len(code_files)} code files.")
+    print(format_scan_stats(scan_stats))
 
     # Ensure the output directory exists.
     os.makedirs(output_dir, exist_ok=True)
-    print(f"Writing combined context to '{os.path.abspath(output_file)}'")
 
-    # Write the content of each code file into the output file.
+    executor = ThreadPoolExecutor(max_workers=max(args.workers, 1))
+    window = max(args.workers, 1) * 4
+    shared = SharedIndexes(code_files, root_dir, output_dir, executor, window)
+
+    if args.batch:
+        try:
+            if not run_batch(args, shared, args.batch_dir or os.path.join(output_dir, "batch")):
+                exit(1)
+        except OSError as e:
+            print(f"Error: Batch build failed: {e}")
+            exit(1)
+        finally:
+            executor.shutdown()
+        return
+
+    if args.shards or args.shard_tokens:
+        try:
+            run_shards(args, shared, args.shard_dir or os.path.join(output_dir, "shards"))
+        except (OSError, ValueError) as e:
+            print(f"Error: Sharded build failed: {e}")
+            exit(1)
+        finally:
+            executor.shutdown()
+        return
+
     try:
-        with open(output_file, "w", encoding="utf-8") as outfile:
-            # 1. Write the initial prompt template
-            outfile.write(PROMPT_TEMPLATE)
-            outfile.write("\n\n--- Context: Code Files Below ---\n\n")
-
-            # 2. Write the content of each code file
-            # Sort the files for consistent order.
-            for f in sorted(code_files):
-                relative_path = os.path.relpath(f, root_dir).replace("\\", "/") # Use forward slashes for paths
-                outfile.write(f"--- Start of {relative_path} ---\n")
-                try:
-                    with open(f, "r", encoding="utf-8", errors="ignore") as infile:
-                        outfile.write(infile.read())
-                except Exception as e:
-                    outfile.write(f"\n!!! Error reading file {relative_path}: {e} !!!\n")
-                outfile.write(f"\n--- End of {relative_path} ---\n\n")
-
-            # 3. Write the final instructions for the output format
-            outfile.write("\n--- Task Output Instructions ---\n")
-            outfile.write(JSON_OUTPUT_INSTRUCTIONS)
+        plan = plan_prompt(args, PROMPT_TEMPLATE, shared)
+    except ValueError as e:
+        print(f"Error: {e}. No prompt was written.")
+        exit(1)
+    finally:
+        executor.shutdown()
+
+    print(f"Writing combined context to '{os.path.abspath(output_file)}'")
 
+    # Write the content of each code file into the output file, reusing the
+    # sections of unchanged files from the previous build.
+    try:
+        write_prompt_file(args, plan, root_dir, output_file, full=args.full)
         print("Successfully combined context and instructions into:", os.path.abspath(output_file))
+        if args.container:
+            container = pack_context(output_file, compression=None if args.container == "none" else args.container)
+            print("Indexed container written to:", os.path.abspath(container))
+        print(f"Apply the LLM's answer with {plan['applier']}.")
     except IOError as e:
         print(f"Error writing to output file {output_file}: {e}")
+        return
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+        return
+
+    if args.watch:
+        run_watch(args, code_files, plan, root_dir, output_dir, output_file, code_extensions, exclude_dirs)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Local change history for the cache-friendly prompt layout of
+nocode_full_prompt.py ('--layout cache').
+
+Provider-side prompt caching only reuses an identical prefix, so files that
+rarely change should come first and files that changed recently last. The
+history records, per file, a content hash, how often the content changed and
+the build in which it last changed. It is stored under 'instance/' and
+updated on every build; only files whose size or mtime changed are hashed.
+"""
+import hashlib
+import json
+import os
+
+from nocode_context import CHUNK_SIZE, ordered_map, relative_posix_path
+
+HISTORY_VERSION = 1
+
+# Stability tiers by builds since the last change, most stable first. A cache
+# breakpoint is emitted after each non-empty tier.
+STABILITY_TIERS = (("stable", 10), ("warm", 1), ("changed", 0))
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ChangeHistory:
+    """
+    Change history of the project files.
+
+    'files' maps relative_path -> {size, mtime_ns, sha256, changes, last_change}
+    where 'last_change' is the number of the build that last saw the content
+    change (or the file appear), and 'build' counts the builds so far.
+    """
+
+    def __init__(self):
+        self.build = 0
+        self.files = {}
+
+    @classmethod
+    def load(cls, history_path):
+        """Loads the history; returns an empty one if missing or unusable."""
+        history = cls()
+        try:
+            with open(history_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return history
+        if isinstance(data, dict) and data.get("version") == HISTORY_VERSION:
+            history.build = data.get("build", 0)
+            history.files = data.get("files", {})
+        return history
+
+    def save(self, history_path):
+        """Writes the history atomically (temp file + os.replace)."""
+        tmp_path = history_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": HISTORY_VERSION, "build": self.build, "files": self.files}, f)
+        os.replace(tmp_path, history_path)
+
+    def update(self, code_files, root_dir, executor=None, window=64):
+        """
+        Records a new build: files whose content changed since the last build
+        (or that are new) get this build as their last change. Deleted files
+        are dropped.
+
+        Returns:
+            int: Number of files whose content changed.
+        """
+        self.build += 1
+        current = {relative_posix_path(f, root_dir): f for f in code_files}
+        for relative_path in set(self.files) - set(current):
+            del self.files[relative_path]
+
+        def check(job):
+            relative_path, path = job
+            try:
+                st = os.stat(path)
+                entry = self.files.get(relative_path)
+                if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                    return st, entry["sha256"]
+                return st, _hash_file(path)
+            except OSError:
+                return None, None
+
+        jobs = sorted(current.items())
+        changed = 0
+        for (relative_path, _), (st, digest) in zip(jobs, ordered_map(executor, check, jobs, window)):
+            if st is None:
+                self.files.pop(relative_path, None)
+                continue
+            entry = self.files.get(relative_path)
+            if entry is None or entry["sha256"] != digest:
+                changed += 1
+                entry = {"changes": (entry["changes"] + 1) if entry else 0, "last_change": self.build}
+            entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=digest)
+            self.files[relative_path] = entry
+        return changed
+
+    def age(self, relative_path):
+        """Builds since the file's content last changed (0 = changed in this build)."""
+        entry = self.files.get(relative_path)
+        return self.build - entry["last_change"] if entry else 0
+
+    def tier(self, relative_path):
+        age = self.age(relative_path)
+        for name, min_age in STABILITY_TIERS:
+            if age >= min_age:
+                return name
+        return STABILITY_TIERS[-1][0]
+
+    def stable_order(self, relative_paths):
+        """
+        Orders files most stable first: longest unchanged, then least often
+        changed, then by path so equal files keep a fixed order.
+        """
+        def key(relative_path):
+            entry = self.files.get(relative_path, {})
+            return -self.age(relative_path), entry.get("changes", 0), relative_path
+        return sorted(relative_paths, key=key)
+
+
+def print_history_report(history, ordered):
+    """Prints how many files fall in each stability tier."""
+    counts = {name: 0 for name, _ in STABILITY_TIERS}
+    for relative_path in ordered:
+        counts[history.tier(relative_path)] += 1
+    print("Stability tiers (build #{}): {}.".format(
+        history.build, ", ".join(f"{name}: {count}" for name, count in counts.items())))
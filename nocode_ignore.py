@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+.gitignore / .nocodeignore support for the nocode scanner.
+
+Every ignore file is compiled to regular expressions once, when the scanner
+enters its directory, and the compiled rules are handed down to all
+subdirectories. Matching follows git's rules: patterns without a slash match
+at any depth below the ignore file, patterns with a slash are anchored to it,
+a trailing slash matches directories only, '!' re-includes, the last matching
+line wins and deeper ignore files override shallower ones.
+
+IgnoreTree answers the same question for single paths (the watcher's
+events), building the stacks the scanner would have built on demand.
+"""
+import os
+import re
+
+IGNORE_FILE_NAMES = (".gitignore", ".nocodeignore")
+
+# Bytes read from the start of a file to decide whether it is binary.
+SNIFF_BYTES = 8192
+
+
+def _translate_class(pattern, i):
+    """
+    Translates the '[...]' character class starting at pattern[i].
+
+    Returns:
+        tuple: (regex fragment, index just past the class), or (None, i) if the
+               bracket is not closed and must be taken literally.
+    """
+    j = i + 1
+    if j < len(pattern) and pattern[j] in "!^":
+        j += 1
+    if j < len(pattern) and pattern[j] == "]":
+        j += 1
+    j = pattern.find("]", j)
+    if j == -1:
+        return None, i
+    body = pattern[i + 1:j].replace("\\", "\\\\")
+    if body[:1] in ("!", "^"):
+        body = "^" + body[1:]
+    return f"[{body}]", j + 1
+
+
+def translate_pattern(pattern):
+    """
+    Translates the glob part of one ignore line into a regex body.
+
+    '*' and '?' never match '/', '**/' matches any number of directories
+    (including none) and a trailing '/**' matches everything inside.
+    """
+    i, n = 0, len(pattern)
+    res = []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+                j = i + 2
+                if j == n:
+                    res.append(".*")
+                    i = j
+                    continue
+                if pattern[j] == "/":
+                    res.append("(?:.*/)?")
+                    i = j + 1
+                    continue
+            while i < n and pattern[i] == "*":
+                i += 1
+            res.append("[^/]*")
+            continue
+        if c == "?":
+            res.append("[^/]")
+        elif c == "[":
+            fragment, end = _translate_class(pattern, i)
+            if fragment is not None:
+                res.append(fragment)
+                i = end
+                continue
+            res.append(re.escape(c))
+        elif c == "\\" and i + 1 < n:
+            res.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            res.append(re.escape(c))
+        i += 1
+    return "".join(res)
+
+
+def _compile_line(line):
+    """
+    Compiles one ignore-file line.
+
+    Returns:
+        tuple or None: (regex, negate, dir_only), or None for blanks and comments.
+    """
+    line = line.rstrip("\n").rstrip("\r")
+    # Trailing spaces are ignored unless escaped with a backslash.
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    line = stripped
+    if not line or line.startswith("#"):
+        return None
+
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    # A slash anywhere but at the end anchors the pattern to the ignore file's directory.
+    anchored = "/" in line
+    line = line.lstrip("/")
+    body = translate_pattern(line)
+    if not anchored:
+        body = "(?:.*/)?" + body
+    return body, negate, dir_only
+
+
+class IgnoreRules:
+    """
+    The compiled rules of one ignore file.
+
+    When the file has no '!' lines (the common case) all patterns are folded
+    into a single alternation, so a path is checked with one regex match.
+    """
+
+    def __init__(self, base, lines):
+        """
+        Args:
+            base (str): Directory of the ignore file, relative to the scan root
+                        with forward slashes ('' for the root itself).
+            lines (iterable): Lines of the ignore file.
+        """
+        self.base = base
+        self._prefix_len = len(base) + 1 if base else 0
+        self.rules = [rule for rule in (_compile_line(line) for line in lines) if rule]
+        self._has_negation = any(negate for _, negate, _ in self.rules)
+        self._compiled = [(re.compile(f"^{body}$", re.DOTALL), negate, dir_only) for body, negate, dir_only in self.rules]
+        if not self._has_negation:
+            self._any = self._alternation(self.rules)
+            self._files_only = self._alternation([rule for rule in self.rules if not rule[2]])
+
+    @staticmethod
+    def _alternation(rules):
+        if not rules:
+            return None
+        return re.compile("^(?:" + "|".join(body for body, _, _ in rules) + ")$", re.DOTALL)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, relative_path, is_dir):
+        """
+        Decides whether a path is ignored by this file.
+
+        Args:
+            relative_path (str): Path relative to the scan root, forward slashes.
+            is_dir (bool): Whether the path is a directory.
+
+        Returns:
+            bool or None: True if ignored, False if re-included with '!', None
+                          if no line matches (a shallower file decides).
+        """
+        path = relative_path[self._prefix_len:]
+        if not self._has_negation:
+            regex = self._any if is_dir else self._files_only
+            return True if regex is not None and regex.match(path) else None
+        for regex, negate, dir_only in reversed(self._compiled):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(path):
+                return not negate
+        return None
+
+
+def load_ignore_rules(path, base):
+    """Reads and compiles an ignore file; returns None if it is unreadable or empty."""
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            rules = IgnoreRules(base, f)
+    except OSError:
+        return None
+    return rules or None
+
+
+def is_ignored(stack, relative_path, is_dir):
+    """
+    Checks a path against a stack of IgnoreRules (shallowest first).
+    The deepest file with a matching line decides.
+    """
+    for rules in reversed(stack):
+        decision = rules.match(relative_path, is_dir)
+        if decision is not None:
+            return decision
+    return False
+
+
+class IgnoreTree:
+    """
+    The ignore stacks gather_code_files builds level by level, for any path
+    under a root: a directory's stack is its parent's plus the ignore files
+    it contains. Stacks are loaded on first use and cached, so make a new
+    tree once an ignore file changed.
+    """
+
+    def __init__(self, root, use_gitignore=True):
+        self.root = os.path.abspath(root)
+        self.use_gitignore = use_gitignore
+        self._stacks = {}
+        self._ignored_dirs = {}
+
+    def _stack(self, relative_dir):
+        """The stack in effect for the entries of a directory (its own ignore files included)."""
+        stack = self._stacks.get(relative_dir)
+        if stack is None:
+            stack = self._stack(relative_dir.rpartition("/")[0]) if relative_dir else ()
+            for ignore_name in IGNORE_FILE_NAMES:
+                if self.use_gitignore or ignore_name != ".gitignore":
+                    rules = load_ignore_rules(os.path.join(self.root, relative_dir, ignore_name), relative_dir)
+                    if rules:
+                        stack = stack + (rules,)
+            self._stacks[relative_dir] = stack
+        return stack
+
+    def _dir_ignored(self, relative_dir):
+        ignored = self._ignored_dirs.get(relative_dir)
+        if ignored is None:
+            parent = relative_dir.rpartition("/")[0]
+            ignored = (bool(parent) and self._dir_ignored(parent)) or is_ignored(self._stack(parent), relative_dir, True)
+            self._ignored_dirs[relative_dir] = ignored
+        return ignored
+
+    def ignored(self, path, is_dir):
+        """
+        True if the scanner would skip 'path': it is matched by an ignore file
+        or lies in an ignored directory. Paths outside the root are never ignored.
+        """
+        relative_path = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+        if relative_path == "." or relative_path.startswith("../") or relative_path == "..":
+            return False
+        if is_dir:
+            return self._dir_ignored(relative_path)
+        parent = relative_path.rpartition("/")[0]
+        if parent and self._dir_ignored(parent):
+            return True
+        return is_ignored(self._stack(parent), relative_path, False)
+
+
+def is_binary_file(path):
+    """Returns True if the first SNIFF_BYTES of the file contain a NUL byte."""
+    try:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(SNIFF_BYTES)
+    except OSError:
+        # Let the reader report the error in the output instead.
+        return False
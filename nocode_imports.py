@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Import-graph pruning for nocode_full_prompt.py.
+
+Parses require()/import statements in JS/JSX/TS files and import statements in
+Python files, resolves them to files of the project and keeps only the seed
+files plus what they (transitively) import, optionally adding the files that
+depend on the seeds. The raw import specifiers of every file are cached under
+'instance/' and only files whose size or mtime changed are parsed again;
+resolution is redone on every run because it depends on which files exist.
+"""
+import ast
+import json
+import os
+import posixpath
+import re
+from collections import deque
+
+from nocode_context import ordered_map, relative_posix_path
+
+GRAPH_VERSION = 1
+
+JS_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+# Tried in order when a JS specifier has no extension or names a directory.
+JS_RESOLVE_SUFFIXES = ("", ".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".json",
+                       "/index.js", "/index.jsx", "/index.ts", "/index.tsx")
+
+# import x from 'y' / import 'y' / export ... from 'y' / require('y') / import('y')
+_JS_IMPORT = re.compile(
+    r"""(?:\bimport\s+(?:[\w*{}\s,$]+?\s+from\s+)?|\bexport\s+[\w*{}\s,$]+?\s+from\s+|\brequire\s*\(\s*|\bimport\s*\(\s*)"""
+    r"""(['"])([^'"\n]+)\1"""
+)
+_PY_IMPORT_LINE = re.compile(r"^\s*(?:from\s+(\.*[\w.]*)\s+import\s+([\w*, ()]+)|import\s+([\w., ]+))", re.MULTILINE)
+
+
+def parse_js_imports(text):
+    """Returns the module specifiers a JS/JSX/TS source imports, in order."""
+    return [match.group(2) for match in _JS_IMPORT.finditer(text)]
+
+
+def parse_python_imports(text):
+    """
+    Returns the modules a Python source imports, as dotted names with one
+    leading '.' per relative level. For 'from pkg import name' both 'pkg' and
+    'pkg.name' are returned, since 'name' may be a submodule.
+    Falls back to a line regex when the file does not parse.
+    """
+    specs = []
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        for match in _PY_IMPORT_LINE.finditer(text):
+            module, names, plain = match.groups()
+            if plain:
+                specs.extend(part.split(" as ")[0].strip() for part in plain.split(",") if part.strip())
+            else:
+                specs.append(module)
+                prefix = module if module.endswith(".") else module + "."
+                specs.extend(prefix + name.split(" as ")[0].strip()
+                             for name in names.strip("()").split(",") if name.strip() and name.strip() != "*")
+        return specs
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            specs.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            if node.module:
+                specs.append(module)
+            prefix = module if module.endswith(".") else module + "."
+            specs.extend(prefix + alias.name for alias in node.names if alias.name != "*")
+    return specs
+
+
+def parse_imports(path, relative_path):
+    """Returns the raw import specifiers of one file ([] for other languages)."""
+    if not relative_path.endswith(JS_EXTENSIONS + (".py",)):
+        return []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if relative_path.endswith(".py"):
+        return parse_python_imports(text)
+    return parse_js_imports(text)
+
+
+def resolve_js(importer, spec, known):
+    """Resolves a relative JS specifier to a project file, or None (packages, missing files)."""
+    if not spec.startswith("."):
+        return None
+    base = posixpath.normpath(posixpath.join(posixpath.dirname(importer), spec.split("?")[0]))
+    for suffix in JS_RESOLVE_SUFFIXES:
+        if base + suffix in known:
+            return base + suffix
+    return None
+
+
+def resolve_python(importer, spec, known):
+    """Resolves a dotted Python module name to a project file, or None (stdlib, packages)."""
+    level = len(spec) - len(spec.lstrip("."))
+    parts = [part for part in spec[level:].split(".") if part]
+    importer_dir = posixpath.dirname(importer)
+    if level:
+        base = importer_dir
+        for _ in range(level - 1):
+            base = posixpath.dirname(base)
+        bases = [base]
+    else:
+        # Absolute imports resolve from the project root or, script-style, from the importer's directory.
+        bases = ["", importer_dir] if importer_dir else [""]
+    for base in bases:
+        stem = posixpath.join(base, *parts) if parts else base
+        for candidate in (stem + ".py", posixpath.join(stem, "__init__.py")):
+            candidate = candidate.lstrip("/")
+            if candidate in known:
+                return candidate
+    return None
+
+
+class ImportGraph:
+    """
+    Import graph of the project.
+
+    'files' maps relative_path -> [size, mtime_ns, [raw specifiers]] and is
+    persisted as JSON; edges are resolved from it on demand.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.edges = {}
+        self.reverse_edges = {}
+
+    @classmethod
+    def load(cls, graph_path):
+        """Loads a cached graph; returns an empty one if missing or unusable."""
+        graph = cls()
+        try:
+            with open(graph_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return graph
+        if isinstance(data, dict) and data.get("version") == GRAPH_VERSION:
+            graph.files = data.get("files", {})
+        return graph
+
+    def save(self, graph_path):
+        """Writes the graph atomically (temp file + os.replace)."""
+        tmp_path = graph_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": GRAPH_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, graph_path)
+
+    def update(self, code_files, root_dir, executor=None, window=64):
+        """
+        Re-parses new and modified files, drops deleted ones and resolves all
+        edges against the current file set.
+
+        Returns:
+            int: Number of files that were parsed.
+        """
+        current = {relative_posix_path(f, root_dir): f for f in code_files}
+        for relative_path in set(self.files) - set(current):
+            del self.files[relative_path]
+
+        changed = []
+        for relative_path, path in sorted(current.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.files.pop(relative_path, None)
+                continue
+            cached = self.files.get(relative_path)
+            if not cached or cached[0] != st.st_size or cached[1] != st.st_mtime_ns:
+                changed.append((relative_path, path, st))
+
+        def parse(job):
+            relative_path, path, st = job
+            try:
+                return parse_imports(path, relative_path)
+            except OSError:
+                return None
+
+        for (relative_path, path, st), specs in zip(changed, ordered_map(executor, parse, changed, window)):
+            if specs is None:
+                self.files.pop(relative_path, None)
+            else:
+                self.files[relative_path] = [st.st_size, st.st_mtime_ns, specs]
+
+        self._resolve()
+        return len(changed)
+
+    def _resolve(self):
+        known = set(self.files)
+        self.edges = {}
+        self.reverse_edges = {relative_path: set() for relative_path in known}
+        for relative_path, (_, _, specs) in self.files.items():
+            resolve = resolve_python if relative_path.endswith(".py") else resolve_js
+            targets = set()
+            for spec in specs:
+                target = resolve(relative_path, spec, known)
+                if target and target != relative_path:
+                    targets.add(target)
+            self.edges[relative_path] = targets
+            for target in targets:
+                self.reverse_edges[target].add(relative_path)
+
+    def closure(self, seeds, depth=None, reverse_depth=0):
+        """
+        Collects the seeds, their imports up to 'depth' hops (None = unlimited)
+        and the files importing the seeds up to 'reverse_depth' hops.
+
+        Returns:
+            dict: {relative_path: hops}; imports have positive hops, dependents negative.
+        """
+        selected = {}
+        for edges, max_hops, sign in ((self.edges, depth, 1), (self.reverse_edges, reverse_depth, -1)):
+            if max_hops == 0:
+                continue
+            queue = deque((seed, 0) for seed in seeds)
+            seen = set(seeds)
+            while queue:
+                relative_path, hops = queue.popleft()
+                if max_hops is not None and hops >= max_hops:
+                    continue
+                for target in sorted(edges.get(relative_path, ())):
+                    if target not in seen:
+                        seen.add(target)
+                        selected.setdefault(target, sign * (hops + 1))
+                        queue.append((target, hops + 1))
+        for seed in seeds:
+            selected[seed] = 0
+        return selected
+
+
+def print_closure_report(selected, total):
+    """Prints the files kept by the import graph and how they were reached."""
+    print("=" * 30)
+    print("--- Import Graph Selection ---")
+    for relative_path in sorted(selected, key=lambda p: (abs(selected[p]), selected[p] < 0, p)):
+        hops = selected[relative_path]
+        how = "seed" if hops == 0 else (f"import, depth {hops}" if hops > 0 else f"dependent, depth {-hops}")
+        print(f"  {relative_path} ({how})")
+    print(f"Kept {len(selected)} of {total} file(s).")
+    print("=" * 30)
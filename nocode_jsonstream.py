@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Incremental parsing of the LLM's '[{"filePath": ..., "content": ...}, ...]'
+output for nocode_apply_llm_changes.py.
+
+The input is consumed in chunks and each element of the top-level array is
+decoded and handed out as soon as its closing brace arrives, so only the
+element being read is held in memory and the first files can be written
+while the rest of the output is still coming in. Element boundaries are
+found with a small state machine (string / escape / nesting depth) that
+jumps between interesting characters with a regex instead of walking the
+text one character at a time; the element itself is decoded by the json
+module.
+"""
+import json
+import re
+
+from nocode_context import CHUNK_SIZE
+
+# Characters that matter outside and inside a JSON string.
+_STRUCTURE = re.compile(r'[{}\[\]",]')
+_STRING = re.compile(r'["\\]')
+# What may precede the array: whitespace and a Markdown code fence.
+_FENCE = re.compile(r"^\s*(?:```(?:json)?)?\s*$", re.IGNORECASE)
+
+
+class StreamError(ValueError):
+    """Raised when the input is not a JSON array or ends before the array is closed."""
+
+
+def read_chunks(f, size=CHUNK_SIZE):
+    """Yields a text file's content in chunks of 'size' characters."""
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_array_items(chunks):
+    """
+    Yields the decoded elements of a top-level JSON array, one at a time.
+
+    Args:
+        chunks (iterable): Text chunks of the input, split anywhere. A leading
+                           '```json' fence and anything after the closing ']'
+                           (such as the closing fence) are ignored.
+
+    Raises:
+        StreamError: If the input is empty, not an array, or truncated.
+        json.JSONDecodeError: If an element is not valid JSON.
+    """
+    head = ""            # text before the '[' (only whitespace and a fence are allowed)
+    phase = "start"      # start -> between <-> item -> done
+    parts = []           # pieces of the element being read
+    depth = 0
+    in_string = False
+    escape = False
+    count = 0
+
+    for chunk in chunks:
+        i, n = 0, len(chunk)
+        while i < n:
+            if phase == "done":
+                break
+
+            if phase == "start":
+                bracket = chunk.find("[", i)
+                prefix = chunk[i:] if bracket < 0 else chunk[i:bracket]
+                head += prefix
+                if bracket < 0:
+                    # A fence may be split across chunks; give up early only on clearly wrong input.
+                    if "{" in head or len(head) > 1024:
+                        raise StreamError("JSON data is not a list")
+                    break
+                if not _FENCE.match(head):
+                    raise StreamError("JSON data is not a list")
+                phase = "between"
+                i = bracket + 1
+                continue
+
+            if phase == "between":
+                while i < n and chunk[i] in " \t\r\n,":
+                    i += 1
+                if i == n:
+                    break
+                if chunk[i] == "]":
+                    phase = "done"
+                    break
+                phase = "item"
+                parts = []
+                depth = 0
+                in_string = False
+                escape = False
+
+            # phase == "item": scan for the end of the current element.
+            start = i
+            end = None
+            while i < n:
+                if escape:
+                    escape = False
+                    i += 1
+                    continue
+                if in_string:
+                    match = _STRING.search(chunk, i)
+                    if not match:
+                        i = n
+                        break
+                    i = match.end()
+                    if match.group() == "\\":
+                        escape = True
+                    else:
+                        in_string = False
+                    continue
+                match = _STRUCTURE.search(chunk, i)
+                if not match:
+                    i = n
+                    break
+                char = match.group()
+                i = match.end()
+                if char == '"':
+                    in_string = True
+                elif char in "{[":
+                    depth += 1
+                elif depth == 0:
+                    # ',' or ']' ends a scalar element; it is not part of it.
+                    end = i - 1
+                    i = end
+                    break
+                elif char in "}]":
+                    depth -= 1
+                    if depth == 0:
+                        end = i
+                        break
+            if end is None:
+                parts.append(chunk[start:])
+                continue
+            parts.append(chunk[start:end])
+            count += 1
+            text = "".join(parts)
+            parts = []
+            phase = "between"
+            yield json.loads(text)
+
+    if phase == "start":
+        if head.strip() and not _FENCE.match(head):
+            raise StreamError("JSON data is not a list")
+        raise StreamError("no JSON input received")
+    if phase != "done":
+        raise StreamError(f"unexpected end of input after {count} complete element(s); the array is not closed")
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Instrumentation shared by the nocode scripts: named spans (timed stages)
+and counters.
+
+Instrumentation is off unless a script is run with --profile (prints a
+stage breakdown when it exits) or --metrics-json PATH (writes the same data
+as JSON for the job runner). While it is off, span() hands out one shared
+no-op context manager, timed() and iter_span() add a single flag check, and
+count() returns right away, so instrumented code runs at full speed.
+
+Spans with the same name are aggregated into a call count and a total time.
+Spans entered on worker threads (file reads, for instance) add up across
+threads, so their total can exceed the wall time of the run. Work done in
+worker processes is timed there and handed back with add_span().
+
+Usage in a script:
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args, "nocode_concat_code")
+
+    with span("scan"):
+        ...
+    count("files_scanned", len(files))
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+METRICS_VERSION = 1
+
+_enabled = False
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_started = None
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enable():
+    """Turns instrumentation on and starts the wall clock of the run."""
+    global _enabled, _started
+    _enabled = True
+    _started = time.perf_counter()
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Clears all spans and counters."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def _record(name, seconds):
+    with _lock:
+        entry = _spans.get(name)
+        if entry is None:
+            _spans[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """A context manager timing the enclosed block under 'name'."""
+    return _Span(name) if _enabled else _NULL_SPAN
+
+
+def timed(name):
+    """Decorator: times every call of the function under 'name'."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def add_span(name, seconds):
+    """
+    Adds a duration measured elsewhere to the span 'name', e.g. one timed in
+    a worker process, whose own spans never reach this process.
+    """
+    if _enabled:
+        _record(name, seconds)
+
+
+def iter_span(name, iterable):
+    """
+    Times the work of producing each item of a (lazy) iterable, e.g. a
+    streaming parser, without the time the consumer spends on the items.
+    """
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iter(iterable))
+
+
+def _timed_iter(name, iterator):
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            _record(name, time.perf_counter() - start)
+            return
+        _record(name, time.perf_counter() - start)
+        yield item
+
+
+def count(name, n=1):
+    """Adds n to the counter 'name'."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def count_stats(prefix, stats):
+    """Adds every integer of a stats dict (e.g. new_scan_stats()) as '<prefix>.<key>'."""
+    if not _enabled:
+        return
+    with _lock:
+        for key, value in stats.items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                name = f"{prefix}.{key}"
+                _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot(script=None):
+    """
+    Returns the collected data:
+    {'version', 'script', 'wall_s', 'spans': {name: {'calls', 'total_s'}}, 'counters': {name: n}}.
+    """
+    with _lock:
+        spans = {name: {"calls": calls, "total_s": total} for name, (calls, total) in sorted(_spans.items())}
+        counters = dict(sorted(_counters.items()))
+    return {
+        "version": METRICS_VERSION,
+        "script": script,
+        "wall_s": time.perf_counter() - _started if _started is not None else None,
+        "spans": spans,
+        "counters": counters,
+    }
+
+
+def print_profile(data):
+    """Prints the stage breakdown of a snapshot, longest stages first."""
+    wall = data["wall_s"] or 0.0
+    print("=" * 30)
+    print("--- Profile ---")
+    print(f"  {'stage':<16}{'calls':>8}{'total ms':>12}{'of wall':>10}")
+    for name, entry in sorted(data["spans"].items(), key=lambda item: -item[1]["total_s"]):
+        share = f"{100.0 * entry['total_s'] / wall:.1f}%" if wall else "n/a"
+        print(f"  {name:<16}{entry['calls']:>8}{entry['total_s'] * 1000:>12.1f}{share:>10}")
+    if data["counters"]:
+        print("Counters: " + ", ".join(f"{name}={value}" for name, value in data["counters"].items()))
+    print(f"Wall time: {wall * 1000:.1f} ms (spans on worker threads add up across threads).")
+    print("=" * 30)
+
+
+def write_metrics(path, data):
+    """Writes a snapshot as JSON (temp file + os.replace)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def add_metrics_arguments(parser):
+    """Adds --profile and --metrics-json to a script's argument parser."""
+    parser.add_argument("--profile", action="store_true", help="Print a per-stage timing breakdown and counters at the end.")
+    parser.add_argument("--metrics-json", metavar="PATH", default=None, help="Write per-stage timings and counters as JSON to this file.")
+
+
+def start_metrics(args, script):
+    """
+    Enables instrumentation if --profile or --metrics-json was given; the
+    report is printed and/or written when the script exits, whatever path
+    it exits through.
+    """
+    if not (args.profile or args.metrics_json):
+        return
+
+    def report():
+        data = snapshot(script)
+        if args.profile:
+            print_profile(data)
+        if args.metrics_json:
+            try:
+                write_metrics(args.metrics_json, data)
+                print(f"Metrics written to: {os.path.abspath(args.metrics_json)}")
+            except OSError as e:
+                print(f"Warning: Could not write metrics to {args.metrics_json}: {e}")
+
+    enable()
+    atexit.register(report)
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Outline rendering for the nocode context builders.
+
+Files outside the focus set can be rendered as outlines instead of verbatim:
+imports, class and function signatures, exported names and top-level
+statements, with function bodies elided. Python is outlined with 'ast';
+JS/JSX/TS with a small tokenizer that understands strings, template literals,
+comments and regex literals well enough to track braces. Mongoose schema
+definitions (new Schema({...})) are kept field by field. CSS is reduced to its
+selectors and JSON to its keys; other file types are left verbatim.
+"""
+import ast
+import json
+import re
+
+OUTLINE_NOTE = "(outline only: function bodies and long values are elided)"
+
+JS_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+
+# Objects/arrays whose rendering is longer than this are shown as '{ ... }'.
+INLINE_LIMIT = 160
+# Top-level statements are cut off after this many characters.
+STATEMENT_LIMIT = 240
+# Nesting shown for JSON files.
+JSON_DEPTH = 2
+
+
+# --- Python ---
+
+def _first_doc_line(node):
+    doc = ast.get_docstring(node)
+    if not doc:
+        return None
+    # First paragraph, on one line.
+    summary = " ".join(doc.strip().split("\n\n")[0].split())
+    return summary if len(summary) <= INLINE_LIMIT else summary[:INLINE_LIMIT] + "..."
+
+
+def _outline_python_body(body, indent, lines):
+    for node in body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append(indent + ast.unparse(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for decorator in node.decorator_list:
+                lines.append(f"{indent}@{ast.unparse(decorator)}")
+            prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+            returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+            lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}:")
+            doc = _first_doc_line(node)
+            if doc:
+                lines.append(f'{indent}    """{doc}"""')
+            lines.append(f"{indent}    ...")
+        elif isinstance(node, ast.ClassDef):
+            for decorator in node.decorator_list:
+                lines.append(f"{indent}@{ast.unparse(decorator)}")
+            bases = [ast.unparse(base) for base in node.bases] + [ast.unparse(kw) for kw in node.keywords]
+            lines.append(f"{indent}class {node.name}({', '.join(bases)}):" if bases else f"{indent}class {node.name}:")
+            doc = _first_doc_line(node)
+            if doc:
+                lines.append(f'{indent}    """{doc}"""')
+            before = len(lines)
+            _outline_python_body(node.body, indent + "    ", lines)
+            if len(lines) == before:
+                lines.append(f"{indent}    ...")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            text = ast.unparse(node)
+            if len(text) > INLINE_LIMIT:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                text = " = ".join(ast.unparse(target) for target in targets) + " = ..."
+            lines.append(indent + text)
+        elif isinstance(node, ast.If) and "__name__" in ast.unparse(node.test):
+            lines.append(f"{indent}if {ast.unparse(node.test)}:")
+            lines.append(f"{indent}    ...")
+
+
+def outline_python(text):
+    """Returns the outline of a Python source, or None if it does not parse."""
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    lines = []
+    doc = _first_doc_line(tree)
+    if doc:
+        lines.append(f'"""{doc}"""')
+    _outline_python_body(tree.body, "", lines)
+    return "\n".join(lines)
+
+
+# --- JavaScript ---
+
+_PUNCTUATORS = sorted(
+    ["===", "!==", "**=", "...", "<<=", ">>=", ">>>", "&&=", "||=", "??=",
+     "=>", "==", "!=", "<=", ">=", "&&", "||", "??", "?.", "++", "--", "+=", "-=", "*=", "/=",
+     "%=", "&=", "|=", "^=", "**", "<<", ">>"],
+    key=len, reverse=True,
+)
+# Tried in order, so the longest punctuator wins, as in the list above.
+_PUNCTUATOR_RE = re.compile("|".join(re.escape(punct) for punct in _PUNCTUATORS))
+_SPACES_RE = re.compile(r"[^\S\n]+")
+_IDENT_REST_RE = re.compile(r"[\w$]*")  # \w is isalnum() plus '_'
+_NUMBER_REST_RE = re.compile(r"[\w.]*")
+# After these keywords a '/' starts a regex literal rather than a division.
+_REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw",
+                   "case", "do", "else", "yield", "await"}
+_BLOCK_KEYWORDS = {"else", "try", "finally", "do"}
+# Tokens that continue a statement onto the next line.
+_CONTINUATIONS = {".", "?.", ")", "]", ",", "=>", "else", "catch", "finally", "from", "as", "in", "of",
+                  "instanceof", "?", ":", "+", "-", "*", "/", "&&", "||", "??", "=", "==", "===",
+                  "!=", "!==", "<", ">", "<=", ">="}
+_OPENERS = {"(": ")", "[": "]", "{": "}"}
+_NO_SPACE_AFTER = {"(", "[", ".", "?.", "...", "!"}
+_NO_SPACE_BEFORE = {")", "]", ",", ";", ".", "?.", ":"}
+_CALL_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "typeof", "await", "async", "in", "of"}
+
+
+def scan_js(text):
+    """
+    Yields (kind, start, end, line) for every token of JS/JSX/TS source,
+    comments included; whitespace is skipped. Kinds: 'ident', 'number',
+    'string', 'template', 'regex', 'punct' and 'comment'. Quote and regex
+    literals cannot span lines (except through a backslash-newline), so a
+    stray apostrophe in JSX text only affects its own line.
+    """
+    i, n, line = 0, len(text), 1
+    last = None  # the last token that is not a comment, as (kind, value)
+    while i < n:
+        c = text[i]
+        if c == "\n":
+            line += 1
+            i += 1
+            continue
+        if c.isspace():
+            i = _SPACES_RE.match(text, i).end()
+            continue
+        if text.startswith("//", i):
+            j = text.find("\n", i)
+            j = n if j == -1 else j
+            yield "comment", i, j, line
+            i = j
+            continue
+        if text.startswith("/*", i):
+            j = text.find("*/", i + 2)
+            j = n if j == -1 else j + 2
+            yield "comment", i, j, line
+            line += text.count("\n", i, j)
+            i = j
+            continue
+        if c in "'\"":
+            j = i + 1
+            while j < n and text[j] != c and text[j] != "\n":
+                j += 2 if text[j] == "\\" else 1
+            j = min(j, n - 1)
+            end = j + 1 if text[j] == c else j
+            yield "string", i, end, line
+            last = ("string", None)
+            line += text.count("\n", i, end)
+            i = end
+            continue
+        if c == "`":
+            j, depth = i + 1, 0
+            while j < n:
+                if text[j] == "\\":
+                    j += 2
+                    continue
+                if text.startswith("${", j):
+                    depth += 1
+                    j += 2
+                    continue
+                if text[j] == "}" and depth:
+                    depth -= 1
+                elif text[j] == "`" and not depth:
+                    break
+                j += 1
+            end = min(j + 1, n)
+            yield "template", i, end, line
+            last = ("template", None)
+            line += text.count("\n", i, end)
+            i = end
+            continue
+        if c.isalpha() or c in "_$":
+            j = _IDENT_REST_RE.match(text, i + 1).end()
+            yield "ident", i, j, line
+            last = ("ident", text[i:j])
+            i = j
+            continue
+        if c.isdigit():
+            j = _NUMBER_REST_RE.match(text, i + 1).end()
+            yield "number", i, j, line
+            last = ("number", None)
+            i = j
+            continue
+        if c == "/" and _regex_allowed(last):
+            end = _scan_regex(text, i)
+            if end is not None:
+                yield "regex", i, end, line
+                last = ("regex", None)
+                i = end
+                continue
+        match = _PUNCTUATOR_RE.match(text, i)
+        punct = match.group() if match else c
+        yield "punct", i, i + len(punct), line
+        last = ("punct", punct)
+        i += len(punct)
+
+
+def tokenize_js(text):
+    """
+    Splits JS/JSX/TS source into (kind, value, line) tokens, dropping
+    comments and whitespace (see scan_js).
+    """
+    return [(kind, text[start:end], line) for kind, start, end, line in scan_js(text) if kind != "comment"]
+
+
+def _regex_allowed(last):
+    if last is None:
+        return True
+    kind, value = last
+    if kind == "ident":
+        return value in _REGEX_KEYWORDS
+    if kind in ("number", "string", "template", "regex"):
+        return False
+    # '</' closes a JSX tag.
+    return value not in (")", "]", "}", "<")
+
+
+def _scan_regex(text, i):
+    """Returns the end of the regex literal starting at text[i], or None if there is none on this line."""
+    j, n, in_class = i + 1, len(text), False
+    while j < n and text[j] != "\n":
+        c = text[j]
+        if c == "\\":
+            j += 2
+            continue
+        if c == "[":
+            in_class = True
+        elif c == "]":
+            in_class = False
+        elif c == "/" and not in_class:
+            j += 1
+            while j < n and text[j].isalpha():
+                j += 1
+            return j
+        j += 1
+    return None
+
+
+def _match_brackets(tokens):
+    """Maps the index of every bracket token to the index of its partner (unbalanced ones to themselves)."""
+    match = {}
+    stack = []
+    for index, (kind, value, _) in enumerate(tokens):
+        if kind != "punct":
+            continue
+        if value in _OPENERS:
+            stack.append(index)
+        elif value in (")", "]", "}"):
+            while stack and _OPENERS[tokens[stack[-1]][1]] != value:
+                match[stack.pop()] = len(tokens) - 1
+            if stack:
+                opener = stack.pop()
+                match[opener] = index
+                match[index] = opener
+    for opener in stack:
+        match[opener] = len(tokens) - 1
+    return match
+
+
+def _split_statements(tokens, match, start, end):
+    """Splits tokens[start:end] into statement ranges, approximating automatic semicolon insertion."""
+    statements = []
+    i = statement_start = start
+    while i < end:
+        kind, value, line = tokens[i]
+        if kind == "punct" and value in _OPENERS:
+            i = min(match.get(i, end - 1), end - 1)
+        last = i
+        i += 1
+        if tokens[last][:2] == ("punct", ";"):
+            statements.append((statement_start, i))
+            statement_start = i
+            continue
+        if i < end:
+            next_kind, next_value, next_line = tokens[i]
+            last_kind, last_value, last_line = tokens[last]
+            ends_line = next_line > last_line
+            can_end = last_kind in ("ident", "number", "string", "template", "regex") or last_value in (")", "]", "}")
+            if ends_line and can_end and next_value not in _CONTINUATIONS and last_value not in _CONTINUATIONS:
+                statements.append((statement_start, i))
+                statement_start = i
+    if statement_start < end:
+        statements.append((statement_start, end))
+    return statements
+
+
+def _brace_kind(tokens, statement_start, i):
+    """Classifies the '{' at tokens[i] as 'block', 'class', 'schema' or 'object'."""
+    if i == statement_start:
+        return "block"
+    start = statement_start
+    prev_kind, prev_value, _ = tokens[i - 1]
+    if prev_value in (")", "=>") or (prev_kind == "ident" and prev_value in _BLOCK_KEYWORDS):
+        return "block"
+    j = i - 1
+    while j >= start and (tokens[j][0] == "ident" or tokens[j][1] == "."):
+        if tokens[j][:2] == ("ident", "class"):
+            return "class"
+        j -= 1
+    if prev_value == "(" and i >= 2 and tokens[i - 2][0] == "ident" and tokens[i - 2][1].endswith("Schema"):
+        return "schema"
+    return "object"
+
+
+def _join(pieces):
+    out = []
+    for piece in pieces:
+        if out:
+            prev = out[-1]
+            attach = (
+                prev in _NO_SPACE_AFTER
+                or piece in _NO_SPACE_BEFORE
+                or (piece[:1] in ("(", "[") and (prev in (")", "]") or (prev[-1:].isalnum() and prev not in _CALL_KEYWORDS)))
+            )
+            if not attach:
+                out.append(" ")
+        out.append(piece)
+    return "".join(out)
+
+
+def _render(tokens, match, start, end, indent, statement_start=None):
+    """Renders tokens[start:end] as one expression/statement with bodies elided."""
+    if statement_start is None:
+        statement_start = start
+    pieces = []
+    i = start
+    while i < end:
+        kind, value, _ = tokens[i]
+        if kind == "template" and len(value) > 60:
+            value = value[:40] + "...`"
+        if kind != "punct" or value not in _OPENERS:
+            pieces.append(value)
+            i += 1
+            continue
+
+        close = min(match.get(i, end - 1), end - 1)
+        if value == "{":
+            brace = _brace_kind(tokens, statement_start, i)
+            if brace == "block":
+                pieces.append("{ ... }")
+            elif brace == "class":
+                members = [_render(tokens, match, s, e, indent + "  ")
+                           for s, e in _split_statements(tokens, match, i + 1, close)]
+                pieces.append("{\n" + "".join(f"{indent}  {m}\n" for m in members) + indent + "}")
+            elif brace == "schema":
+                fields = _split_top_level(tokens, match, i + 1, close, ",")
+                rendered = [_render(tokens, match, s, e, indent + "  ") for s, e in fields]
+                pieces.append("{\n" + "".join(f"{indent}  {r},\n" for r in rendered if r) + indent + "}")
+            else:
+                inner = _render(tokens, match, i + 1, close, indent, statement_start)
+                pieces.append("{ " + inner + " }" if inner and len(inner) <= INLINE_LIMIT else ("{}" if not inner else "{ ... }"))
+        else:
+            inner = _render(tokens, match, i + 1, close, indent, statement_start)
+            if value == "[" and len(inner) > INLINE_LIMIT:
+                inner = "..."
+            pieces.append(value + inner + _OPENERS[value])
+        i = close + 1
+    return _join(pieces)
+
+
+def _split_top_level(tokens, match, start, end, separator):
+    """Splits tokens[start:end] on 'separator' outside nested brackets."""
+    parts = []
+    i = part_start = start
+    while i < end:
+        kind, value, _ = tokens[i]
+        if kind == "punct" and value in _OPENERS:
+            i = min(match.get(i, end - 1), end - 1) + 1
+            continue
+        if kind == "punct" and value == separator:
+            parts.append((part_start, i))
+            part_start = i + 1
+        i += 1
+    if part_start < end:
+        parts.append((part_start, end))
+    return parts
+
+
+def outline_js(text):
+    """Returns the outline of a JS/JSX/TS source: its top-level statements with bodies elided."""
+    tokens = tokenize_js(text)
+    match = _match_brackets(tokens)
+    lines = []
+    for start, end in _split_statements(tokens, match, 0, len(tokens)):
+        rendered = _render(tokens, match, start, end, "")
+        if "\n" not in rendered and len(rendered) > STATEMENT_LIMIT:
+            rendered = rendered[:STATEMENT_LIMIT] + " ..."
+        lines.append(rendered)
+    return "\n".join(lines)
+
+
+# --- CSS and JSON ---
+
+def outline_css(text):
+    """Returns the selectors of a stylesheet, one rule per line, with declarations elided."""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+    lines = []
+    # One entry per open block: True for at-rules (@media ...), whose rules are listed.
+    stack = []
+    selector_start = 0
+    for i, c in enumerate(text):
+        if c == "{":
+            selector = " ".join(text[selector_start:i].split())
+            visible = all(stack)
+            is_at_rule = selector.startswith("@")
+            if visible:
+                indent = "  " * len(stack)
+                lines.append(f"{indent}{selector} {{" if is_at_rule else f"{indent}{selector} {{ ... }}")
+            stack.append(is_at_rule and visible)
+            selector_start = i + 1
+        elif c == "}":
+            if stack and stack.pop():
+                lines.append("  " * len(stack) + "}")
+            selector_start = i + 1
+        elif c == ";" and not stack:
+            # Top-level at-rules such as @import.
+            lines.append(" ".join(text[selector_start:i + 1].split()))
+            selector_start = i + 1
+    return "\n".join(lines)
+
+
+def _outline_json_value(value, depth):
+    if isinstance(value, dict):
+        if depth >= JSON_DEPTH:
+            return f"{{... {len(value)} keys}}"
+        return {key: _outline_json_value(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, list):
+        return f"[... {len(value)} items]"
+    if isinstance(value, str) and len(value) > 60:
+        return value[:40] + "..."
+    return value
+
+
+def outline_json(text):
+    """Returns the keys of a JSON document down to JSON_DEPTH levels, or None if it does not parse."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return json.dumps(_outline_json_value(data, 0), indent=2)
+
+
+def render_outline(relative_path, text):
+    """
+    Returns the outline of a file, or None if its type has no outline
+    renderer (or it could not be parsed) and it should be inlined verbatim.
+    """
+    if relative_path.endswith(".py"):
+        return outline_python(text)
+    if relative_path.endswith(JS_EXTENSIONS):
+        return outline_js(text)
+    if relative_path.endswith(".css"):
+        return outline_css(text)
+    if relative_path.endswith(".json"):
+        return outline_json(text)
+    return None
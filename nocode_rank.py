@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Relevance ranking for nocode_full_prompt.py.
+
+Builds a BM25 inverted index over the identifiers and words of every code file
+and scores the task text in PROMPT_TEMPLATE against it, so only the files that
+matter for the task need to go into the prompt. The index is cached under
+'instance/' and updated incrementally: only files whose size or mtime changed
+are re-read.
+"""
+import fnmatch
+import json
+import math
+import os
+import re
+
+from nocode_context import CHUNK_SIZE, ordered_map, relative_posix_path
+
+INDEX_VERSION = 1
+
+# BM25 parameters (the usual defaults).
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+# Splits camelCase / PascalCase / snake_case identifiers into their parts.
+_SUBWORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have if in into is it its of on or so that the then this to
+was were will with which who what when where why how all any can do does not no yes also please
+const let var function return import export default from require module exports new true false null
+undefined def self class else elif try except catch finally async await
+""".split())
+
+
+def tokenize_terms(text):
+    """
+    Splits text into index terms: every identifier, lowercased, plus its
+    camelCase/snake_case parts ('fetchAllTopBidAsk' -> 'fetchalltopbidask',
+    'fetch', 'all', 'top', 'bid', 'ask'). Stopwords and one-letter terms are dropped.
+    """
+    terms = []
+    for word in _WORD.findall(text):
+        lowered = word.lower()
+        parts = _SUBWORD.findall(word)
+        if lowered not in STOPWORDS and len(lowered) > 1:
+            terms.append(lowered)
+        if len(parts) > 1:
+            for part in parts:
+                part = part.lower()
+                if part not in STOPWORDS and len(part) > 1:
+                    terms.append(part)
+    return terms
+
+
+def _count_terms(path, relative_path):
+    """Returns ({term: count}, length) for a file's content and its path."""
+    counts = {}
+    length = 0
+    # Path components count too: 'services/alertProcessor.js' is about alerts.
+    for term in tokenize_terms(relative_path.replace("/", " ").replace(".", " ")):
+        counts[term] = counts.get(term, 0) + 1
+        length += 1
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        carry = ""
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            # Hold back a trailing partial word so identifiers are not split across chunks.
+            chunk = carry + chunk
+            cut = len(chunk)
+            while cut > 0 and (chunk[cut - 1].isalnum() or chunk[cut - 1] == "_"):
+                cut -= 1
+            if cut == 0:
+                carry = chunk
+                continue
+            carry = chunk[cut:]
+            for term in tokenize_terms(chunk[:cut]):
+                counts[term] = counts.get(term, 0) + 1
+                length += 1
+        for term in tokenize_terms(carry):
+            counts[term] = counts.get(term, 0) + 1
+            length += 1
+    return counts, length
+
+
+class RelevanceIndex:
+    """
+    BM25 index over the code files.
+
+    'docs' maps relative_path -> [size, mtime_ns, length] and 'postings' maps
+    term -> {relative_path: term frequency}. Both are persisted as JSON.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.postings = {}
+
+    @classmethod
+    def load(cls, index_path):
+        """Loads a cached index; returns an empty one if missing or unusable."""
+        index = cls()
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if isinstance(data, dict) and data.get("version") == INDEX_VERSION:
+            index.docs = data.get("docs", {})
+            index.postings = data.get("postings", {})
+        return index
+
+    def save(self, index_path):
+        """Writes the index atomically (temp file + os.replace)."""
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "docs": self.docs, "postings": self.postings}, f)
+        os.replace(tmp_path, index_path)
+
+    def update(self, code_files, root_dir, executor=None, window=64):
+        """
+        Brings the index in line with the current files: new and modified
+        files are (re-)indexed, deleted files are dropped, the rest is kept.
+
+        Returns:
+            int: Number of files that were read.
+        """
+        current = {relative_posix_path(f, root_dir): f for f in code_files}
+        stale = set(self.docs) - set(current)
+        changed = []
+        for relative_path, path in sorted(current.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.add(relative_path)
+                continue
+            doc = self.docs.get(relative_path)
+            if not doc or doc[0] != st.st_size or doc[1] != st.st_mtime_ns:
+                changed.append((relative_path, path, st))
+                stale.add(relative_path)
+
+        if stale:
+            for term in list(self.postings):
+                posting = self.postings[term]
+                for relative_path in stale.intersection(posting):
+                    del posting[relative_path]
+                if not posting:
+                    del self.postings[term]
+            for relative_path in stale:
+                self.docs.pop(relative_path, None)
+
+        def read(job):
+            relative_path, path, st = job
+            try:
+                return _count_terms(path, relative_path)
+            except OSError:
+                return None
+
+        for (relative_path, path, st), result in zip(changed, ordered_map(executor, read, changed, window)):
+            if result is None:
+                continue
+            counts, length = result
+            self.docs[relative_path] = [st.st_size, st.st_mtime_ns, length]
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[relative_path] = tf
+        return len(changed)
+
+    def score(self, query_text):
+        """
+        Scores every indexed file against a query with BM25.
+
+        Returns:
+            dict: {relative_path: score}; files sharing no term with the query score 0.
+        """
+        scores = dict.fromkeys(self.docs, 0.0)
+        n_docs = len(self.docs)
+        if not n_docs:
+            return scores
+        avg_length = sum(doc[2] for doc in self.docs.values()) / n_docs or 1.0
+
+        for term in set(tokenize_terms(query_text)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+            for relative_path, tf in posting.items():
+                length = self.docs[relative_path][2]
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * length / avg_length)
+                scores[relative_path] += idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        return scores
+
+
+def select_relevant(scores, top_files, floor_patterns=()):
+    """
+    Picks the files to keep: the 'top_files' best-scoring files with a score
+    above zero, plus every file matching a floor glob regardless of score.
+
+    Returns:
+        list: Relative paths to keep, best score first.
+    """
+    ranked = sorted(scores, key=lambda p: (-scores[p], p))
+    keep = [p for p in ranked if scores[p] > 0][:top_files]
+    keep_set = set(keep)
+    for relative_path in ranked:
+        if relative_path not in keep_set and any(fnmatch.fnmatch(relative_path, pat) for pat in floor_patterns):
+            keep.append(relative_path)
+            keep_set.add(relative_path)
+    return keep
+
+
+def print_relevance_report(scores, keep):
+    """Prints the kept files with their scores and how many were left out."""
+    print("=" * 30)
+    print("--- Relevance Ranking ---")
+    for relative_path in keep:
+        print(f"  {scores.get(relative_path, 0.0):7.2f}  {relative_path}")
+    print(f"Kept {len(keep)} of {len(scores)} file(s).")
+    print("=" * 30)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Sharding of the context for nocode_full_prompt.py (--shards / --shard-tokens).
+
+Files are split across shards with a size-balanced bin packing that keeps
+each directory in one shard where it can: the files of a directory form one
+item, a directory larger than the target shard size is cut into runs of
+consecutive files, and the items are placed largest first into the
+currently smallest shard (LPT scheduling). With a token capacity per shard,
+the shard count grows until every shard fits.
+"""
+import heapq
+import math
+import posixpath
+
+
+def _directory_items(sizes, limit):
+    """Groups files by directory; directories above 'limit' are cut into runs of consecutive files."""
+    groups = {}
+    for relative_path in sorted(sizes):
+        groups.setdefault(posixpath.dirname(relative_path), []).append(relative_path)
+    items = []
+    for directory, paths in sorted(groups.items()):
+        group_size = sum(sizes[p] for p in paths)
+        if group_size <= limit:
+            items.append((group_size, paths))
+            continue
+        run, run_size = [], 0
+        for relative_path in paths:
+            if run and run_size + sizes[relative_path] > limit:
+                items.append((run_size, run))
+                run, run_size = [], 0
+            run.append(relative_path)
+            run_size += sizes[relative_path]
+        if run:
+            items.append((run_size, run))
+    return items
+
+
+def _place(items, count):
+    """Largest item first into the least loaded shard; returns [(load, [paths])]."""
+    shards = [[0, []] for _ in range(count)]
+    heap = [(0, i) for i in range(count)]
+    for size, paths in sorted(items, key=lambda item: (-item[0], item[1][0])):
+        load, i = heapq.heappop(heap)
+        shards[i][0] += size
+        shards[i][1].extend(paths)
+        heapq.heappush(heap, (load + size, i))
+    return shards
+
+
+def pack_shards(sizes, shards=None, capacity=None):
+    """
+    Splits files into balanced shards.
+
+    Args:
+        sizes (dict): {relative_path: tokens}.
+        shards (int, optional): Number of shards.
+        capacity (int, optional): Maximum tokens per shard; the shard count is
+                                  raised until every shard fits (a single file
+                                  above the capacity still gets a shard of its own).
+
+    Returns:
+        list: [(tokens, [relative paths sorted])] per non-empty shard, ordered by first path.
+    """
+    oversized = sorted(p for p, size in sizes.items() if capacity and size > capacity)
+    result = [(sizes[p], [p]) for p in oversized]
+    sizes = {p: size for p, size in sizes.items() if not (capacity and size > capacity)}
+    if sizes:
+        total = sum(sizes.values())
+        count = (shards - len(oversized)) if shards else 0
+        if capacity:
+            count = max(count, math.ceil(total / capacity))
+        count = max(1, min(count, len(sizes)))
+        while True:
+            limit = total / count
+            if capacity:
+                limit = min(limit, capacity)
+            placed = _place(_directory_items(sizes, limit), count)
+            if not capacity or count >= len(sizes) or max(load for load, _ in placed) <= capacity:
+                break
+            count += 1
+        result.extend((load, sorted(paths)) for load, paths in placed if paths)
+    return sorted(result, key=lambda shard: shard[1][0])
+
+
+def format_shard_manifest(shards, index=None):
+    """
+    The manifest written at the top of every shard: the files of each shard.
+    With 'index' (0-based), a last line says which shard this prompt is.
+    """
+    lines = [f"--- Shard Manifest ({len(shards)} shard(s)) ---"]
+    for number, (tokens, paths) in enumerate(shards, 1):
+        lines.append(f"Shard {number} of {len(shards)} (~{tokens} tokens, {len(paths)} file(s)): " + ", ".join(paths))
+    lines.append("--- End of Shard Manifest ---")
+    if index is not None:
+        lines.append(f"This prompt is shard {index + 1} of {len(shards)}; the files of the other shards are not included.")
+    return "\n".join(lines) + "\n\n"
+
+
+def print_shard_report(shards, capacity=None):
+    """Prints the size and directory spread of every shard."""
+    print("=" * 30)
+    print("--- Shards ---")
+    for number, (tokens, paths) in enumerate(shards, 1):
+        directories = sorted({posixpath.dirname(p) or "." for p in paths})
+        over = " (over capacity)" if capacity and tokens > capacity else ""
+        print(f"  Shard {number}: ~{tokens} tokens{over}, {len(paths)} file(s) in {len(directories)} director(ies)")
+    if shards:
+        loads = [tokens for tokens, _ in shards]
+        print(f"Balance: smallest ~{min(loads)}, largest ~{max(loads)} tokens.")
+    print("=" * 30)
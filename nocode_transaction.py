@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+All-or-nothing file updates for the nocode apply scripts.
+
+Changes are staged in memory together with a snapshot of each file's previous
+content. commit() first writes every new file to a temp file next to its
+target, then moves them all into place with os.replace (deleted files are
+renamed aside rather than removed). If any step fails, every file already
+touched is restored from its in-memory snapshot, so the tree is either fully
+patched or exactly as it was. No '.bak' copies are needed.
+"""
+import os
+
+from nocode_metrics import timed
+
+TEMP_SUFFIX = ".nocode-tmp"
+TRASH_SUFFIX = ".nocode-deleted"
+
+
+class TransactionError(Exception):
+    """Raised by commit() after a failure has been rolled back."""
+
+
+@timed("write")
+def atomic_write(path, text, mode=None, fsync=False):
+    """
+    Writes text (str, or bytes written as-is) to path via a temp file and
+    os.replace, keeping line endings as given. With fsync, the data is flushed
+    to disk before the rename; see fsync_paths for doing that in one batch.
+    """
+    tmp_path = _sibling(path, TEMP_SUFFIX)
+    try:
+        if isinstance(text, bytes):
+            f = open(tmp_path, "wb")
+        else:
+            f = open(tmp_path, "w", encoding="utf-8", newline="")
+        with f:
+            f.write(text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+@timed("fsync")
+def fsync_paths(paths):
+    """
+    Flushes already written files, then their directories (so the renames
+    are durable too), each directory once. Errors are reported, not raised.
+
+    Returns:
+        int: Number of files and directories that failed to sync.
+    """
+    failures = 0
+    directories = set()
+    for path in paths:
+        directories.add(os.path.dirname(os.path.abspath(path)))
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"Warning: fsync failed for {path}: {e}")
+            failures += 1
+    for directory in sorted(directories):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            continue  # e.g. directories cannot be opened on Windows
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return failures
+
+
+def _sibling(path, suffix):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}{suffix}-{os.getpid()}")
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class FileTransaction:
+    """
+    A set of staged file writes/deletions that commit together or not at all.
+
+    Usage:
+        tx = FileTransaction()
+        tx.stage(path, original_text, new_text)   # new_text None deletes the file
+        tx.commit()                               # raises TransactionError after rolling back
+    """
+
+    def __init__(self):
+        # path -> (original text or None if the file did not exist, new text or None to delete)
+        self.staged = {}
+
+    def stage(self, path, original_text, new_text):
+        """Stages one change. original_text is the snapshot used for rollback."""
+        self.staged[path] = (original_text, new_text)
+
+    def __len__(self):
+        return len(self.staged)
+
+    def commit(self):
+        """
+        Applies every staged change, or none of them.
+
+        Raises:
+            TransactionError: If any write, rename or deletion failed; all
+                              changes made so far have been undone.
+        """
+        temps = {}
+        modes = {}
+        created_dirs = []
+        replaced = []
+        trashed = {}
+        try:
+            # Phase 1: write all new contents next to their targets. Nothing is visible yet.
+            for path, (original_text, new_text) in sorted(self.staged.items()):
+                if new_text is None:
+                    continue
+                directory = os.path.dirname(path)
+                missing = []
+                while directory and not os.path.exists(directory):
+                    missing.append(directory)
+                    directory = os.path.dirname(directory)
+                for directory in reversed(missing):
+                    os.mkdir(directory)
+                    created_dirs.append(directory)
+                tmp_path = _sibling(path, TEMP_SUFFIX)
+                temps[path] = tmp_path
+                with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                    f.write(new_text)
+                if original_text is not None and os.path.exists(path):
+                    modes[path] = os.stat(path).st_mode
+                    os.chmod(tmp_path, modes[path])
+
+            # Phase 2: move everything into place. Only renames from here on.
+            for path, (original_text, new_text) in sorted(self.staged.items()):
+                if new_text is None:
+                    if os.path.exists(path):
+                        trash_path = _sibling(path, TRASH_SUFFIX)
+                        os.replace(path, trash_path)
+                        trashed[path] = trash_path
+                    continue
+                os.replace(temps[path], path)
+                del temps[path]
+                replaced.append(path)
+        except Exception as e:
+            self._rollback(replaced, trashed, temps, modes, created_dirs)
+            raise TransactionError(f"{e} (all changes were rolled back)") from e
+
+        for trash_path in trashed.values():
+            _remove_quietly(trash_path)
+
+    def _rollback(self, replaced, trashed, temps, modes, created_dirs):
+        for tmp_path in temps.values():
+            _remove_quietly(tmp_path)
+        for path in replaced:
+            original_text = self.staged[path][0]
+            try:
+                if original_text is None:
+                    os.remove(path)
+                else:
+                    atomic_write(path, original_text, modes.get(path))
+            except OSError as e:
+                print(f"Error: Failed to restore {path} during rollback. Manual check required: {e}")
+        for path, trash_path in trashed.items():
+            try:
+                os.replace(trash_path, path)
+            except OSError as e:
+                print(f"Error: Failed to restore deleted file {path} during rollback. Manual check required: {e}")
+        for directory in reversed(created_dirs):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
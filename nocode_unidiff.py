@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Unified-diff parsing and application for nocode_apply_llm_diff.py.
+
+The diff is parsed once into FilePatch/Hunk objects. Each target file is read
+into memory once, all of its hunks are applied to that buffer, and the result
+is written back once. Every hunk reports where it landed (or why it did not),
+so a partially bad LLM diff can be diagnosed hunk by hunk.
+
+LLM diffs often carry stale line numbers or slightly re-indented context, so
+hunks are relocated: the file's lines are hashed once into a LineIndex, each
+hunk is looked up by its rarest line and the nearest verified match wins,
+falling back to whitespace-insensitive matching and then to ignoring context
+lines at the hunk's edges. The offset and fuzz level are reported per hunk.
+
+The parser is deliberately lenient about what LLMs get wrong: hunk line counts
+in '@@' headers are not trusted (the hunk body runs until the next header),
+and a blank line inside a hunk is read as an empty context line.
+"""
+import re
+
+from nocode_metrics import timed
+
+_HUNK_HEADER = re.compile(r"^@@+ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@+")
+_NULL_PATHS = ("/dev/null", "dev/null")
+
+
+class ParseError(Exception):
+    """Raised when the input contains no usable unified diff."""
+
+
+class Hunk:
+    """One '@@' block: (op, text) lines where op is ' ', '-' or '+'."""
+
+    def __init__(self, source_start, source_length, target_start, target_length, header=""):
+        self.source_start = source_start
+        self.source_length = source_length
+        self.target_start = target_start
+        self.target_length = target_length
+        self.header = header
+        self.lines = []
+        # Set when the last removed/added line has no trailing newline.
+        self.source_no_eol = False
+        self.target_no_eol = False
+
+    @property
+    def old_lines(self):
+        return [text for op, text in self.lines if op != "+"]
+
+    @property
+    def new_lines(self):
+        return [text for op, text in self.lines if op != "-"]
+
+
+class FilePatch:
+    """All hunks for one file, plus the paths from its '---'/'+++' header."""
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.hunks = []
+
+    @property
+    def is_new_file(self):
+        return self.source in _NULL_PATHS
+
+    @property
+    def is_deleted_file(self):
+        return self.target in _NULL_PATHS
+
+    @property
+    def path(self):
+        """Relative path to patch, with git's 'a/' / 'b/' prefixes removed."""
+        path = self.source if self.is_deleted_file else self.target
+        if path[:2] in ("a/", "b/"):
+            path = path[2:]
+        return path
+
+
+class HunkResult:
+    """
+    Outcome of one hunk: 'applied' or 'failed'. For an applied hunk, 'line' is
+    the 1-based line of the original file where it matched, 'offset' how far
+    that is from where the header (plus earlier offsets) put it, 'fuzz' the
+    fuzz level needed (see MAX_FUZZ) and 'span' the number of original lines it covered.
+    """
+
+    def __init__(self, index, status, line=None, offset=0, message="", fuzz=0, span=0):
+        self.index = index
+        self.status = status
+        self.line = line
+        self.offset = offset
+        self.message = message
+        self.fuzz = fuzz
+        self.span = span
+
+    @property
+    def applied(self):
+        return self.status == "applied"
+
+    def describe(self):
+        if self.applied:
+            details = []
+            if self.offset:
+                details.append(f"offset {self.offset:+d} lines")
+            if self.fuzz:
+                details.append(f"fuzz {self.fuzz}")
+            where = f"at line {self.line}"
+            if details:
+                where += f" ({', '.join(details)})"
+            return f"Hunk #{self.index} applied {where}."
+        return f"Hunk #{self.index} FAILED: {self.message}"
+
+
+def _header_path(line):
+    # '--- a/path\t2024-01-01 ...' -> 'a/path'
+    path = line[4:].rstrip("\r\n").split("\t")[0].strip()
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1]
+    return path
+
+
+@timed("parse_diff")
+def parse_unified_diff(text):
+    """
+    Parses a unified diff (git or plain) into FilePatch objects, in one pass.
+
+    Raises:
+        ParseError: If no file header with hunks is found.
+    """
+    lines = text.splitlines()
+    patches = []
+    current = None
+    hunk = None
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < n and lines[i + 1].startswith("+++ "):
+            current = FilePatch(_header_path(line), _header_path(lines[i + 1]))
+            patches.append(current)
+            hunk = None
+            i += 2
+            continue
+        match = _HUNK_HEADER.match(line)
+        if match and current is not None:
+            source_start, source_length, target_start, target_length = match.groups()
+            hunk = Hunk(int(source_start), int(source_length or 1), int(target_start), int(target_length or 1), line)
+            current.hunks.append(hunk)
+            i += 1
+            continue
+        if hunk is not None:
+            if line.startswith("\\"):
+                # '\ No newline at end of file' refers to the previous line.
+                if hunk.lines:
+                    op = hunk.lines[-1][0]
+                    if op in " -":
+                        hunk.source_no_eol = True
+                    if op in " +":
+                        hunk.target_no_eol = True
+                i += 1
+                continue
+            if line[:1] in (" ", "-", "+"):
+                hunk.lines.append((line[0], line[1:]))
+                i += 1
+                continue
+            if line == "":
+                hunk.lines.append((" ", ""))
+                i += 1
+                continue
+        # Anything else ('diff --git', 'index ...', prose) ends the current hunk.
+        hunk = None
+        i += 1
+
+    for patch in patches:
+        for h in patch.hunks:
+            # Blank lines after the last real change are usually just trailing whitespace of the input.
+            while h.lines and h.lines[-1] == (" ", "") and len(h.old_lines) > h.source_length:
+                h.lines.pop()
+    patches = [patch for patch in patches if patch.hunks or patch.is_new_file or patch.is_deleted_file]
+    if not patches:
+        raise ParseError("no file headers ('--- ' / '+++ ') with hunks found")
+    return patches
+
+
+def split_lines(text):
+    """Splits file text into lines without their endings; returns (lines, newline, ends_with_newline)."""
+    newline = "\r\n" if text.count("\r\n") * 2 > text.count("\n") else "\n"
+    ends_with_newline = text.endswith("\n")
+    lines = text.split("\n")
+    if ends_with_newline:
+        lines.pop()
+    if newline == "\r\n":
+        lines = [line[:-1] if line.endswith("\r") else line for line in lines]
+    return lines, newline, ends_with_newline
+
+
+def join_lines(lines, newline, ends_with_newline):
+    """Inverse of split_lines."""
+    text = newline.join(lines)
+    if lines and ends_with_newline:
+        text += newline
+    return text
+
+
+# Fuzz levels, tried in order for every hunk:
+#   0  exact match
+#   1  match ignoring whitespace differences (indentation, trailing spaces, ...)
+#   2  as 1, with up to one context line ignored at each end of the hunk
+#   3  as 1, with up to two context lines ignored at each end of the hunk
+MAX_FUZZ = 3
+
+
+def normalize_line(line):
+    """Whitespace-insensitive form of a line: ends stripped, inner runs collapsed to one space."""
+    return " ".join(line.split())
+
+
+class LineIndex:
+    """
+    Hash index over a file's lines: normalized line -> positions. A hunk is
+    located by looking up its rarest line, so only the positions where it can
+    actually match are verified. The index is built on first use, at most once
+    per file; diffs whose hunks all sit where their headers say never need it.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.normalized = None
+        self.positions = None
+
+    def _build(self):
+        self.normalized = [normalize_line(line) for line in self.lines]
+        self.positions = {}
+        for position, key in enumerate(self.normalized):
+            self.positions.setdefault(key, []).append(position)
+
+    def candidates(self, keys):
+        """Start positions where a block with these normalized lines could begin."""
+        if self.positions is None:
+            self._build()
+        anchor, hits = None, None
+        for offset, key in enumerate(keys):
+            found = self.positions.get(key)
+            if not found:
+                return []
+            if hits is None or len(found) < len(hits):
+                anchor, hits = offset, found
+        last_start = len(self.lines) - len(keys)
+        return [p - anchor for p in hits if 0 <= p - anchor <= last_start]
+
+    def matches(self, old, keys, position, exact):
+        if exact:
+            return self.lines[position:position + len(old)] == old
+        return self.normalized[position:position + len(keys)] == keys
+
+
+def _trim_context(hunk_lines, count):
+    """Drops up to 'count' context lines from each end; returns (lines, dropped at the front)."""
+    front = 0
+    while front < count and front < len(hunk_lines) and hunk_lines[front][0] == " ":
+        front += 1
+    back = 0
+    while back < count and back < len(hunk_lines) - front and hunk_lines[-1 - back][0] == " ":
+        back += 1
+    return hunk_lines[front:len(hunk_lines) - back], front
+
+
+def _overlaps(claimed, start, span):
+    if span == 0:
+        return any(s < start < e for s, e in claimed)
+    return any(start < e and s < start + span for s, e in claimed)
+
+
+def locate_hunk(index, hunk, expected, claimed=()):
+    """
+    Finds where a hunk applies in an indexed file. Fuzz levels are tried in
+    order; within a level the match nearest to the expected position wins.
+    Regions already claimed by earlier hunks are skipped.
+
+    Returns:
+        tuple or None: (0-based position of the first matched line, offset from
+                        the expected position, fuzz level, the hunk's (op, text)
+                        lines without ignored context), or None if not found.
+    """
+    if not hunk.old_lines:
+        # Pure insertion: trust the header.
+        position = min(max(expected, 0), len(index.lines))
+        if _overlaps(claimed, position, 0):
+            return None
+        return position, position - expected, 0, hunk.lines
+
+    old = hunk.old_lines
+    if 0 <= expected and index.lines[expected:expected + len(old)] == old and not _overlaps(claimed, expected, len(old)):
+        return expected, 0, 0, hunk.lines
+
+    tried = set()
+    for fuzz in range(MAX_FUZZ + 1):
+        hunk_lines, front = _trim_context(hunk.lines, fuzz - 1) if fuzz >= 2 else (hunk.lines, 0)
+        old = [text for op, text in hunk_lines if op != "+"]
+        if not old or (fuzz >= 2 and (len(hunk_lines), front) in tried):
+            continue
+        tried.add((len(hunk_lines), front))
+        keys = [normalize_line(line) for line in old]
+        best = None
+        for position in index.candidates(keys):
+            if _overlaps(claimed, position, len(old)) or not index.matches(old, keys, position, fuzz == 0):
+                continue
+            if best is None or abs(position - front - expected) < abs(best - front - expected):
+                best = position
+        if best is not None:
+            return best, best - front - expected, fuzz, hunk_lines
+    return None
+
+
+def apply_hunks(lines, hunks):
+    """
+    Applies hunks to a list of lines in memory.
+
+    Every hunk is located in the original lines through one LineIndex, with the
+    offset found for the previous hunk carried over to the expected position of
+    the next, and the result is assembled in a single pass. Context lines are
+    taken from the file, so a hunk matched with whitespace fuzz keeps the
+    file's own indentation around the change. A failed hunk is skipped and
+    reported; the others still apply.
+
+    Returns:
+        tuple: (new list of lines, [HunkResult]).
+    """
+    index = LineIndex(lines)
+    results = []
+    placed = []
+    claimed = []
+    drift = 0
+    for number, hunk in enumerate(hunks, 1):
+        expected = max(hunk.source_start - 1, 0) + drift
+        if hunk.source_length == 0:
+            # '-N,0' means "insert after line N".
+            expected = hunk.source_start + drift
+        found = locate_hunk(index, hunk, expected, claimed)
+        if found is None:
+            results.append(HunkResult(number, "failed", message="context mismatch: the lines to replace were not found"))
+            continue
+        position, offset, fuzz, hunk_lines = found
+        span = sum(1 for op, _ in hunk_lines if op != "+")
+        drift += offset
+        claimed.append((position, position + span))
+        placed.append((position, number, span, hunk_lines))
+        results.append(HunkResult(number, "applied", line=position + 1, offset=offset, fuzz=fuzz, span=span))
+
+    result = []
+    cursor = 0
+    for position, _, span, hunk_lines in sorted(placed):
+        result.extend(lines[cursor:position])
+        source = position
+        for op, text in hunk_lines:
+            if op == " ":
+                result.append(lines[source])
+                source += 1
+            elif op == "-":
+                source += 1
+            else:
+                result.append(text)
+        cursor = position + span
+    result.extend(lines[cursor:])
+    return result, results
+
+
+@timed("apply_hunks")
+def apply_file_patch(original_text, patch):
+    """
+    Applies one FilePatch to the original file text (None for a missing file).
+
+    A deletion ('+++ /dev/null') only succeeds if its hunks match and remove
+    every line of the file; a new file ('--- /dev/null') fails if the file
+    already exists with different content.
+
+    Returns:
+        tuple: (new text or None if the file is deleted, [HunkResult]).
+    """
+    return _apply_file_patch(original_text, patch)
+
+
+def _apply_file_patch(original_text, patch):
+    if patch.is_deleted_file:
+        if original_text is None:
+            return None, [HunkResult(1, "failed", message="file does not exist")]
+        # The removed lines must be the file's content, or a wrong hunk would delete data.
+        lines = split_lines(original_text)[0]
+        new_lines, results = apply_hunks(lines, patch.hunks)
+        if not all(r.applied for r in results):
+            return original_text, results
+        if new_lines:
+            message = f"the removed lines do not cover the file ({len(new_lines)} line(s) would remain)"
+            return original_text, results + [HunkResult(len(results) + 1, "failed", message=message)]
+        return None, results or [HunkResult(1, "applied", line=1, message="file deleted")]
+
+    if patch.is_new_file and original_text is not None:
+        # Re-creating a file with the content it already has is fine; anything else would be merged into it.
+        created, results = _apply_file_patch(None, patch)
+        if created == original_text and all(r.applied for r in results):
+            return original_text, results
+        return original_text, [HunkResult(1, "failed", message="file already exists")]
+
+    if original_text is None:
+        if not patch.is_new_file and any(h.old_lines for h in patch.hunks):
+            return original_text, [HunkResult(1, "failed", message="file does not exist")]
+        lines, newline, ends_with_newline = [], "\n", True
+    else:
+        lines, newline, ends_with_newline = split_lines(original_text)
+
+    new_lines, results = apply_hunks(lines, patch.hunks)
+    if patch.hunks and all(r.applied for r in results):
+        # The hunk ending at the original end of file decides the final newline.
+        for hunk, result in zip(patch.hunks, results):
+            if result.line - 1 + result.span == len(lines):
+                if hunk.target_no_eol:
+                    ends_with_newline = False
+                elif hunk.source_no_eol:
+                    ends_with_newline = True
+    return join_lines(new_lines, newline, ends_with_newline), results
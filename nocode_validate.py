@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Syntax gate for the nocode apply scripts: a file produced from LLM output
+is only written if it still parses.
+
+    .py          ast.parse
+    .json        json.loads
+    .js / .jsx   the tokenizer of nocode_outline (scan_js): brackets must
+                 balance, template literals and block comments must be closed
+
+The JS check is a tokenizer check, not a parser: it catches truncated and
+mismatched code, which is what broken LLM output usually looks like, without
+rejecting valid syntax it does not know. A file only fails the gate if its
+previous version passed the same check, so a file that was already broken
+(or uses syntax the check cannot follow) never blocks an update.
+
+Checks run in the calling process until PARALLEL_BYTES of text have come
+through, then on a pool of worker processes (parsing is CPU-bound and holds the GIL).
+Results always come back in input order.
+"""
+import ast
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from nocode_metrics import add_span, count
+from nocode_outline import scan_js
+
+VALIDATED_EXTENSIONS = (".py", ".json", ".js", ".jsx")
+DEFAULT_VALIDATION_WORKERS = os.cpu_count() or 1
+# Below this much text, starting worker processes costs more than it saves.
+PARALLEL_BYTES = 1 << 20
+
+_OPENERS = {"(": ")", "[": "]", "{": "}"}
+_CLOSERS = {")", "]", "}"}
+
+
+def check_python(text):
+    try:
+        ast.parse(text)
+    except SyntaxError as e:
+        return f"line {e.lineno}: {e.msg}"
+    except ValueError as e:  # e.g. null bytes
+        return str(e)
+    return None
+
+
+def check_json(text):
+    try:
+        json.loads(text)
+    except json.JSONDecodeError as e:
+        return f"line {e.lineno} column {e.colno}: {e.msg}"
+    return None
+
+
+def check_js(text):
+    """Bracket balance and unterminated templates and block comments, from scan_js tokens."""
+    stack = []
+    for kind, start, end, line in scan_js(text):
+        if kind == "comment":
+            if text.startswith("/*", start) and (end - start < 4 or not text.startswith("*/", end - 2)):
+                return f"line {line}: unterminated block comment"
+        elif kind == "template":
+            if end - start < 2 or text[end - 1] != "`":
+                return f"line {line}: unterminated template literal"
+        elif kind == "punct":
+            value = text[start:end]
+            if value in _OPENERS:
+                stack.append((value, line))
+            elif value in _CLOSERS:
+                if not stack:
+                    return f"line {line}: unexpected '{value}'"
+                opener, opened = stack.pop()
+                if _OPENERS[opener] != value:
+                    return f"line {line}: '{value}' does not match '{opener}' opened on line {opened}"
+    if stack:
+        opener, opened = stack[-1]
+        return f"line {opened}: '{opener}' is never closed"
+    return None
+
+
+def check_source(relative_path, text):
+    """Returns a description of the syntax error in 'text', or None if it passes (or is not checked)."""
+    if relative_path.endswith(".py"):
+        return check_python(text)
+    if relative_path.endswith(".json"):
+        return check_json(text)
+    if relative_path.endswith((".js", ".jsx")):
+        return check_js(text)
+    return None
+
+
+def _check_item(item):
+    """
+    The gate for one (relative_path, new_text, original_text, original_path)
+    item. The previous version is read from original_path only when needed.
+    """
+    relative_path, text, original, original_path = item
+    error = check_source(relative_path, text)
+    if error is None:
+        return None
+    if original is None and original_path and os.path.isfile(original_path):
+        try:
+            with open(original_path, "r", encoding="utf-8", newline="") as f:
+                original = f.read()
+        except (OSError, UnicodeDecodeError):
+            return error
+    if original is not None and check_source(relative_path, original) is not None:
+        return None  # it did not pass before either
+    return error
+
+
+def _timed_check(item):
+    """
+    Runs _check_item and returns (error, seconds). Runs in worker processes,
+    whose spans would be lost, so the parent records the time (see _finish).
+    """
+    started = time.perf_counter()
+    error = _check_item(item)
+    return error, time.perf_counter() - started
+
+
+def _finish(entry):
+    """The error of a finished check, recording its time under the 'validate' span."""
+    if entry is None:
+        return None
+    error, seconds = entry.result() if hasattr(entry, "result") else entry
+    add_span("validate", seconds)
+    return error
+
+
+def iter_checks(entries, workers=DEFAULT_VALIDATION_WORKERS, to_item=None):
+    """
+    Runs the gate over 'entries', which may be a lazy iterator (e.g. a
+    streaming parser).
+
+    Args:
+        entries (iterable): (relative_path, new_text, original_text, original_path)
+                            items, or anything 'to_item' turns into one.
+        workers (int): Worker processes once there is enough text (1 = inline).
+        to_item (callable, optional): Maps an entry to its item, or to None for
+                                      an entry that is not to be checked.
+
+    Yields:
+        tuple: (entry, error or None), in input order. Entries whose type is not
+               checked come back at once; others as soon as their check is done.
+    """
+    pool = None
+    pending = deque()
+    seen_bytes = 0
+    window = max(workers, 1) * 4
+    try:
+        for entry in entries:
+            item = to_item(entry) if to_item else entry
+            if item is None or not item[0].endswith(VALIDATED_EXTENSIONS):
+                pending.append((entry, None))
+            else:
+                count("validate.files")
+                seen_bytes += len(item[1])
+                if pool is None and workers > 1 and seen_bytes >= PARALLEL_BYTES:
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                pending.append((entry, pool.submit(_timed_check, item) if pool else _timed_check(item)))
+            # Hand back everything that is ready, and wait once the window is full.
+            while pending and (len(pending) >= window or not hasattr(pending[0][1], "done") or pending[0][1].done()):
+                entry, result = pending.popleft()
+                yield entry, _finish(result)
+        while pending:
+            entry, result = pending.popleft()
+            yield entry, _finish(result)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def validate_files(items, workers=DEFAULT_VALIDATION_WORKERS):
+    """
+    Runs the gate over a list of (relative_path, new_text, original_text, original_path).
+
+    Returns:
+        dict: {relative_path: error} for the files that fail.
+    """
+    errors = {}
+    for item, error in iter_checks(items, workers):
+        if error:
+            errors[item[0]] = error
+            count("validate.failed")
+    return errors
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Watch mode for nocode_full_prompt.py ('--watch').
+
+After one normal build, the output is kept in memory as its segments
+(header, one section per file, markers, footer) and the project is watched
+for changes: through inotify on Linux (via ctypes, no extra dependency) or,
+elsewhere or on request, by polling the stat of the tracked files and
+directories. Bursts of events are debounced; then only the sections of the
+files that changed are re-read and re-rendered, the output is rewritten from
+memory (atomically) and its manifest updated, so a normal build afterwards
+still reuses everything. Files being created, deleted or renamed, ignore
+files changing or directories appearing trigger a rescan and a normal
+incremental build instead, since they can change the file selection.
+Directories the scanner skips (excluded names, and paths matched by
+.gitignore / .nocodeignore) are not watched, and events under them are
+dropped, so e.g. 'npm install' or a build writing to 'dist' cause nothing.
+
+The current prompt can also be served over a local Unix socket: every
+connection receives the full prompt and is closed, e.g.
+'socat - UNIX-CONNECT:instance/llm_code_input.sock > prompt.txt'.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+from nocode_context import (load_file_section, load_manifest, manifest_path_for, relative_posix_path,
+                            render_error_section, save_manifest)
+from nocode_ignore import IGNORE_FILE_NAMES, IgnoreTree
+
+DEFAULT_DEBOUNCE = 0.3
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify(7) constants.
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+
+def _skipped_directory(path, exclude_dirs, ignore=None):
+    """True if gather_code_files would not enter the directory (excluded name, symlink or ignored)."""
+    return (os.path.basename(path) in exclude_dirs or os.path.islink(path)
+            or (ignore is not None and ignore.ignored(path, True)))
+
+
+def _watched_directories(root, exclude_dirs, ignore=None):
+    """All directories under root the scanner enters ('ignore' is an IgnoreTree of the root)."""
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not _skipped_directory(os.path.join(dirpath, d), exclude_dirs, ignore)]
+        yield dirpath
+
+
+class InotifyWatcher:
+    """
+    Recursive inotify watch of a tree. read() returns (kind, path) events,
+    kind being 'modified', 'created', 'deleted', 'tree' (a directory appeared
+    or disappeared) or 'overflow' (events were lost).
+    """
+
+    def __init__(self, root, exclude_dirs, ignore=None):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.root = root
+        self.exclude_dirs = exclude_dirs
+        self.ignore = ignore
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        try:
+            for directory in _watched_directories(root, exclude_dirs, ignore):
+                self._add(directory)
+        except OSError:
+            self.close()
+            raise
+
+    def _add(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            if code == errno.ENOSPC:
+                raise OSError(code, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            return  # vanished or unreadable meanwhile
+        self.directories[wd] = directory
+
+    def track(self, files, ignore=None):
+        """
+        Every directory is watched already; with new ignore rules, directories
+        they no longer skip are added (events under newly skipped ones are
+        dropped by classify_events).
+        """
+        if ignore is not None and ignore is not self.ignore:
+            self.ignore = ignore
+            watched = set(self.directories.values())
+            for directory in _watched_directories(self.root, self.exclude_dirs, ignore):
+                if directory not in watched:
+                    self._add(directory)
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    events.append(("overflow", None))
+                    continue
+                if mask & IN_IGNORED:
+                    self.directories.pop(wd, None)
+                    continue
+                directory = self.directories.get(wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not _skipped_directory(path, self.exclude_dirs, self.ignore):
+                        for subdirectory in _watched_directories(path, self.exclude_dirs, self.ignore):
+                            self._add(subdirectory)
+                    if mask & (IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                        events.append(("tree", path))
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    events.append(("created", path))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    events.append(("deleted", path))
+                else:
+                    events.append(("modified", path))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """
+    Fallback watcher: every 'interval' seconds, stats the tracked files and
+    all directories (a directory's mtime changes when entries are added or
+    removed). Same events as InotifyWatcher.
+    """
+
+    def __init__(self, root, exclude_dirs, interval=DEFAULT_POLL_INTERVAL, ignore=None):
+        self.root = root
+        self.exclude_dirs = exclude_dirs
+        self.interval = interval
+        self.ignore = ignore
+        self.files = {}
+        self.directories = {}
+        self._next_poll = 0.0
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def track(self, files, ignore=None):
+        if ignore is not None:
+            self.ignore = ignore
+        self.files = {f: self._stamp(f) for f in files}
+        self.directories = {d: self._stamp(d) for d in _watched_directories(self.root, self.exclude_dirs, self.ignore)}
+        self._next_poll = time.monotonic() + self.interval
+
+    def read(self, timeout):
+        delay = max(0.0, self._next_poll - time.monotonic())
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(delay)
+        self._next_poll = time.monotonic() + self.interval
+        events = []
+        for path, stamp in self.files.items():
+            current = self._stamp(path)
+            if current != stamp:
+                self.files[path] = current
+                events.append(("deleted" if current is None else "modified", path))
+        for path, stamp in self.directories.items():
+            current = self._stamp(path)
+            if current != stamp:
+                self.directories[path] = current
+                events.append(("tree", path))
+        return events
+
+    def close(self):
+        pass
+
+
+def open_watcher(root, exclude_dirs, poll_interval=None, ignore=None):
+    """Returns an InotifyWatcher where possible, else a PollingWatcher ('poll_interval' forces polling)."""
+    if poll_interval is None and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root, exclude_dirs, ignore)
+        except (OSError, AttributeError) as e:
+            print(f"Warning: inotify unavailable ({e}); falling back to polling.")
+    return PollingWatcher(root, exclude_dirs, poll_interval or DEFAULT_POLL_INTERVAL, ignore)
+
+
+def collect_changes(watcher, debounce=DEFAULT_DEBOUNCE):
+    """Blocks until something changes, then until no event arrived for 'debounce' seconds."""
+    events = []
+    while not events:
+        events = watcher.read(None)
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return events
+        events.extend(more)
+
+
+def classify_events(events, scanned, planned, extensions, exclude_dirs, ignore=None):
+    """
+    Sorts watcher events into section patches and rescans. Events for paths
+    the scanner skips (see IgnoreTree) are dropped.
+
+    Args:
+        scanned (set): Absolute paths of all files found by the last scan.
+        planned (dict): {absolute path: relative path} of the files in the prompt.
+        ignore (IgnoreTree, optional): The ignore rules of the last scan.
+
+    Returns:
+        tuple: (set of relative paths to re-render, bool whether the file set must be rescanned).
+    """
+    patch = set()
+    rescan = False
+    for kind, path in events:
+        if kind == "overflow":
+            rescan = True
+            continue
+        path = os.path.abspath(path)
+        name = os.path.basename(path)
+        if ignore is not None and path not in scanned and ignore.ignored(path, kind == "tree"):
+            continue
+        if kind == "tree":
+            rescan = rescan or name not in exclude_dirs
+        elif name in IGNORE_FILE_NAMES:
+            rescan = True
+        elif path in planned and kind != "deleted":
+            # Editors often save by renaming a temp file over the original: a 'created' of a known file.
+            patch.add(planned[path])
+        elif kind == "deleted":
+            rescan = rescan or path in scanned
+        elif kind == "created":
+            rescan = rescan or (name.endswith(extensions) and not name.startswith("nocode_"))
+    return patch, rescan
+
+
+class LiveContext:
+    """
+    In-memory copy of a built context file, patched section by section.
+
+    load() takes the plan the file was built with (see plan_prompt) and
+    splits the output into its layout segments; patch() re-renders the
+    sections of some files and rewrites output and manifest.
+    """
+
+    def __init__(self, output_file, root_dir, max_file_bytes=None, oversize="truncate", compact=None):
+        self.output_file = output_file
+        self.root_dir = root_dir
+        self.max_file_bytes = max_file_bytes
+        self.oversize = oversize
+        self.compact = compact
+        self.data = b""
+
+    def load(self, plan):
+        manifest = load_manifest(manifest_path_for(self.output_file), self.output_file)
+        if manifest is None or not manifest.get("layout"):
+            raise OSError(f"no current manifest for {self.output_file}")
+        with open(self.output_file, "rb") as f:
+            data = f.read()
+        self.manifest = manifest
+        self.segments = []
+        offset = 0
+        for key, length in manifest["layout"]:
+            self.segments.append([key, data[offset:offset + length]])
+            offset += length
+        self.data = data
+
+        # Same order as build_context_file: header, then each file's section and optional marker, then footer.
+        code_files = plan["code_files"] if plan["keep_order"] else sorted(plan["code_files"])
+        breakpoints = plan["breakpoints"] or {}
+        self.file_limits = plan["file_limits"] or {}
+        self.outline_files = plan["outline_files"] or set()
+        self.paths = {}
+        self.positions = {}
+        position = 1
+        for path in code_files:
+            relative_path = relative_posix_path(path, self.root_dir)
+            self.paths[relative_path] = path
+            self.positions[relative_path] = position
+            position += 2 if relative_path in breakpoints else 1
+
+    def patch(self, relative_paths):
+        """
+        Re-renders the given files' sections and rewrites the output if any changed.
+
+        Returns:
+            tuple: (number of sections whose content changed, bytes of unchanged output prefix).
+        """
+        files = self.manifest["files"]
+        changed = []
+        for relative_path in sorted(relative_paths, key=lambda p: self.positions[p]):
+            cached = files.get(relative_path)
+            limit = self.file_limits.get(relative_path)
+            outline = relative_path in self.outline_files
+            result = load_file_section(self.paths[relative_path], relative_path, cached,
+                                       self.max_file_bytes, self.oversize, limit, outline, self.compact)
+            segment = self.segments[self.positions[relative_path]]
+            if "error" in result:
+                files.pop(relative_path, None)
+                section = render_error_section(relative_path, result["error"]).encode("utf-8")
+                key = None
+            elif result["section"] is None:
+                # Touched but not modified: only the stat changes.
+                cached.update(size=result["stat"].st_size, mtime_ns=result["stat"].st_mtime_ns)
+                continue
+            else:
+                st = result["stat"]
+                section = result["section"]
+                key = f"file:{relative_path}:{result['sha256']}:{limit}:{outline}"
+                files[relative_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": result["sha256"],
+                                        "offset": 0, "length": len(section), "limit": limit, "outline": outline}
+                if result.get("compacted"):
+                    files[relative_path]["saved"] = list(result["compacted"])
+            if segment != [key, section]:
+                self.segments[self.positions[relative_path]] = [key, section]
+                changed.append(self.positions[relative_path])
+
+        prefix = len(self.data)
+        if changed:
+            prefix = sum(len(segment[1]) for segment in self.segments[:min(changed)])
+            self.data = b"".join(segment[1] for segment in self.segments)
+            # New offsets of every section, in one pass over the segments.
+            offset = 0
+            by_position = {position: relative_path for relative_path, position in self.positions.items()}
+            for position, (key, section) in enumerate(self.segments):
+                relative_path = by_position.get(position)
+                if relative_path in files:
+                    files[relative_path]["offset"] = offset
+                    files[relative_path]["length"] = len(section)
+                offset += len(section)
+            tmp_output = self.output_file + ".tmp"
+            with open(tmp_output, "wb") as f:
+                f.write(self.data)
+            os.replace(tmp_output, self.output_file)
+            self.manifest["layout"] = [[key, len(section)] for key, section in self.segments]
+        st = os.stat(self.output_file)
+        self.manifest["output"] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        save_manifest(manifest_path_for(self.output_file), self.manifest)
+        return len(changed), prefix
+
+
+def serve_prompt(socket_path, live):
+    """
+    Serves live.data on a Unix socket from a daemon thread: each connection
+    receives the current prompt and is closed. Returns the listening socket.
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(16)
+
+    def accept_loop():
+        # Leave Ctrl+C / SIGTERM to the main thread, which may be blocked waiting for file events.
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT, signal.SIGTERM})
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return  # closed
+            with conn:
+                try:
+                    conn.sendall(live.data)
+                except OSError:
+                    pass
+
+    threading.Thread(target=accept_loop, name="prompt-server", daemon=True).start()
+    return server
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def watch_context(live, rebuild, code_files, plan, root_dir, extensions, exclude_dirs,
+                  debounce=DEFAULT_DEBOUNCE, poll_interval=None, socket_path=None, use_gitignore=True):
+    """
+    Keeps 'live' up to date until interrupted (Ctrl+C or SIGTERM).
+
+    Args:
+        live (LiveContext): Loaded with the plan of the initial build.
+        rebuild (callable): Rescans and rebuilds the output incrementally;
+                            returns (code_files, plan).
+        code_files (list): Files found by the initial scan.
+        plan (dict): The plan of the initial build.
+        debounce (float): Seconds without events before changes are applied.
+        poll_interval (float, optional): Poll instead of using inotify.
+        socket_path (str, optional): Also serve the prompt on this Unix socket.
+        use_gitignore (bool): Whether the scan honors .gitignore files (as in gather_code_files).
+    """
+    state = {"ignore": IgnoreTree(root_dir, use_gitignore)}
+    watcher = open_watcher(root_dir, exclude_dirs, poll_interval, state["ignore"])
+    server = None
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        def track(files, plan, ignore=None):
+            if ignore is not None:
+                state["ignore"] = ignore
+            state["scanned"] = {os.path.abspath(f) for f in files}
+            state["planned"] = {os.path.abspath(f): relative_posix_path(f, root_dir) for f in plan["code_files"]}
+            watcher.track(files, ignore)
+
+        track(code_files, plan)
+        if socket_path:
+            server = serve_prompt(socket_path, live)
+            print(f"Serving the prompt on '{os.path.abspath(socket_path)}'.")
+        kind = "inotify" if isinstance(watcher, InotifyWatcher) else f"polling every {watcher.interval}s"
+        print(f"Watching '{os.path.abspath(root_dir)}' ({kind}); press Ctrl+C to stop.")
+
+        while True:
+            events = collect_changes(watcher, debounce)
+            patch, rescan = classify_events(events, state["scanned"], state["planned"], extensions, exclude_dirs,
+                                            state["ignore"])
+            started = time.perf_counter()
+            try:
+                if rescan:
+                    files, plan = rebuild()
+                    live.load(plan)
+                    # Ignore files may have changed: reload the rules with the new scan.
+                    track(files, plan, IgnoreTree(root_dir, use_gitignore))
+                    print(f"[watch] File set changed; rebuilt in {(time.perf_counter() - started) * 1000:.0f} ms "
+                          f"({len(plan['code_files'])} file(s), {len(live.data)} bytes).")
+                elif patch:
+                    changed, prefix = live.patch(patch)
+                    print(f"[watch] {len(patch)} file(s) changed, {changed} section(s) patched in "
+                          f"{(time.perf_counter() - started) * 1000:.1f} ms; first {prefix} of {len(live.data)} bytes unchanged.")
+            except (OSError, ValueError) as e:
+                # e.g. the seeds no longer exist; keep watching for the next change.
+                print(f"[watch] Error: {e}")
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()
+        if server is not None:
+            server.close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
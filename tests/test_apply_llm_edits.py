@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from nocode_apply_llm_edits import EditParseError, apply_blocks, apply_edits, parse_edit_blocks
+
+
+def test_json_answer_reports_success(tmp_path):
+    answer = json.dumps([{"filePath": "a.py", "content": "x = 1\n"}])
+    assert apply_edits(answer, str(tmp_path)) is True
+    assert (tmp_path / "a.py").read_text() == "x = 1\n"
+
+
+def test_json_answer_reports_malformed_json(tmp_path):
+    assert apply_edits('[{"filePath": "a.py", "content": ', str(tmp_path)) is False
+
+
+def test_json_answer_reports_syntax_gate_rejection(tmp_path):
+    answer = json.dumps([{"filePath": "a.py", "content": "x = (\n"}])
+    assert apply_edits(answer, str(tmp_path)) is False
+    assert not (tmp_path / "a.py").exists()
+
+
+def test_path_line_is_found_and_reused():
+    answer = ("Here is the fix.\n\n"
+              "```text\n"
+              "**src/app.py**\n"
+              "<<<<<<< SEARCH\nx = 1\n=======\nx = 2\n>>>>>>> REPLACE\n"
+              "<<<<<<< SEARCH\ny = 1\n=======\ny = 2\n>>>>>>> REPLACE\n"
+              "`lib/util.js`:\n"
+              "<<<<<<< SEARCH\na();\n=======\nb();\n>>>>>>> REPLACE\n"
+              "```\n")
+    blocks = parse_edit_blocks(answer)
+    assert [(b.path, b.search, b.replace) for b in blocks] == [
+        ("src/app.py", ["x = 1"], ["x = 2"]),
+        ("src/app.py", ["y = 1"], ["y = 2"]),
+        ("lib/util.js", ["a();"], ["b();"]),
+    ]
+
+
+def test_prose_word_is_not_a_path():
+    answer = "Changes:\n<<<<<<< SEARCH\nx = 1\n=======\nx = 2\n>>>>>>> REPLACE\n"
+    with pytest.raises(EditParseError):
+        parse_edit_blocks(answer)
+    # After a block, a prose line keeps the previous path instead of naming a file "Changes".
+    blocks = parse_edit_blocks("app.py\n" + answer.split("\n", 1)[1] + "\n" + answer)
+    assert [block.path for block in blocks] == ["app.py", "app.py"]
+
+
+def test_full_file_block():
+    (block,) = parse_edit_blocks("new/mod.py\n<<<<<<< SEARCH\n=======\na = 1\nb = 2\n>>>>>>> REPLACE\n")
+    assert block.is_full_file
+    assert apply_blocks(None, [block]) == ("a = 1\nb = 2\n", [])
+    assert apply_blocks("old = 0\n", [block]) == ("a = 1\nb = 2\n", [])
+
+
+def test_block_is_retried_after_an_earlier_block():
+    # The second block searches for text the first one creates.
+    blocks = parse_edit_blocks("m.py\n"
+                               "<<<<<<< SEARCH\nz = 0\n=======\nz = 0\nw = 3\n>>>>>>> REPLACE\n"
+                               "<<<<<<< SEARCH\nw = 3\n=======\nw = 4\n>>>>>>> REPLACE\n")
+    new_text, failures = apply_blocks("a = 1\nz = 0\n", blocks)
+    assert failures == []
+    assert new_text == "a = 1\nz = 0\nw = 4\n"
+
+
+def test_unmatched_block_leaves_file_unchanged(tmp_path, capsys):
+    (tmp_path / "m.py").write_text("a = 1\nb = 2\n")
+    answer = ("m.py\n"
+              "<<<<<<< SEARCH\na = 1\n=======\na = 10\n>>>>>>> REPLACE\n"
+              "<<<<<<< SEARCH\nc = 3\n=======\nc = 30\n>>>>>>> REPLACE\n")
+    assert apply_edits(answer, str(tmp_path)) is False
+    assert (tmp_path / "m.py").read_text() == "a = 1\nb = 2\n"
+    out = capsys.readouterr().out
+    assert "Follow-up prompt" in out and "* m.py" in out
@@ -0,0 +1,46 @@
+from nocode_budget import MIN_TRUNCATED_TOKENS, default_priority, pack_files, section_overhead_tokens
+
+
+def _measured(files):
+    return {path: {"relative_path": path, "size": tokens * 4, "tokens": tokens} for path, tokens in files.items()}
+
+
+def test_large_high_priority_file_is_truncated_not_dropped():
+    measured = _measured({
+        "src/big.js": 6000,
+        "docker-compose.yml": 300,
+        "package.json": 300,
+        "README.md": 300,
+    })
+    budget = 2000
+    plans = pack_files(measured, budget, default_priority)
+
+    big = plans["src/big.js"]
+    assert big["mode"] == "truncated"
+    assert big["shown_tokens"] >= MIN_TRUNCATED_TOKENS
+    assert 0 < big["max_bytes"] < measured["src/big.js"]["size"]
+    # The lower-priority files get nothing the source file needed.
+    assert all(plans[path]["mode"] == "omitted" for path in ("docker-compose.yml", "package.json", "README.md"))
+    assert sum(plan["used_tokens"] for plan in plans.values()) <= budget
+
+
+def test_truncation_counts_markers_and_note():
+    measured = _measured({"src/big.js": 6000})
+    plans = pack_files(measured, 1000, default_priority)
+    plan = plans["src/big.js"]
+    assert plan["shown_tokens"] < 1000 - section_overhead_tokens("src/big.js")
+
+
+def test_lower_priority_files_fill_the_space_a_too_small_truncation_leaves():
+    measured = _measured({"src/big.js": 6000, "package.json": 50})
+    budget = MIN_TRUNCATED_TOKENS // 2
+    plans = pack_files(measured, budget, default_priority)
+    assert plans["src/big.js"]["mode"] == "omitted"
+    assert plans["package.json"]["mode"] == "full"
+
+
+def test_untruncatable_rendering_is_omitted():
+    measured = _measured({"src/big.js": 6000})
+    measured["src/big.js"]["truncatable"] = False
+    plans = pack_files(measured, 2000, default_priority)
+    assert plans["src/big.js"]["mode"] == "omitted"
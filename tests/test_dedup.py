@@ -0,0 +1,36 @@
+import re
+
+from nocode_context import build_context_file
+
+NOTE = re.compile(r"^\[\.\.\. lines (\d+)-(\d+) of (\S+) repeated here; omitted \.\.\.\]$")
+
+
+def _bodies(text):
+    return {m.group(1): m.group(2).split("\n")
+            for m in re.finditer(r"--- Start of (\S+) ---\n(.*?)\n--- End of \1 ---\n\n", text, re.S)}
+
+
+def test_chunk_references_are_lines_of_the_referenced_section(tmp_path):
+    shared = "".join(f"def handler_{i}(request):\n    return render(request, 'page_{i}.html', {{'id': {i}}})\n"
+                     for i in range(40))
+    (tmp_path / "a.py").write_text("import os\n\n" + shared)
+    (tmp_path / "b.py").write_text("import sys\nimport json\n\n\n" + shared + "\nprint('done')\n")
+    output = tmp_path / "out.txt"
+    build_context_file(str(output), [str(tmp_path / "a.py"), str(tmp_path / "b.py")], str(tmp_path),
+                       header="HEADER\nMORE HEADER\n\n", workers=1, dedup="chunks")
+
+    bodies = _bodies(output.read_text())
+    notes = [NOTE.match(line) for line in bodies["b.py"] if NOTE.match(line)]
+    assert notes
+
+    # Following each note into a.py's section (line 1 = first line after its start marker) restores b.py.
+    expanded = []
+    for line in bodies["b.py"]:
+        match = NOTE.match(line)
+        if match:
+            first, last, source = int(match.group(1)), int(match.group(2)), match.group(3)
+            assert source == "a.py" and last <= len(bodies["a.py"])
+            expanded.extend(bodies["a.py"][first - 1:last])
+        else:
+            expanded.append(line)
+    assert "\n".join(expanded) == (tmp_path / "b.py").read_text()
@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "nocode_full_prompt.py")
+
+
+def _run(cwd, *args):
+    return subprocess.run([sys.executable, SCRIPT, *args], cwd=cwd, capture_output=True, text=True)
+
+
+def test_unknown_seed_writes_no_prompt(tmp_path):
+    (tmp_path / "a.js").write_text("export const a = 1;\n")
+    result = _run(tmp_path, "--seed", "nope.js")
+    assert result.returncode == 1
+    assert "none of the --seed files" in result.stdout
+    assert not (tmp_path / "instance" / "llm_code_input.txt").exists()
+
+
+def test_batch_task_with_unknown_seed_is_skipped(tmp_path):
+    (tmp_path / "a.js").write_text("export const a = 1;\n")
+    (tmp_path / "tasks.jsonl").write_text('{"id": "good", "task": "do a"}\n'
+                                          '{"id": "bad", "task": "do b", "seed": ["nope.js"]}\n')
+    result = _run(tmp_path, "--batch", "tasks.jsonl", "--batch-dir", "batch")
+    assert result.returncode == 1
+    index = json.loads((tmp_path / "batch" / "index.json").read_text())
+    assert [task["id"] for task in index["tasks"]] == ["good", "bad"]
+    assert "output" in index["tasks"][0] and "error" not in index["tasks"][0]
+    assert "none of the --seed files" in index["tasks"][1]["error"]
+    assert not (tmp_path / "batch" / "bad.txt").exists()
+
+
+def test_batch_exit_status(tmp_path):
+    (tmp_path / "a.js").write_text("export const a = 1;\n")
+    (tmp_path / "tasks.jsonl").write_text('{"id": "one", "task": "do a"}\n{"id": "two", "task": "do b"}\n')
+    assert _run(tmp_path, "--batch", "tasks.jsonl", "--batch-dir", "batch").returncode == 0
+    assert (tmp_path / "batch" / "two.txt").exists()
+
+    result = _run(tmp_path, "--batch", "missing.jsonl", "--batch-dir", "batch")
+    assert result.returncode == 1
+    assert "Batch build failed" in result.stdout
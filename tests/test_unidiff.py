@@ -0,0 +1,63 @@
+from nocode_unidiff import apply_file_patch, parse_unified_diff
+
+
+def _apply(original_text, diff):
+    (patch,) = parse_unified_diff(diff)
+    return apply_file_patch(original_text, patch)
+
+
+def test_delete_with_mismatched_lines_fails():
+    diff = "--- a/y.py\n+++ /dev/null\n@@ -1,1 +0,0 @@\n-totally different\n"
+    new_text, results = _apply("keep me\nimportant\n", diff)
+    assert new_text == "keep me\nimportant\n"
+    assert not all(r.applied for r in results)
+
+
+def test_delete_of_a_part_of_the_file_fails():
+    diff = "--- a/y.py\n+++ /dev/null\n@@ -1,1 +0,0 @@\n-keep me\n"
+    new_text, results = _apply("keep me\nimportant\n", diff)
+    assert new_text == "keep me\nimportant\n"
+    assert not all(r.applied for r in results)
+
+
+def test_delete_matching_the_whole_file():
+    diff = "--- a/y.py\n+++ /dev/null\n@@ -1,2 +0,0 @@\n-keep me\n-important\n"
+    new_text, results = _apply("keep me\nimportant\n", diff)
+    assert new_text is None
+    assert all(r.applied for r in results)
+
+
+def test_new_file_over_an_existing_file_fails():
+    diff = "--- /dev/null\n+++ b/y.py\n@@ -0,0 +1,1 @@\n+new = 1\n"
+    new_text, results = _apply("keep me\nimportant\n", diff)
+    assert new_text == "keep me\nimportant\n"
+    assert [r.message for r in results] == ["file already exists"]
+
+
+def test_new_file_identical_to_the_existing_file_is_a_no_op():
+    diff = "--- /dev/null\n+++ b/y.py\n@@ -0,0 +1,1 @@\n+new = 1\n"
+    new_text, results = _apply("new = 1\n", diff)
+    assert new_text == "new = 1\n"
+    assert all(r.applied for r in results)
+
+
+def test_new_file():
+    diff = "--- /dev/null\n+++ b/y.py\n@@ -0,0 +1,2 @@\n+a = 1\n+b = 2\n"
+    assert _apply(None, diff)[0] == "a = 1\nb = 2\n"
+
+
+def test_hunk_with_stale_line_numbers_is_relocated():
+    original = "".join(f"line {i}\n" for i in range(1, 41))
+    diff = "--- a/f.txt\n+++ b/f.txt\n@@ -5,3 +5,3 @@\n line 29\n-line 30\n+LINE 30\n line 31\n"
+    new_text, (result,) = _apply(original, diff)
+    assert result.applied and result.line == 29 and result.offset == 24
+    assert new_text == original.replace("line 30\n", "LINE 30\n")
+
+
+def test_no_newline_at_end_of_file_marker():
+    diff = ("--- a/f.txt\n+++ b/f.txt\n@@ -1,2 +1,2 @@\n a\n-b\n\\ No newline at end of file\n"
+            "+c\n")
+    assert _apply("a\nb", diff)[0] == "a\nc\n"
+
+    diff = "--- a/f.txt\n+++ b/f.txt\n@@ -1,2 +1,2 @@\n a\n-b\n+c\n\\ No newline at end of file\n"
+    assert _apply("a\nb\n", diff)[0] == "a\nc"
@@ -0,0 +1,21 @@
+import nocode_metrics
+import nocode_validate
+from nocode_validate import validate_files
+
+
+def test_checks_in_worker_processes_are_profiled(monkeypatch):
+    monkeypatch.setattr(nocode_metrics, "_enabled", False)
+    monkeypatch.setattr(nocode_validate, "PARALLEL_BYTES", 0)
+    nocode_metrics.reset()
+    nocode_metrics.enable()
+    items = [(f"m{i}.py", "x = 1\n" * 2000, None, None) for i in range(4)] + [("bad.js", "f({)", None, None)]
+
+    errors = validate_files(items, workers=2)
+
+    assert list(errors) == ["bad.js"]
+    data = nocode_metrics.snapshot()
+    assert data["spans"]["validate"]["calls"] == len(items)
+    assert data["spans"]["validate"]["total_s"] > 0
+    assert data["counters"]["validate.files"] == len(items)
+    assert data["counters"]["validate.failed"] == 1
+    nocode_metrics.reset()
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+from nocode_context import gather_code_files
+from nocode_ignore import IgnoreTree
+from nocode_watch import InotifyWatcher, PollingWatcher, _watched_directories, classify_events
+
+EXTENSIONS = (".js", ".json")
+
+
+def _project(tmp_path):
+    (tmp_path / ".gitignore").write_text("build/\n*.log\n")
+    for directory in ("src", "build/assets", "node_modules/left-pad"):
+        (tmp_path / directory).mkdir(parents=True)
+    (tmp_path / "src" / "app.js").write_text("export const a = 1;\n")
+    (tmp_path / "build" / "assets" / "app.js").write_text("const a=1;\n")
+    (tmp_path / "node_modules" / "left-pad" / "index.js").write_text("module.exports = 1;\n")
+    root = str(tmp_path)
+    files = gather_code_files(root, EXTENSIONS, {"node_modules"}, workers=1)
+    planned = {os.path.abspath(f): os.path.relpath(f, root).replace(os.sep, "/") for f in files}
+    return root, files, planned
+
+
+def test_ignore_tree_matches_the_scanner(tmp_path):
+    root, files, _ = _project(tmp_path)
+    ignore = IgnoreTree(root)
+    assert files == [os.path.join(root, "src", "app.js")]
+    assert ignore.ignored(os.path.join(root, "build"), True)
+    assert ignore.ignored(os.path.join(root, "build", "assets", "new.js"), False)
+    assert ignore.ignored(os.path.join(root, "src", "debug.log"), False)
+    assert not ignore.ignored(os.path.join(root, "src", "new.js"), False)
+    assert sorted(_watched_directories(root, {"node_modules"}, ignore)) == [root, os.path.join(root, "src")]
+
+
+def test_events_under_ignored_directories_do_not_rebuild(tmp_path):
+    root, files, planned = _project(tmp_path)
+    ignore = IgnoreTree(root)
+    events = [
+        ("created", os.path.join(root, "build", "assets", "chunk.js")),
+        ("modified", os.path.join(root, "build", "assets", "app.js")),
+        ("tree", os.path.join(root, "build", "cache")),
+        ("created", os.path.join(root, "src", "debug.log")),
+    ]
+    patch, rescan = classify_events(events, set(planned), planned, EXTENSIONS, {"node_modules"}, ignore)
+    assert patch == set() and not rescan
+
+    patch, rescan = classify_events([("created", os.path.join(root, "src", "new.js"))],
+                                    set(planned), planned, EXTENSIONS, {"node_modules"}, ignore)
+    assert rescan
+
+
+def test_polling_watcher_does_not_see_ignored_directories(tmp_path):
+    root, files, planned = _project(tmp_path)
+    watcher = PollingWatcher(root, {"node_modules"}, interval=0, ignore=IgnoreTree(root))
+    watcher.track(files)
+    (tmp_path / "build" / "assets" / "app.js").write_text("const a=2;\n")
+    (tmp_path / "build" / "assets" / "more.js").write_text("const b=2;\n")
+    assert watcher.read(0) == []
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+def test_inotify_watcher_does_not_watch_ignored_directories(tmp_path):
+    root, files, planned = _project(tmp_path)
+    ignore = IgnoreTree(root)
+    try:
+        watcher = InotifyWatcher(root, {"node_modules"}, ignore)
+    except OSError as e:
+        pytest.skip(f"inotify unavailable: {e}")
+    try:
+        assert sorted(watcher.directories.values()) == [root, os.path.join(root, "src")]
+        (tmp_path / "build" / "assets" / "app.js").write_text("const a=2;\n")
+        (tmp_path / "build" / "new").mkdir()
+        events = watcher.read(0.2)
+        patch, rescan = classify_events(events, set(planned), planned, EXTENSIONS, {"node_modules"}, ignore)
+        assert patch == set() and not rescan
+    finally:
+        watcher.close()